@@ -1,12 +1,27 @@
 import streamlit as st
 import pandas as pd
 import numpy as np
-import torch
-import sqlite3
-import matplotlib.pyplot as plt
-from lifelines import KaplanMeierFitter
-from transformers import AutoTokenizer, AutoModel
-from datetime import datetime
+import os
+import time
+import traceback
+from functools import partial
+# torch, transformers, sklearn e altair só são importados quando alguém
+# precisa deles (ver carregar_modelo, carregar_classificador e a aba 2)
+from modelo_local import NOME_MODELO, TEMPOS_INICIALIZACAO, medir, resumo_inicializacao
+from registro_modelos import (ClassificadorRegistrado, ModeloIncompativel, ModeloIndisponivel, campos_diferentes,
+                              configuracao_features)
+from metricas import (DIRETORIO_PERFIS, LIMITES_SEGUNDOS, METRICAS, PERFIL, iniciar_exportadores,
+                      instrumentar, observar, perfilar)
+from regras_ctcae import MotorRegras
+from triagem_cascata import LIMIAR_PADRAO, carregar_estagio1
+from indice_vetorial import DIRETORIO_INDICES, abrir_indice
+from esquema_banco import preparar_banco
+from cliente_inferencia import URL_INFERENCIA, ClienteInferencia, ServidorIndisponivel
+from consultas_dashboard import (TAMANHO_PAGINA, contar_intervencoes, curvas_sobrevida, fonte_painel,
+                                 kpis_toxicidade, obter_conexao, pagina_intervencoes, salvar_intervencao,
+                                 versao_sobrevida)
+from sobrevida import MARCOS_MESES
+from exportacao import CONJUNTOS, FORMATOS, MIMES, exportar_bytes
 
 # --- CONFIGURAÇÃO DA PÁGINA ---
 st.set_page_config(page_title="OncoPharm AI", layout="wide", page_icon="🧬")
@@ -25,63 +40,183 @@ st.markdown("""
 """, unsafe_allow_html=True)
 
 # --- FUNÇÕES DE BANCO DE DADOS ---
+@st.cache_resource
 def init_db():
-    conn = sqlite3.connect('oncologia_farmacovigilancia.db')
-    c = conn.cursor()
-    # Tabela de Dados Históricos (Treino/Sintéticos)
-    c.execute('''CREATE TABLE IF NOT EXISTS dados_treino 
-                 (id INTEGER PRIMARY KEY, texto_clinico TEXT, grau_real INTEGER)''')
-    # Tabela de Intervenções (Vida Real)
-    c.execute('''CREATE TABLE IF NOT EXISTS intervencoes 
-                 (id INTEGER PRIMARY KEY, data_hora TEXT, texto_analisado TEXT, 
-                  grau_predito INTEGER, tipo_intervencao TEXT, notificado_anvisa BOOLEAN)''')
-    conn.commit()
-    conn.close()
-
-def salvar_intervencao(texto, grau, tipo_intervencao, notificado):
-    conn = sqlite3.connect('oncologia_farmacovigilancia.db')
-    c = conn.cursor()
-    data_hora = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-    c.execute("INSERT INTO intervencoes (data_hora, texto_analisado, grau_predito, tipo_intervencao, notificado_anvisa) VALUES (?, ?, ?, ?, ?)",
-              (data_hora, texto, int(grau), tipo_intervencao, notificado))
-    conn.commit()
-    conn.close()
+    # Uma vez por processo, não a cada rerun. Tabelas, índices e WAL: esquema_banco.py
+    preparar_banco()
 
 # --- CARREGAMENTO DO MODELO BIOBERT (CACHED) ---
 @st.cache_resource
-def carregar_modelo():
-    nome_modelo = "pucpr/biobertpt-clin"
-    tokenizer = AutoTokenizer.from_pretrained(nome_modelo)
-    model = AutoModel.from_pretrained(nome_modelo)
-    return tokenizer, model
-
-# --- CLASSIFICADOR SIMULADO (RANDOM FOREST) ---
-# Na prática, carregaríamos o .joblib aqui. Para o MVP, usamos a lógica de palavras-chave calibrada.
+@instrumentar("carregar_modelo")
+def carregar_modelo(max_length):
+    """Um motor por max_length: o do manifesto do classificador ativo"""
+    with medir("import torch/transformers"):
+        from motor_embeddings import MotorEmbeddings, carregar_biobert
+    # Backend (fp32/int8/torchscript) definido pela variável BIOBERT_BACKEND;
+    # usa o snapshot local de baixar_modelo.py quando existir
+    tokenizer, model = carregar_biobert(NOME_MODELO)
+    # Notas longas: BIOBERT_JANELA liga o modo janelas (o mesmo usado no treino)
+    return MotorEmbeddings(tokenizer, model, max_length=max_length)
+
+# --- CLASSIFICADOR TREINADO (REGISTRO DE MODELOS) ---
+ESPERA_CLASSIFICADOR = 30  # Segundos entre novas tentativas depois de uma falha ao carregar
+
+@st.cache_resource
+def classificador_ativo():
+    # Exceção não entra no cache do Streamlit: só o classificador carregado fica
+    with medir("carga do classificador"):
+        return ClassificadorRegistrado()
+
+@st.cache_resource
+def falha_classificador():
+    return {"instante": float("-inf")}
+
+def carregar_classificador():
+    """Versão ativa do registro (troca sozinho quando outra é ativada); None se não houver ou não servir.
+
+    A falha não fica guardada: passados ESPERA_CLASSIFICADOR segundos tenta de
+    novo, então um modelo publicado ou ativado depois da abertura é achado.
+    """
+    falha = falha_classificador()
+    if time.monotonic() - falha["instante"] < ESPERA_CLASSIFICADOR:
+        return None
+    try:
+        return classificador_ativo()
+    except (ModeloIndisponivel, ModeloIncompativel) as e:
+        print(f"   [AVISO] {e}")
+    except Exception:
+        print("   [ERRO] Falha ao carregar o classificador:")
+        traceback.print_exc()
+    falha["instante"] = time.monotonic()
+    return None
+
+@st.cache_resource
+def carregar_triagem():
+    return carregar_estagio1()
+
+def prever_grau(texto, cascata=False, limiar=LIMIAR_PADRAO):
+    """Grau CTCAE, confiança, origem da previsão, tempo (ms) de cada etapa e o vetor CLS (se calculado)"""
+    tempos = {}
+    # Carregado no primeiro uso, não na abertura da página
+    clf = carregar_classificador() if cliente is None else None
+    if cascata and (clf is not None or cliente is not None):
+        # Estágio 1 barato: se já tem confiança suficiente, o BioBERT nem roda
+        t0 = time.perf_counter()
+        estagio1 = carregar_triagem()
+        graus, confiancas = estagio1.prever([texto])
+        tempos["triagem"] = (time.perf_counter() - t0) * 1000
+        if confiancas[0] >= limiar:
+            return int(graus[0]), float(confiancas[0]), f"Triagem ({estagio1.nome})", tempos, None
+
+    if cliente is not None:
+        # Modelo no servidor_inferencia.py: notas de várias sessões dividem o mesmo forward pass
+        t0 = time.perf_counter()
+        try:
+            grau, confianca, vetor = cliente.classificar_um(texto, vetores=True)
+            tempos["servidor de inferência"] = (time.perf_counter() - t0) * 1000
+            return grau, confianca, "BioBERT + Random Forest (servidor)", tempos, vetor
+        except ServidorIndisponivel:
+            tempos["servidor (falhou)"] = (time.perf_counter() - t0) * 1000
+            origem_fallback = "Regras (servidor de inferência indisponível)"
+    else:
+        origem_fallback = "Regras (modelo indisponível)"
+
+    if clf is None:
+        t0 = time.perf_counter()
+        grau = classificar_texto(texto)
+        tempos["regras"] = (time.perf_counter() - t0) * 1000
+        return grau, None, origem_fallback, tempos, None
+
+    # O max_length vem do manifesto: é com ele que as features de treino foram geradas
+    motor = carregar_modelo(clf.max_length)
+    etapas = {}
+    vetor = motor.gerar([texto], tempos=etapas)
+    tempos["tokenização"] = etapas["tokenizacao"]
+    tempos["BioBERT (forward)"] = etapas["forward"]
+
+    t0 = time.perf_counter()
+    probas = clf.predict_proba(vetor)[0]
+    melhor = int(np.argmax(probas))
+    tempos["Random Forest"] = (time.perf_counter() - t0) * 1000
+    return int(clf.classes_[melhor]), float(probas[melhor]), "BioBERT + Random Forest", tempos, vetor[0]
+
+# --- CASOS SEMELHANTES (ÍNDICE VETORIAL) ---
+@st.cache_resource
+def carregar_indice():
+    """Índice de prontuarios gerado por `python indice_vetorial.py --atualizar`; None se não existir"""
+    if not os.path.exists(os.path.join(DIRETORIO_INDICES, "prontuarios", "meta.json")):
+        return None
+    return abrir_indice("prontuarios")
+
+def configuracao_vetor():
+    """Como o vetor da análise foi gerado: pelo servidor de inferência ou por este processo"""
+    if cliente is not None:
+        try:
+            return cliente.saude().get("features")
+        except ServidorIndisponivel:
+            return None
+    clf = carregar_classificador()
+    return configuracao_features(clf.max_length) if clf is not None else None
+
+def buscar_semelhantes(vetor, k=5):
+    """Notas mais parecidas; None quando o índice não é do mesmo espaço de embeddings que o vetor"""
+    indice = carregar_indice()
+    if indice is None or vetor is None:
+        return pd.DataFrame()
+    indice.recarregar_se_mudou()  # o pipeline pode ter indexado notas novas
+    features = configuracao_vetor()
+    if features is None or campos_diferentes(indice.features, features):
+        # Outro max_length/pooling/janelas: o cosseno entre os vetores não quer dizer nada
+        return None
+    ids, sims = indice.buscar(vetor, k, modo="aproximado" if len(indice) > 100_000 else "exato")
+    ids, sims = ids[0], sims[0]
+    validos = ids >= 0
+    if not validos.any():
+        return pd.DataFrame()
+    marcadores = ",".join("?" * int(validos.sum()))
+    df = pd.read_sql(f"SELECT id, paciente_hash, data_importacao, texto_clinico FROM prontuarios "
+                     f"WHERE id IN ({marcadores})", obter_conexao(), params=[int(i) for i in ids[validos]])
+    df["similaridade"] = df["id"].map(dict(zip(ids[validos].tolist(), sims[validos].tolist())))
+    return df.sort_values("similaridade", ascending=False)
+
+# --- CLASSIFICADOR POR PALAVRAS-CHAVE (FALLBACK) ---
+# Usado quando o .pkl não está disponível. Léxico sem acentos, com negação ("nega náuseas").
+@st.cache_resource
+def carregar_regras():
+    return MotorRegras()
+
+@instrumentar("classificar_texto")
 def classificar_texto(texto):
-    texto = texto.lower()
-    # Gatilhos de Grau 3/4 (Grave)
-    termos_graves = ["internação", "uti", "sepse", "neutropenia febril", "suspensão", "anafilaxia", "grau 3", "grau 4", "insuficiência renal", "creatinina > 2", "oliguria"]
-    # Gatilhos de Grau 1/2 (Leve)
-    termos_leves = ["náusea", "vômito", "grau 1", "grau 2", "lefe", "rash", "parestesia", "diarreia"]
-    
-    for termo in termos_graves:
-        if termo in texto:
-            return 3 # Grave
-    for termo in termos_leves:
-        if termo in texto:
-            return 1 # Leve/Moderado
-    return 0 # Sem toxicidade aparente
+    return carregar_regras().classificar(texto)
 
 # --- INICIALIZAÇÃO ---
 init_db()
-tokenizer, model = carregar_modelo()
+iniciar_exportadores()  # METRICAS_PORTA / METRICAS_JSON; uma vez por processo
+# Com INFERENCIA_URL definida o modelo fica só no servidor; a sessão não carrega nada
+cliente = ClienteInferencia(URL_INFERENCIA) if URL_INFERENCIA else None
+# Random Forest e BioBERT só são carregados na primeira análise (prever_grau):
+# sem o Random Forest o BioBERT não tem uso e nem chega a carregar
 
 # --- INTERFACE PRINCIPAL ---
+with st.sidebar:
+    st.markdown("### ⚙️ Classificação")
+    modo_cascata = st.toggle("Triagem em cascata", help="Regras/TF-IDF primeiro; BioBERT só para notas incertas")
+    limiar_cascata = st.slider("Confiança mínima da triagem", 0.5, 1.0, LIMIAR_PADRAO, 0.01,
+                               disabled=not modo_cascata)
+    if TEMPOS_INICIALIZACAO:
+        with st.expander("⏱️ Inicialização"):
+            st.caption(resumo_inicializacao())
+
 st.title("🧬 OncoPharm AI: Farmacovigilância Ativa")
 st.markdown("**Sistema de Apoio à Decisão Clínica em Oncologia**")
 
 # Abas de Navegação
-tab1, tab2, tab3 = st.tabs(["📝 Análise de Evolução", "📊 Dashboards & BI", "💾 Dados & Exportação"])
+# on_change="rerun": só a aba aberta executa, então a primeira página não paga o gráfico da aba 2
+# A aba de performance fica oculta: aparece com ?perf=1 na URL ou METRICAS_ABA=1
+mostrar_performance = st.query_params.get("perf") == "1" or os.environ.get("METRICAS_ABA") == "1"
+tab1, tab2, tab3, *tab_performance = st.tabs(
+    ["📝 Análise de Evolução", "📊 Dashboards & BI", "💾 Dados & Exportação"]
+    + (["⚡ Performance"] if mostrar_performance else []), key="aba", on_change="rerun")
 
 # --- ABA 1: ANÁLISE CLÍNICA E INTERVENÇÃO ---
 with tab1:
@@ -98,30 +233,49 @@ with tab1:
         st.subheader("Resultado da IA")
         
         if analisar_btn and texto_evolucao:
-            with st.spinner("Analisando semântica clínica..."):
-                # Simulação do processamento do BioBERT (embeddings)
-                inputs = tokenizer(texto_evolucao, return_tensors="pt", truncation=True, max_length=512)
-                outputs = model(**inputs)
-                # Classificação
-                grau_predito = classificar_texto(texto_evolucao)
-                
-                # Exibição do Semáforo
-                if grau_predito >= 3:
-                    st.markdown(f"""<div class='alert-box danger'>
-                        <h3>🚨 ALERTA VERMELHO: Toxicidade Grave (Grau 3/4)</h3>
-                        <p>Detectados termos críticos. Risco de interrupção de tratamento.</p>
-                        </div>""", unsafe_allow_html=True)
-                elif grau_predito >= 1:
-                    st.markdown(f"""<div class='alert-box warning'>
-                        <h3>⚠️ ALERTA AMARELO: Toxicidade Moderada</h3>
-                        <p>Monitorar sintomas e avaliar medidas de suporte.</p>
-                        </div>""", unsafe_allow_html=True)
-                else:
-                    st.markdown(f"""<div class='alert-box safe'>
-                        <h3>✅ VERDE: Sem Toxicidade Aparente</h3>
-                        <p>Seguir protocolo padrão.</p>
-                        </div>""", unsafe_allow_html=True)
-            
+            with st.spinner("Analisando semântica clínica..."), perfilar("prever_grau"):
+                # Guarda o resultado: o clique em "Registrar" gera um novo rerun sem analisar_btn
+                st.session_state["resultado"] = (texto_evolucao,
+                                                *prever_grau(texto_evolucao, modo_cascata, limiar_cascata))
+            for etapa, ms in st.session_state["resultado"][4].items():
+                observar("analise_segundos", ms / 1000, LIMITES_SEGUNDOS, etapa=etapa)
+
+        resultado = st.session_state.get("resultado")
+        if resultado and resultado[0] == texto_evolucao:
+            _, grau_predito, confianca, origem, tempos, vetor = resultado
+            # Exibição do Semáforo
+            if grau_predito >= 3:
+                st.markdown(f"""<div class='alert-box danger'>
+                    <h3>🚨 ALERTA VERMELHO: Toxicidade Grave (Grau 3/4)</h3>
+                    <p>Detectados termos críticos. Risco de interrupção de tratamento.</p>
+                    </div>""", unsafe_allow_html=True)
+            elif grau_predito >= 1:
+                st.markdown(f"""<div class='alert-box warning'>
+                    <h3>⚠️ ALERTA AMARELO: Toxicidade Moderada</h3>
+                    <p>Monitorar sintomas e avaliar medidas de suporte.</p>
+                    </div>""", unsafe_allow_html=True)
+            else:
+                st.markdown(f"""<div class='alert-box safe'>
+                    <h3>✅ VERDE: Sem Toxicidade Aparente</h3>
+                    <p>Seguir protocolo padrão.</p>
+                    </div>""", unsafe_allow_html=True)
+
+            confianca_txt = f" · confiança {confianca * 100:.0f}%" if confianca is not None else ""
+            st.caption(f"Grau previsto: {grau_predito} · {origem}{confianca_txt}")
+            # Onde vai a latência do caminho interativo
+            st.caption(" · ".join(f"{etapa}: {ms:.0f} ms" for etapa, ms in tempos.items())
+                       + f" · total: {sum(tempos.values()):.0f} ms")
+
+            semelhantes = buscar_semelhantes(vetor)
+            if semelhantes is None:
+                st.caption("🔎 Casos semelhantes indisponíveis: o índice foi gerado com outra configuração de "
+                           "embeddings. Rode `python indice_vetorial.py --atualizar` para reconstruí-lo.")
+            elif not semelhantes.empty:
+                with st.expander(f"🔎 Evoluções anteriores mais parecidas ({len(semelhantes)})"):
+                    st.dataframe(semelhantes, hide_index=True,
+                                 column_config={"similaridade": st.column_config.ProgressColumn(
+                                     "similaridade", min_value=0.0, max_value=1.0, format="%.2f")})
+        
             st.divider()
             
             # --- ÁREA DE ATUAÇÃO FARMACÊUTICA (VOLTOU!) ---
@@ -142,64 +296,140 @@ with tab1:
                 st.success("Intervenção registrada com sucesso! Dados computados nos KPIs.")
 
 # --- ABA 2: DASHBOARDS E SOBREVIDA (SQL REAL) ---
+def grafico_sobrevida(curvas):
+    """Curvas em degrau com a faixa do IC 95%, uma cor por estrato"""
+    with medir("import altair"):
+        import altair as alt
+
+    base = alt.Chart(curvas).encode(
+        x=alt.X("tempo:Q", title="Meses desde o primeiro prontuário"),
+        color=alt.Color("estrato:N", title=None, legend=alt.Legend(orient="bottom")))
+    faixa = base.mark_area(opacity=0.15, interpolate="step-after").encode(
+        y=alt.Y("ic_inferior:Q", title="Probabilidade livre de G3/G4", scale=alt.Scale(domain=[0, 1.05])),
+        y2="ic_superior:Q")
+    linha = base.mark_line(interpolate="step-after", strokeWidth=2).encode(
+        y="sobrevida:Q",
+        tooltip=["estrato:N", alt.Tooltip("tempo:Q", format=".1f"), alt.Tooltip("sobrevida:Q", format=".1%"),
+                 "em_risco:Q", "eventos:Q"])
+    return (faixa + linha).properties(title="Sobrevida Livre de Toxicidade Grave (G3/G4)", height=360)
+
 with tab2:
-    st.markdown("### 🧬 Sobrevida Livre de Toxicidade (Dados Reais do SQL)")
-    
-    conn = sqlite3.connect('oncologia_farmacovigilancia.db')
-    
-    # Tenta pegar dados de intervenções reais primeiro, se não tiver, usa o sintético
-    df_intervencoes = pd.read_sql("SELECT * FROM intervencoes", conn)
-    df_treino = pd.read_sql("SELECT * FROM dados_treino", conn)
-    conn.close()
-    
-    # Lógica para usar os dados disponíveis para o gráfico
-    df_grafico = df_treino if df_intervencoes.empty else df_intervencoes
-    coluna_grau = 'grau_real' if df_intervencoes.empty else 'grau_predito'
-
-    if not df_grafico.empty:
-        # Engenharia de Dados para Kaplan-Meier
-        df_grafico['evento'] = df_grafico[coluna_grau].apply(lambda x: 1 if x >= 3 else 0)
-        np.random.seed(42)
-        df_grafico['tempo_meses'] = np.random.randint(1, 36, size=len(df_grafico))
-        
-        kmf = KaplanMeierFitter()
-        kmf.fit(df_grafico['tempo_meses'], event_observed=df_grafico['evento'], label='Pacientes Monitorados')
-        
-        fig, ax = plt.subplots(figsize=(8, 4))
-        kmf.plot_survival_function(ax=ax, ci_show=True, color="#d9534f", linewidth=2)
-        ax.set_title("Sobrevida Livre de Toxicidade Grave (G3/G4)")
-        ax.set_ylabel("Probabilidade (%)")
-        ax.set_xlabel("Meses de Tratamento")
-        ax.grid(True, linestyle='--', alpha=0.5)
-        ax.set_ylim(0, 1.05)
-        st.pyplot(fig)
-        
-        # KPIs
-        kpi1, kpi2, kpi3 = st.columns(3)
-        kpi1.metric("Pacientes Monitorados", len(df_grafico))
-        kpi2.metric("Eventos Graves (G3/G4)", df_grafico['evento'].sum())
-        kpi3.metric("Taxa de Toxicidade Global", f"{(df_grafico['evento'].mean()*100):.1f}%")
-    else:
-        st.info("Ainda não há dados suficientes para gerar os gráficos. Realize intervenções ou gere dados sintéticos.")
+    if tab2.open:
+        st.markdown("### 🧬 Sobrevida Livre de Toxicidade (Dados Reais do SQL)")
+
+        # Tempo real até o primeiro alerta G3/G4 de cada paciente (prontuarios + alertas_ram).
+        # As curvas só são recalculadas quando entram prontuários ou alertas novos.
+        por_medicamento = st.toggle("Estratificar por medicamento", key="km_por_medicamento",
+                                    help="Primeiro medicamento citado nas notas do paciente")
+        curvas, resumo = curvas_sobrevida(versao_sobrevida(), por_medicamento)
+        if curvas.empty:
+            st.info("Sem prontuários com paciente e data. Importe notas e rode o biobert_pipeline.py "
+                    "para gerar os alertas.")
+        else:
+            st.altair_chart(grafico_sobrevida(curvas), width="stretch")
+            # Mediana infinita = a curva não chegou a 50% no seguimento: célula vazia
+            st.dataframe(resumo.replace(float("inf"), np.nan), hide_index=True, column_config={
+                "mediana_meses": st.column_config.NumberColumn("mediana (meses)", format="%.1f"),
+                **{f"livre_{m}m": st.column_config.ProgressColumn(f"livre de G3/G4 em {m} meses",
+                                                                   min_value=0.0, max_value=1.0, format="%.2f")
+                   for m in MARCOS_MESES}})
+
+        # Tenta pegar dados de intervenções reais primeiro, se não tiver, usa o sintético
+        tabela_grafico = fonte_painel()
+
+        if tabela_grafico is not None:
+            # KPIs (agregados no SQL)
+            kpis = kpis_toxicidade(tabela_grafico)
+            kpi1, kpi2, kpi3 = st.columns(3)
+            kpi1.metric("Pacientes Monitorados", kpis["total"])
+            kpi2.metric("Eventos Graves (G3/G4)", kpis["graves"])
+            kpi3.metric("Taxa de Toxicidade Global", f"{(kpis['taxa']*100):.1f}%")
+        else:
+            st.info("Ainda não há dados suficientes para os indicadores. Realize intervenções ou gere dados sintéticos.")
 
 # --- ABA 3: DADOS E EXPORTAÇÃO ---
+NOMES_CONJUNTOS = {"intervencoes": "Intervenções",
+                   "alertas": "Alertas RAM (um par medicamento × reação por linha)"}
+
 with tab3:
     st.markdown("### 📂 Banco de Dados de Farmacovigilância")
     
-    conn = sqlite3.connect('oncologia_farmacovigilancia.db')
-    df_export = pd.read_sql("SELECT * FROM intervencoes", conn)
-    conn.close()
+    total_intervencoes = contar_intervencoes()
     
-    if not df_export.empty:
-        st.dataframe(df_export)
-        
-        # Botão de Download CSV
-        csv = df_export.to_csv(index=False).encode('utf-8')
-        st.download_button(
-            label="📥 Baixar Relatório Completo (CSV)",
-            data=csv,
-            file_name='relatorio_farmacovigilancia.csv',
-            mime='text/csv',
-        )
+    if total_intervencoes:
+        total_paginas = -(-total_intervencoes // TAMANHO_PAGINA)
+        pagina = st.number_input(f"Página (de {total_paginas})", min_value=1, max_value=total_paginas, value=1)
+        st.dataframe(pagina_intervencoes(int(pagina)), hide_index=True)
+        st.caption(f"{total_intervencoes} intervenções registradas · {TAMANHO_PAGINA} por página, mais recentes primeiro")
     else:
-        st.warning("Nenhuma intervenção registrada ainda. Use a aba 'Análise de Evolução' para popular o banco.")
\ No newline at end of file
+        st.warning("Nenhuma intervenção registrada ainda. Use a aba 'Análise de Evolução' para popular o banco.")
+
+    # Exportação em fluxo (exportacao.py): filtros no SQL e lotes direto para o arquivo, sem DataFrame
+    st.markdown("#### 📥 Exportação")
+    col_conjunto, col_formato, col_grau, col_de, col_ate = st.columns(5)
+    conjunto = col_conjunto.selectbox("Dados", list(CONJUNTOS), format_func=NOMES_CONJUNTOS.get, key="exportar_conjunto")
+    formato = col_formato.selectbox("Formato", list(FORMATOS), index=list(FORMATOS).index("csv"), key="exportar_formato")
+    grau_min = col_grau.number_input("Grau mínimo", min_value=0, max_value=5, value=0, key="exportar_grau_min")
+    de = col_de.date_input("De", value=None, format="DD/MM/YYYY", key="exportar_de")
+    ate = col_ate.date_input("Até", value=None, format="DD/MM/YYYY", key="exportar_ate")
+
+    # Só roda quando o usuário clica em baixar, não a cada rerun
+    st.download_button(
+        label=f"📥 Baixar {NOMES_CONJUNTOS[conjunto]} ({formato.upper()})",
+        data=partial(exportar_bytes, conjunto, formato, de=de, ate=ate, grau_min=int(grau_min) or None),
+        file_name=f"relatorio_farmacovigilancia_{conjunto}{FORMATOS[formato]}",
+        mime=MIMES[formato],
+        on_click="ignore",
+    )
+    st.caption(f"Históricos grandes e cargas incrementais para o BI: `python exportacao.py {conjunto} "
+               f"--formato parquet --incremental`")
+
+# --- ABA OCULTA: PERFORMANCE ---
+def rotulos_texto(rotulos):
+    return ", ".join(f"{k}={v}" for k, v in rotulos.items())
+
+@st.fragment(run_every=5)
+def painel_performance():
+    """Números ao vivo do registro de metricas.py (este processo, todas as sessões)"""
+    dados = METRICAS.instantaneo()
+    series = {(s["nome"], rotulos_texto(s["rotulos"])): s for s in dados["series"]}
+    contadores = {(c["nome"], rotulos_texto(c["rotulos"])): c["valor"] for c in dados["contadores"]}
+
+    forward = series.get(("forward_segundos", ""))
+    lote = series.get(("lote_embeddings", ""))
+    acertos = contadores.get(("cache_embeddings", "resultado=acerto"), 0)
+    faltas = contadores.get(("cache_embeddings", "resultado=falta"), 0)
+    escritas = [s for s in dados["series"] if s["nome"] == "db_escrita_segundos"]
+
+    st.markdown("### ⚡ Performance")
+    col1, col2, col3, col4 = st.columns(4)
+    col1.metric("Notas/s no forward", f"{contadores.get(('notas_embedadas', ''), 0) / forward['soma']:.1f}"
+                if forward and forward["soma"] else "-")
+    col2.metric("Notas por lote (média)", f"{lote['media']:.1f}" if lote else "-")
+    col3.metric("Acerto do cache de embeddings", f"{acertos / (acertos + faltas) * 100:.0f}%"
+                if acertos + faltas else "-")
+    col4.metric("Escrita no SQLite (p95)", f"{max(s['p95'] for s in escritas) * 1000:.1f} ms" if escritas else "-")
+
+    tempos = pd.DataFrame([{"etapa": s["nome"].removesuffix("_segundos"), "rótulos": rotulos_texto(s["rotulos"]),
+                            "chamadas": s["contagem"], "total (s)": s["soma"], "média (ms)": s["media"] * 1000,
+                            "p50 (ms)": s["p50"] * 1000, "p95 (ms)": s["p95"] * 1000, "máx (ms)": s["maximo"] * 1000}
+                           for s in dados["series"] if s["nome"].endswith("_segundos")])
+    if tempos.empty:
+        st.info("Nada medido ainda neste processo. Analise uma evolução ou registre uma intervenção.")
+    else:
+        st.dataframe(tempos.sort_values("total (s)", ascending=False), hide_index=True)
+
+    outros = [{"medida": nome, "rótulos": rotulos, "valor": valor} for (nome, rotulos), valor in contadores.items()]
+    outros += [{"medida": s["nome"], "rótulos": rotulos_texto(s["rotulos"]), "valor": s["media"]}
+               for s in dados["series"] if not s["nome"].endswith("_segundos")]
+    if outros:
+        st.dataframe(pd.DataFrame(outros), hide_index=True)
+    with st.expander("Formato Prometheus"):
+        st.code(METRICAS.texto_prometheus(), language="text")
+    st.caption(f"Processo {dados['pid']} · no ar há {dados['uptime_s'] / 60:.0f} min · atualiza a cada 5 s · "
+               f"perfil: {PERFIL or 'desligado'} (METRICAS_PERFIL; arquivos em {DIRETORIO_PERFIS}/)")
+
+if tab_performance:
+    with tab_performance[0]:
+        if tab_performance[0].open:
+            painel_performance()
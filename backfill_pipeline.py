@@ -0,0 +1,139 @@
+import argparse
+import os
+import time
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import multiprocessing as mp
+
+import biobert_pipeline as pipeline
+from esquema_banco import conectar, preparar_banco
+
+# --- CONFIGURAÇÃO ---
+TAMANHO_SHARD = 5000   # Faixa de ids por tarefa (unidade de retomada após falha)
+
+# Tabela backfill_shards: migração 11 de esquema_banco.py.
+
+# --- PROCESSO TRABALHADOR ---
+# Cada worker carrega seu próprio tokenizer/modelo uma vez (initializer) e só lê
+# do banco. Toda gravação fica no processo principal, que é o único escritor.
+
+def iniciar_worker(threads):
+    import torch
+    torch.set_num_threads(threads)
+    # Sem cache de embeddings aqui: gravar na tabela embeddings a partir de N
+    # processos traria de volta a disputa de lock que o escritor único evita.
+    pipeline.clf = pipeline.ClassificadorRegistrado()
+    tokenizer, model = pipeline.carregar_biobert(pipeline.NOME_MODELO)
+    pipeline.motor = pipeline.MotorEmbeddings(tokenizer, model, max_length=pipeline.clf.max_length)
+
+def processar_shard(shard_id, inicio, fim, tamanho_bloco):
+    t0 = time.perf_counter()
+    conn = conectar(pipeline.ARQUIVO_DB)
+    linhas, notas = [], 0
+    for bloco in pipeline.obter_prontuarios(conn, inicio, fim, tamanho_bloco):
+        linhas.extend(pipeline.classificar_bloco(bloco, pipeline.motor, pipeline.clf))
+        notas += len(bloco)
+    conn.close()
+    return shard_id, linhas, notas, time.perf_counter() - t0, os.getpid()
+
+# --- PLANEJAMENTO DOS SHARDS ---
+
+def planejar_shards(conn, inicio, fim, tamanho_shard):
+    """Cria os shards de (inicio, fim]; com um backfill em andamento, retoma-o.
+
+    Devolve a faixa (inicio, fim) que será processada, ou None quando a faixa
+    pedida difere da do backfill interrompido: ele precisa terminar primeiro.
+    """
+    # Shards na tabela = backfill que não chegou ao fim (pendentes, ou todos concluídos sem a marca d'água)
+    shards, pendentes = conn.execute("SELECT COUNT(*), COUNT(*) FILTER (WHERE status = 'pendente') "
+                                     "FROM backfill_shards").fetchone()
+    if shards:
+        de, ate = conn.execute("SELECT MIN(inicio), MAX(fim) FROM backfill_shards").fetchone()
+        if (inicio is not None and inicio != de) or (fim is not None and fim != ate):
+            print(f"   [ERRO] Há um backfill interrompido de #{de} a #{ate} ({pendentes} shards pendentes). "
+                  f"Rode sem --de/--ate para concluí-lo antes de pedir outra faixa.")
+            return None
+        print(f">>> Retomando backfill interrompido de #{de} a #{ate} ({pendentes} shards pendentes).")
+        return de, ate
+    if inicio is None:
+        inicio = pipeline.ler_marca_dagua(conn)
+    if fim is None:
+        fim = conn.execute("SELECT COALESCE(MAX(id), 0) FROM prontuarios").fetchone()[0]
+    with conn:
+        conn.executemany("INSERT INTO backfill_shards (inicio, fim) VALUES (?, ?)",
+                         [(a, min(a + tamanho_shard, fim)) for a in range(inicio, fim, tamanho_shard)])
+    return inicio, fim
+
+def executar_backfill(workers, threads=None, tamanho_shard=TAMANHO_SHARD,
+                      inicio=None, fim=None, tamanho_bloco=pipeline.TAMANHO_BLOCO):
+    threads = threads or max(1, (os.cpu_count() or 1) // workers)
+    preparar_banco(pipeline.ARQUIVO_DB)
+    conn = conectar(pipeline.ARQUIVO_DB)
+    faixa = planejar_shards(conn, inicio, fim, tamanho_shard)
+    if faixa is None:
+        conn.close()
+        return
+    inicio, fim = faixa
+    pendentes = conn.execute("SELECT id, inicio, fim FROM backfill_shards WHERE status = 'pendente' "
+                             "ORDER BY inicio").fetchall()
+    if not pendentes and inicio >= fim:
+        print(">>> Nada a processar.")
+        conn.close()
+        return
+
+    por_worker = defaultdict(lambda: [0, 0.0])
+    total_notas, t0 = 0, time.perf_counter()
+    if pendentes:
+        print(f">>> Backfill: {len(pendentes)} shards, {workers} workers x {threads} threads")
+        # 'spawn' evita herdar o estado do torch/OpenMP do processo pai via fork
+        with ProcessPoolExecutor(max_workers=workers, mp_context=mp.get_context("spawn"),
+                                 initializer=iniciar_worker, initargs=(threads,)) as executor:
+            faixas = {sid: (a, b) for sid, a, b in pendentes}
+            futuros = [executor.submit(processar_shard, sid, a, b, tamanho_bloco) for sid, a, b in pendentes]
+            for futuro in as_completed(futuros):
+                shard_id, linhas, notas, segundos, pid = futuro.result()
+                # Alertas e status do shard na mesma transação: um shard nunca entra pela metade.
+                # Os alertas que a faixa já tinha (--de abaixo da marca d'água) são substituídos, não duplicados.
+                with conn:
+                    pipeline.apagar_alertas(conn, *faixas[shard_id])
+                    pipeline.gravar_alertas(conn, linhas)
+                    conn.execute("UPDATE backfill_shards SET status = 'concluido', notas = ?, alertas = ?, "
+                                 "segundos = ?, worker_pid = ?, concluido_em = datetime('now') WHERE id = ?",
+                                 (notas, pipeline.notas_com_alerta(linhas), segundos, pid, shard_id))
+                por_worker[pid][0] += notas
+                por_worker[pid][1] += segundos
+                total_notas += notas
+                print(f"   ... shard #{shard_id} ok: {notas} notas em {segundos:.1f}s (worker {pid})")
+
+    # Backfill completo: a execução incremental passa a começar depois dele, desde que a faixa
+    # encoste na marca d'água. Com --de acima dela, avançar pularia as notas entre as duas.
+    data = conn.execute("SELECT data_importacao FROM prontuarios WHERE id <= ? ORDER BY id DESC LIMIT 1",
+                        (fim,)).fetchone()
+    with conn:
+        marca = pipeline.ler_marca_dagua(conn)
+        if inicio <= marca < fim:
+            pipeline.gravar_marca_dagua(conn, fim, data[0] if data else None)
+        elif marca < inicio:
+            print(f"   [AVISO] Marca d'água mantida em #{marca}: os prontuários de #{marca} a #{inicio} "
+                  f"ainda não foram classificados.")
+        conn.execute("DELETE FROM backfill_shards")
+    conn.close()
+
+    duracao = time.perf_counter() - t0
+    print(f"\n{'Worker':<10}{'notas':>10}{'notas/s':>12}")
+    for pid, (notas, segundos) in sorted(por_worker.items()):
+        print(f"{pid:<10}{notas:>10}{notas / segundos if segundos else 0:>12.1f}")
+    print(f"\n>>> Total: {total_notas} notas em {duracao:.1f}s "
+          f"({total_notas / duracao:.1f} notas/s com {workers}x{threads})")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Backfill paralelo de prontuarios -> alertas_ram")
+    parser.add_argument("--workers", type=int, default=max(1, (os.cpu_count() or 1) // 4))
+    parser.add_argument("--threads", type=int, help="torch.set_num_threads por worker (padrão: núcleos / workers)")
+    parser.add_argument("--shard", type=int, default=TAMANHO_SHARD, help="Ids por shard")
+    parser.add_argument("--de", type=int, help="Primeiro id (exclusivo); padrão: marca d'água atual. "
+                        "Abaixo dela, os alertas da faixa são substituídos")
+    parser.add_argument("--ate", type=int, help="Último id (inclusivo); padrão: maior id")
+    args = parser.parse_args()
+
+    executar_backfill(args.workers, args.threads, args.shard, args.de, args.ate)
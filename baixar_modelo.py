@@ -1,30 +1,35 @@
-from transformers import AutoTokenizer, AutoModel
+import argparse
 import sys
 
-# Nome do modelo
-NOME_MODELO = "pucpr/biobertpt-clin"
+from modelo_local import NOME_MODELO, criar_snapshot, diretorio_snapshot, verificar_snapshot
 
-print(f"--- INICIANDO DIAGNÓSTICO DE DOWNLOAD ---")
-print(f"Modelo alvo: {NOME_MODELO}")
-print("1. Tentando baixar o Tokenizer (Leve)...")
+# Baixa o BioBERT uma vez e grava um snapshot local fixo (safetensors + manifesto com sha256).
+# Depois disso app.py, o pipeline e os scripts carregam dele sem consultar o Hub.
 
-try:
-    tokenizer = AutoTokenizer.from_pretrained(NOME_MODELO)
-    print("   [OK] Tokenizer baixado com sucesso!")
-except Exception as e:
-    print(f"   [ERRO] Falha no Tokenizer: {e}")
-    sys.exit()
+parser = argparse.ArgumentParser(description="Cria o snapshot local do BioBERT")
+parser.add_argument("--modelo", default=NOME_MODELO)
+parser.add_argument("--revisao", help="Commit/tag do Hub a fixar (padrão: a versão atual)")
+args = parser.parse_args()
 
-print("\n2. Tentando baixar o Modelo (Pesado - aprox 440MB)...")
+destino = diretorio_snapshot(args.modelo)
+print(f"--- CRIANDO SNAPSHOT LOCAL ---")
+print(f"Modelo alvo: {args.modelo}")
+print(f"Destino: {destino}")
+print("Baixando tokenizer e pesos (aprox 440MB na primeira vez)...")
 print("   Aguarde... se demorar mais que 1 min sem mensagem, sua conexão pode estar instável.")
 
 try:
-    # O force_download ajuda se o arquivo anterior ficou corrompido quando travou
-    model = AutoModel.from_pretrained(NOME_MODELO, force_download=True)
-    print("   [OK] Modelo baixado e carregado na memória!")
+    manifesto = criar_snapshot(args.modelo, destino, args.revisao)
 except Exception as e:
-    print(f"   [ERRO] Falha no Modelo: {e}")
-    sys.exit()
+    print(f"   [ERRO] Falha no download: {e}")
+    print("   Se o cache do Hugging Face estiver corrompido, rode 'python reparar_modelo.py'.")
+    sys.exit(1)
+
+problemas = verificar_snapshot(destino)
+if problemas:
+    print(f"   [ERRO] Snapshot gravado com problemas: {problemas}")
+    sys.exit(1)
 
+print(f"   [OK] {len(manifesto['arquivos'])} arquivos gravados e conferidos (revisão {manifesto['revisao']}).")
 print("\n--- SUCESSO TOTAL ---")
-print("O modelo está salvo no seu computador. Agora o outro script vai rodar instantaneamente.")
\ No newline at end of file
+print("O modelo está salvo no seu computador. Agora os outros scripts carregam sem internet.")
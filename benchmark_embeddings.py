@@ -0,0 +1,76 @@
+import argparse
+import random
+import time
+
+import torch
+
+from motor_embeddings import NOME_MODELO, MotorEmbeddings, carregar_biobert
+from gerar_sinteticos import (templates_graves, sintomas_graves, acoes_graves,
+                              templates_leves, sintomas_leves, meds_suporte,
+                              templates_normais)
+
+# --- CORPUS DE TESTE ---
+# Mistura os templates sintéticos e concatena frases para variar bastante o comprimento
+
+
+def gerar_textos(qtd, seed=42):
+    rng = random.Random(seed)
+    textos = []
+    for _ in range(qtd):
+        frases = []
+        for _ in range(rng.randint(1, 6)):
+            frases.append(rng.choice([
+                rng.choice(templates_graves).format(sintoma=rng.choice(sintomas_graves),
+                                                    acao=rng.choice(acoes_graves)),
+                rng.choice(templates_leves).format(sintoma=rng.choice(sintomas_leves),
+                                                   med_suporte=rng.choice(meds_suporte)),
+                rng.choice(templates_normais),
+            ]))
+        textos.append(" ".join(frases))
+    return textos
+
+
+def loop_por_texto(tokenizer, model, textos, max_length):
+    """Reproduz o laço antigo: um forward pass por texto"""
+    for texto in textos:
+        inputs = tokenizer(texto, return_tensors="pt", truncation=True, padding=True, max_length=max_length)
+        with torch.no_grad():
+            model(**inputs)
+
+
+def medir(funcao, qtd):
+    inicio = time.perf_counter()
+    funcao()
+    duracao = time.perf_counter() - inicio
+    return qtd / duracao, duracao
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Throughput (textos/s) do motor de embeddings")
+    parser.add_argument("--modelo", default=NOME_MODELO)
+    parser.add_argument("--qtd", type=int, default=256)
+    parser.add_argument("--max-length", type=int, default=512)
+    parser.add_argument("--lotes", default="1,8,16,32,64", help="Tamanhos de lote separados por vírgula")
+    parser.add_argument("--max-tokens-lote", type=int, default=16384)
+    args = parser.parse_args()
+
+    print(f">>> Carregando {args.modelo}...")
+    tokenizer, model = carregar_biobert(args.modelo)
+    textos = gerar_textos(args.qtd)
+
+    # Aquecimento (a primeira chamada paga alocações e inicialização de kernels)
+    MotorEmbeddings(tokenizer, model, max_length=args.max_length).gerar(textos[:8])
+
+    print(f"\n{'Estratégia':<28}{'textos/s':>12}{'tempo (s)':>12}{'speedup':>10}")
+    base, dur = medir(lambda: loop_por_texto(tokenizer, model, textos, args.max_length), len(textos))
+    print(f"{'Laço por texto (atual)':<28}{base:>12.1f}{dur:>12.2f}{1.0:>10.2f}")
+
+    for tamanho in [int(x) for x in args.lotes.split(",")]:
+        motor = MotorEmbeddings(tokenizer, model, max_length=args.max_length,
+                                tamanho_lote=tamanho, max_tokens_lote=args.max_tokens_lote)
+        taxa, dur = medir(lambda: motor.gerar(textos), len(textos))
+        print(f"{f'Lote={tamanho}':<28}{taxa:>12.1f}{dur:>12.2f}{taxa / base:>10.2f}")
+
+
+if __name__ == "__main__":
+    main()
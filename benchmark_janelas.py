@@ -0,0 +1,107 @@
+import argparse
+import random
+import time
+
+import numpy as np
+
+from motor_embeddings import NOME_MODELO, MotorEmbeddings, agregar_janelas, carregar_biobert
+from modelo_local import POOLINGS
+from gerar_sinteticos import (templates_graves, sintomas_graves, acoes_graves,
+                              templates_leves, sintomas_leves, meds_suporte,
+                              templates_normais)
+
+# --- CORPUS DE NOTAS LONGAS ---
+# Várias frases de rotina (grau 0) e uma frase que define o grau, por padrão no fim
+# da nota: é exatamente o caso que a truncagem em max_length perde.
+
+CONFIGURACOES = "trunc:128,trunc:512,128:64,128:128,256:128,256:256,512:256"
+
+
+def gerar_notas_longas(qtd, min_frases=10, max_frases=40, posicao="fim", seed=42):
+    rng = random.Random(seed)
+    textos, graus = [], []
+    for _ in range(qtd):
+        grau = rng.choice([0, 1, 3])
+        if grau == 3:
+            frase = rng.choice(templates_graves).format(sintoma=rng.choice(sintomas_graves),
+                                                        acao=rng.choice(acoes_graves))
+        elif grau == 1:
+            frase = rng.choice(templates_leves).format(sintoma=rng.choice(sintomas_leves),
+                                                       med_suporte=rng.choice(meds_suporte))
+        else:
+            frase = rng.choice(templates_normais)
+        frases = [rng.choice(templates_normais) for _ in range(rng.randint(min_frases, max_frases))]
+        frases.insert(len(frases) if posicao == "fim" else rng.randint(0, len(frases)), frase)
+        textos.append(" ".join(frases))
+        graus.append(grau)
+    return textos, np.array(graus)
+
+
+def acuracia_cv(X, y, folds=5):
+    """Acurácia média de uma regressão logística em k-fold estratificado (mede só a informação no vetor)"""
+    from sklearn.linear_model import LogisticRegression
+    from sklearn.model_selection import StratifiedKFold, cross_val_score
+    from sklearn.pipeline import make_pipeline
+    from sklearn.preprocessing import StandardScaler
+
+    clf = make_pipeline(StandardScaler(), LogisticRegression(max_iter=2000))
+    return cross_val_score(clf, X, y, cv=StratifiedKFold(folds, shuffle=True, random_state=42)).mean()
+
+
+def medir_configuracao(tokenizer, model, textos, configuracao, max_janelas):
+    """(janelas por nota, segundos, {pooling: matriz}) para 'trunc:N' ou 'janela:passo'"""
+    tipo, valor = configuracao.split(":")
+    if tipo == "trunc":
+        motor = MotorEmbeddings(tokenizer, model, max_length=int(valor), janela=None)
+        t0 = time.perf_counter()
+        X = motor.gerar(textos)
+        return 1.0, time.perf_counter() - t0, {"cls": X}
+
+    motor = MotorEmbeddings(tokenizer, model, janela=int(tipo), passo=int(valor), max_janelas=max_janelas)
+    t0 = time.perf_counter()
+    # Mesmo caminho de _gerar_janelas, mas os vetores das janelas são agregados de todos os jeitos de uma vez
+    ids = tokenizer(textos, add_special_tokens=False, truncation=False, verbose=False)["input_ids"]
+    janelas, dono = [], []
+    for i, seq in enumerate(ids):
+        for janela in motor._janelas(seq):
+            janelas.append(janela)
+            dono.append(i)
+    vetores = motor._cls(janelas)
+    duracao = time.perf_counter() - t0
+    dono = np.asarray(dono)
+    return len(janelas) / len(textos), duracao, {p: agregar_janelas(vetores, dono, len(textos), p) for p in POOLINGS}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Acurácia x custo do modo janelas (notas longas)")
+    parser.add_argument("--modelo", default=NOME_MODELO)
+    parser.add_argument("--qtd", type=int, default=300)
+    parser.add_argument("--posicao", choices=["fim", "aleatoria"], default="fim",
+                        help="Onde fica a frase que define o grau")
+    parser.add_argument("--configuracoes", default=CONFIGURACOES,
+                        help="trunc:max_length ou janela:passo, separados por vírgula")
+    parser.add_argument("--max-janelas", type=int, default=8)
+    args = parser.parse_args()
+
+    print(f">>> Carregando {args.modelo}...")
+    tokenizer, model = carregar_biobert(args.modelo)
+    textos, graus = gerar_notas_longas(args.qtd, posicao=args.posicao)
+    tokens = [len(ids) for ids in tokenizer(textos, add_special_tokens=False, verbose=False)["input_ids"]]
+    print(f">>> {len(textos)} notas, {np.mean(tokens):.0f} tokens em média (máx. {max(tokens)}), "
+          f"frase do grau: {args.posicao}")
+    MotorEmbeddings(tokenizer, model).gerar(textos[:4])  # aquecimento
+
+    colunas = ["cls"] + list(POOLINGS)
+    print(f"\n{'config':<12}{'janelas/nota':>13}{'tempo (s)':>11}{'custo':>8}"
+          + "".join(f"{'acc ' + c:>13}" for c in colunas))
+    base = None
+    for configuracao in args.configuracoes.split(","):
+        por_nota, duracao, matrizes = medir_configuracao(tokenizer, model, textos, configuracao, args.max_janelas)
+        base = base or duracao
+        acuracias = {nome: acuracia_cv(X, graus) for nome, X in matrizes.items()}
+        print(f"{configuracao:<12}{por_nota:>13.1f}{duracao:>11.2f}{duracao / base:>7.1f}x"
+              + "".join(f"{acuracias[c] * 100:>12.1f}%" if c in acuracias else f"{'-':>13}" for c in colunas))
+
+
+if __name__ == "__main__":
+    main()
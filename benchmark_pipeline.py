@@ -0,0 +1,321 @@
+import argparse
+import json
+import os
+import platform
+import re
+import resource
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime
+
+import numpy as np
+
+from esquema_banco import conectar, preparar_banco
+from gerar_sinteticos import gerar_blocos
+
+# --- CONFIGURAÇÃO ---
+# Corpora de tamanho crescente; cada etapa roda em todos os tamanhos
+TAMANHOS = "500,2000,8000"
+AMOSTRA_LATENCIA = 200     # Chamadas unitárias cronometradas por etapa (p50/p95/p99)
+REPETICOES_LOTE = 3        # Vazão = melhor de N execuções do lote (como no benchmark_regras.py)
+REPETICOES_PAINEL = 5      # A aba 2 é recalculada inteira N vezes por tamanho
+TOLERANCIA = 0.20          # Piora relativa aceita antes de acusar regressão
+SEMENTE = 42
+
+# BERT minúsculo com pesos aleatórios: mesma arquitetura e caminho de código do
+# BioBERT, sem download. Os números servem para comparar versões do código entre
+# si, não para prever a velocidade do modelo real.
+CONFIG_BERT_MINUSCULO = {"hidden_size": 64, "num_hidden_layers": 2, "num_attention_heads": 2,
+                         "intermediate_size": 128, "max_position_embeddings": 512}
+
+# (métrica, sentido, piso): sentido +1 = maior é melhor, -1 = menor é melhor; variações
+# absolutas abaixo do piso são ruído (p95 de 0,01 ms -> 0,02 ms não é regressão)
+METRICAS_COMPARADAS = [("itens_s", 1, 0.0), ("p95_ms", -1, 0.5), ("rss_pico_mb", -1, 32.0)]
+
+
+# --- MODELO OFFLINE ---
+
+def criar_bert_minusculo(textos, diretorio):
+    """Tokenizer WordPiece com o vocabulário do próprio corpus + BertModel aleatório (semente fixa)"""
+    import torch
+    from transformers import BertConfig, BertModel, BertTokenizerFast
+
+    palavras = sorted({p for t in textos for p in re.findall(r"\w+", t.lower())})
+    caracteres = sorted({c for t in textos for c in t.lower() if not c.isspace()})
+    vocab = (["[PAD]", "[UNK]", "[CLS]", "[SEP]", "[MASK]"] + caracteres
+             + [f"##{c}" for c in caracteres if c.isalnum()] + palavras)
+    vocab = list(dict.fromkeys(vocab))
+    caminho = os.path.join(diretorio, "vocab.txt")
+    with open(caminho, "w", encoding="utf-8") as f:
+        f.write("\n".join(vocab))
+    tokenizer = BertTokenizerFast(vocab_file=caminho, do_lower_case=True)
+
+    torch.manual_seed(SEMENTE)
+    model = BertModel(BertConfig(vocab_size=len(vocab), **CONFIG_BERT_MINUSCULO)).eval()
+    return tokenizer, model
+
+
+# --- MEDIÇÃO ---
+
+def rss_mb():
+    """Memória residente atual (Linux); sem /proc, cai no pico do processo"""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2**20
+    except OSError:
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+class AmostradorRSS:
+    """Lê o RSS a cada poucos ms numa thread: pico da etapa, não o pico acumulado do processo"""
+
+    def __init__(self, intervalo=0.005):
+        self.intervalo = intervalo
+        self.pico = self.inicio = rss_mb()
+        self._parar = threading.Event()
+        self._thread = threading.Thread(target=self._laco, daemon=True)
+
+    def _laco(self):
+        while not self._parar.wait(self.intervalo):
+            self.pico = max(self.pico, rss_mb())
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *_):
+        self._parar.set()
+        self._thread.join()
+        self.pico = max(self.pico, rss_mb())
+
+
+def cronometrar(funcao, argumentos):
+    """Latência em ms de cada chamada unitária"""
+    latencias = []
+    for argumento in argumentos:
+        t0 = time.perf_counter()
+        funcao(argumento)
+        latencias.append((time.perf_counter() - t0) * 1000)
+    return latencias
+
+
+def medir_etapa(itens, lote, unitario):
+    """Roda o lote (vazão) e as chamadas unitárias (percentis) com o RSS sob amostragem"""
+    duracao = float("inf")
+    with AmostradorRSS() as rss:
+        for _ in range(REPETICOES_LOTE):
+            t0 = time.perf_counter()
+            lote()
+            duracao = min(duracao, time.perf_counter() - t0)
+        latencias = unitario()
+    p50, p95, p99 = np.percentile(latencias, [50, 95, 99])
+    return {"itens": itens, "segundos": duracao, "itens_s": itens / duracao,
+            "p50_ms": float(p50), "p95_ms": float(p95), "p99_ms": float(p99),
+            "rss_pico_mb": rss.pico, "rss_delta_mb": rss.pico - rss.inicio}
+
+
+# --- ETAPAS ---
+
+def preparar_corpus(arquivo_db, qtd):
+    """Banco novo com `qtd` notas em prontuarios e em dados_treino (mesmas linhas do gerar_sinteticos)"""
+    preparar_banco(arquivo_db)
+    conn = conectar(arquivo_db)
+    textos, graus = [], []
+    with conn:
+        for linhas in gerar_blocos(qtd, SEMENTE):
+            conn.executemany("INSERT INTO prontuarios (paciente_hash, texto_clinico, data_importacao) "
+                             "VALUES (?, ?, ?)", [(p, t, d) for p, t, d, _ in linhas])
+            conn.executemany("INSERT INTO dados_treino (texto_clinico, grau_real) VALUES (?, ?)",
+                             [(t, g) for _, t, _, g in linhas])
+            textos += [t for _, t, _, _ in linhas]
+            graus += [g for *_, g in linhas]
+    conn.close()
+    return textos, np.array(graus)
+
+
+def etapa_embedding(textos, motor, amostra):
+    """treinar_modelo.gerar_embedding (uma nota) e MotorEmbeddings.gerar (corpus inteiro)"""
+    import treinar_modelo
+    treinar_modelo.motor = motor
+    return medir_etapa(len(textos), lambda: motor.gerar(textos),
+                       lambda: cronometrar(treinar_modelo.gerar_embedding, amostra))
+
+
+def etapa_regras(textos):
+    """classificar_texto do app.py (MotorRegras.classificar) nota a nota e em lote"""
+    from regras_ctcae import MotorRegras
+    regras = MotorRegras()
+    return medir_etapa(len(textos), lambda: regras.classificar_lote(textos),
+                       lambda: cronometrar(regras.classificar, textos[:AMOSTRA_LATENCIA * 10]))
+
+
+def etapa_extracao(textos):
+    """Medicamentos e reações (extracao_ram.py) que o pipeline roda sobre cada nota que vira alerta"""
+    from extracao_ram import ExtratorRAM
+    extrator = ExtratorRAM()
+    return medir_etapa(len(textos), lambda: extrator.extrair_lote(textos),
+                       lambda: cronometrar(extrator.extrair, textos[:AMOSTRA_LATENCIA * 10]))
+
+
+def etapa_assinaturas(textos):
+    """MinHash + bandas LSH (duplicatas.py) que o --deduplicar do pipeline calcula para cada nota"""
+    from duplicatas import assinaturas, hashes_bandas, pares_vazados
+    resultado = medir_etapa(len(textos), lambda: hashes_bandas(assinaturas(textos)),
+                            lambda: cronometrar(lambda t: hashes_bandas(assinaturas([t])),
+                                                textos[:AMOSTRA_LATENCIA * 10]))
+    # Fração da segunda metade com quase-cópia na primeira: a inferência que o --deduplicar evitaria
+    metade = len(textos) // 2
+    copias = pares_vazados(textos[:metade], textos[metade:])
+    resultado["fracao_quase_copias"] = len(copias) / max(len(textos) - metade, 1)
+    return resultado
+
+
+def etapa_predict(clf, X):
+    return medir_etapa(len(X), lambda: clf.predict(X),
+                       lambda: cronometrar(clf.predict, [X[i:i + 1] for i in range(min(len(X), AMOSTRA_LATENCIA))]))
+
+
+def etapa_pipeline(arquivo_db, motor, clf):
+    """prontuarios -> alertas_ram com as funções do biobert_pipeline; latência = bloco inteiro (classificar + gravar)"""
+    import biobert_pipeline as pipeline
+
+    conn = conectar(arquivo_db)  # Esquema já migrado por preparar_corpus
+    latencias = []
+
+    def processar():
+        with conn:
+            conn.execute("DELETE FROM alertas_ram")
+        for bloco in pipeline.obter_prontuarios(conn):
+            t0 = time.perf_counter()
+            linhas = pipeline.classificar_bloco(bloco, motor, clf)
+            with conn:
+                pipeline.gravar_alertas(conn, linhas)
+                pipeline.gravar_marca_dagua(conn, bloco[-1][0], bloco[-1][2])
+            latencias.append((time.perf_counter() - t0) * 1000)
+
+    itens = conn.execute("SELECT COUNT(*) FROM prontuarios").fetchone()[0]
+    resultado = medir_etapa(itens, processar, lambda: latencias)
+    # Notas com alerta: cada nota grava uma linha por par medicamento x reação
+    resultado["alertas"] = conn.execute("SELECT COUNT(DISTINCT prontuario_id) FROM alertas_ram").fetchone()[0]
+    conn.close()
+    return resultado
+
+
+def etapa_painel(arquivo_db):
+    """Aba 2 do app.py sem o Streamlit e sem cache: fonte e KPIs no SQL + curvas por medicamento"""
+    import logging
+    import streamlit  # noqa: F401 - antes de silenciar o aviso de "No runtime" dos caches
+    logging.getLogger("streamlit.runtime.caching.cache_data_api").setLevel(logging.ERROR)
+    from consultas_dashboard import consultar_fonte, consultar_kpis
+    from sobrevida import consultar_sobrevida
+
+    conn = conectar(arquivo_db)
+
+    def calcular(_=None):
+        consultar_sobrevida(conn, por_medicamento=True)
+        return consultar_kpis(conn, consultar_fonte(conn))
+
+    itens = conn.execute("SELECT COUNT(*) FROM prontuarios").fetchone()[0]
+    # Vazão em prontuários/s de um recálculo completo do painel (o que um rerun paga quando os dados mudam)
+    resultado = medir_etapa(itens, calcular, lambda: cronometrar(calcular, range(REPETICOES_PAINEL)))
+    conn.close()
+    return resultado
+
+
+# --- EXECUÇÃO ---
+
+def executar(tamanhos, diretorio):
+    from sklearn.ensemble import RandomForestClassifier
+    from motor_embeddings import MotorEmbeddings
+    from treinar_modelo import MAX_LENGTH
+
+    resultados = {}
+    for qtd in tamanhos:
+        arquivo_db = os.path.join(diretorio, f"benchmark_{qtd}.db")
+        textos, graus = preparar_corpus(arquivo_db, qtd)
+        tokenizer, model = criar_bert_minusculo(textos, diretorio)
+        # O max_length de treinar_modelo.py, o mesmo do manifesto que o biobert_pipeline.py segue
+        motor_treino = MotorEmbeddings(tokenizer, model, max_length=MAX_LENGTH)
+        motor_treino.gerar(textos[:8])  # aquecimento
+        amostra = textos[:AMOSTRA_LATENCIA]
+
+        print(f">>> {qtd} notas")
+        X = motor_treino.gerar(textos)
+        clf = RandomForestClassifier(n_estimators=100, random_state=SEMENTE, n_jobs=-1).fit(X, graus)
+        etapas = {
+            "gerar_embedding": lambda: etapa_embedding(textos, motor_treino, amostra),
+            "classificar_texto": lambda: etapa_regras(textos),
+            "extracao_ram": lambda: etapa_extracao(textos),
+            "minhash_lsh": lambda: etapa_assinaturas(textos),
+            "rf_predict": lambda: etapa_predict(clf, X),
+            "prontuarios_alertas": lambda: etapa_pipeline(arquivo_db, motor_treino, clf),
+            "painel_aba2": lambda: etapa_painel(arquivo_db),
+        }
+        for nome, etapa in etapas.items():
+            r = etapa()
+            resultados[f"{nome}@{qtd}"] = r
+            print(f"   ... {nome:<22}{r['itens_s']:>12,.0f} itens/s  p50 {r['p50_ms']:>8.2f} ms  "
+                  f"p95 {r['p95_ms']:>8.2f} ms  p99 {r['p99_ms']:>8.2f} ms  RSS {r['rss_pico_mb']:>7.0f} MB")
+    return resultados
+
+
+def metadados(tamanhos):
+    import sklearn
+    import torch
+    import transformers
+    return {"data": datetime.now().strftime("%Y-%m-%d %H:%M:%S"), "python": platform.python_version(),
+            "plataforma": platform.platform(), "cpus": os.cpu_count(), "threads_torch": torch.get_num_threads(),
+            "torch": torch.__version__, "transformers": transformers.__version__, "sklearn": sklearn.__version__,
+            "bert": CONFIG_BERT_MINUSCULO, "tamanhos": tamanhos, "semente": SEMENTE}
+
+
+def comparar(atual, base, tolerancia=TOLERANCIA):
+    """Lista de (chave, métrica, base, atual, variação, regrediu) das etapas presentes nos dois"""
+    linhas = []
+    for chave in sorted(set(atual) & set(base)):
+        for metrica, sentido, piso in METRICAS_COMPARADAS:
+            antes, depois = base[chave].get(metrica), atual[chave].get(metrica)
+            if not antes or depois is None:
+                continue
+            variacao = (depois - antes) / antes
+            regrediu = variacao * sentido < -tolerancia and abs(depois - antes) > piso
+            linhas.append((chave, metrica, antes, depois, variacao, regrediu))
+    return linhas
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark ponta a ponta (BERT minúsculo offline) e regressões")
+    parser.add_argument("--tamanhos", default=TAMANHOS, help="Notas por corpus, separados por vírgula")
+    parser.add_argument("--saida", default="benchmark_pipeline.json", help="JSON com os resultados")
+    parser.add_argument("--comparar", metavar="BASELINE", help="JSON de uma execução anterior")
+    parser.add_argument("--tolerancia", type=float, default=TOLERANCIA,
+                        help="Piora relativa aceita (0.20 = 20%%) em vazão, p95 e RSS")
+    args = parser.parse_args()
+
+    tamanhos = [int(x) for x in args.tamanhos.split(",")]
+    with tempfile.TemporaryDirectory(prefix="benchmark_pipeline_") as diretorio:
+        resultados = executar(tamanhos, diretorio)
+    with open(args.saida, "w") as f:
+        json.dump({"meta": metadados(tamanhos), "resultados": resultados}, f, indent=2)
+    print(f"\n>>> Resultados em {args.saida}")
+
+    if args.comparar:
+        with open(args.comparar) as f:
+            base = json.load(f)
+        linhas = comparar(resultados, base["resultados"], args.tolerancia)
+        print(f"\n>>> Comparando com {args.comparar} ({base['meta']['data']}), tolerância {args.tolerancia:.0%}")
+        print(f"{'etapa':<28}{'métrica':<13}{'base':>12}{'atual':>12}{'variação':>10}")
+        for chave, metrica, antes, depois, variacao, regrediu in linhas:
+            print(f"{chave:<28}{metrica:<13}{antes:>12.2f}{depois:>12.2f}{variacao:>+9.1%}"
+                  + ("  << REGRESSÃO" if regrediu else ""))
+        regressoes = sum(r[-1] for r in linhas)
+        if regressoes:
+            print(f"\n[FALHA] {regressoes} regressão(ões) acima da tolerância.")
+            sys.exit(1)
+        print("\n[OK] Nenhuma regressão acima da tolerância.")
+
+
+if __name__ == "__main__":
+    main()
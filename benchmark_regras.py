@@ -0,0 +1,61 @@
+import argparse
+import time
+
+from regras_ctcae import EXEMPLOS_NEGACAO, MotorRegras, conferir_exemplos
+from benchmark_embeddings import gerar_textos
+
+
+def classificar_texto_antigo(texto):
+    """Cópia do classificar_texto original do app.py (varredura com `in` por termo)"""
+    texto = texto.lower()
+    termos_graves = ["internação", "uti", "sepse", "neutropenia febril", "suspensão", "anafilaxia", "grau 3", "grau 4", "insuficiência renal", "creatinina > 2", "oliguria"]
+    termos_leves = ["náusea", "vômito", "grau 1", "grau 2", "lefe", "rash", "parestesia", "diarreia"]
+    for termo in termos_graves:
+        if termo in texto:
+            return 3
+    for termo in termos_leves:
+        if termo in texto:
+            return 1
+    return 0
+
+
+def medir(funcao, textos, repeticoes=3):
+    melhor = float("inf")
+    for _ in range(repeticoes):
+        inicio = time.perf_counter()
+        funcao(textos)
+        melhor = min(melhor, time.perf_counter() - inicio)
+    return len(textos) / melhor
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Notas/s do motor de regras CTCAE vs. laço original")
+    parser.add_argument("--qtd", type=int, default=50_000)
+    args = parser.parse_args()
+
+    textos = gerar_textos(args.qtd)
+    motor = MotorRegras()
+
+    # Negações que já esconderam toxicidade: um motor mais rápido que erra aqui não serve
+    erros = conferir_exemplos(motor)
+    for texto, esperado, obtido in erros:
+        print(f"   [ERRO] '{texto}': grau {obtido}, esperado {esperado}")
+    if not erros:
+        print(f"   [OK] {len(EXEMPLOS_NEGACAO)} exemplos de negação com o grau esperado.\n")
+
+    antigo = medir(lambda ts: [classificar_texto_antigo(t) for t in ts], textos)
+    novo = medir(motor.classificar_lote, textos)
+    detalhado = medir(motor.analisar_lote, textos)
+
+    print(f"{'Estratégia':<36}{'notas/s':>12}{'relativo':>10}")
+    print(f"{'Laço com `in` (original)':<36}{antigo:>12,.0f}{1.0:>10.2f}")
+    print(f"{'MotorRegras.classificar_lote':<36}{novo:>12,.0f}{novo / antigo:>10.2f}")
+    print(f"{'MotorRegras.analisar_lote':<36}{detalhado:>12,.0f}{detalhado / antigo:>10.2f}")
+
+    # Onde os dois discordam (acentos, negação e limites de palavra mudam o resultado)
+    divergentes = sum(classificar_texto_antigo(t) != g for t, g in zip(textos, motor.classificar_lote(textos)))
+    print(f"\nNotas com grau diferente do laço original: {divergentes} de {len(textos)}")
+
+
+if __name__ == "__main__":
+    main()
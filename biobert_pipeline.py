@@ -1,65 +1,221 @@
-import sqlite3
-import torch
-import pandas as pd
-from transformers import AutoTokenizer, AutoModel
+import argparse
+import os
+import time
+import numpy as np
+from motor_embeddings import MotorEmbeddings, carregar_biobert, diretorio_snapshot
+from cache_embeddings import CacheEmbeddings
+from esquema_banco import conectar, preparar_banco
+from registro_modelos import ClassificadorRegistrado
+from extracao_ram import linhas_alertas, notas_com_alerta
+from metricas import contar, cronometro, iniciar_exportadores, instrumentar, observar, perfilar
 
 # --- CONFIGURAÇÃO DO MODELO ---
 # Usando BioBERTpt (Clinical) - Especialista em termos médicos em PT
 NOME_MODELO = "pucpr/biobertpt-clin"
+# O classificador é a versão ativa de models/registro (ver registro_modelos.py)
+ARQUIVO_DB = 'oncologia_farmacovigilancia.db'
 
-print(f"--- INICIANDO SISTEMA DE IA ---")
-print(f"Carregando o modelo {NOME_MODELO}...")
-print("(A primeira vez demora alguns minutos pois fará o download de ~400MB)")
+TAMANHO_BLOCO = 500        # Prontuários lidos/gravados por transação
+GRAU_MINIMO_ALERTA = 1     # Notas classificadas abaixo disso não geram linha em alertas_ram
+NOME_PIPELINE = "biobert_pipeline"
 
-# Carrega o tokenizador e o modelo
-tokenizer = AutoTokenizer.from_pretrained(NOME_MODELO)
-model = AutoModel.from_pretrained(NOME_MODELO)
+# Tabela controle_pipeline (marca d'água): migração 10 de esquema_banco.py.
+
+# Carregados sob demanda (ver carregar_recursos)
+tokenizer, model, motor, clf = None, None, None, None
+triagem = None  # TriagemCascata, quando o modo cascata está ligado
+dedup = None    # DeduplicadorNotas, quando a deduplicação está ligada
 
 # --- FUNÇÕES ---
 
-def obter_prontuarios():
-    """Conecta no SQLite e puxa os textos"""
-    conn = sqlite3.connect('oncologia_farmacovigilancia.db')
-    query = "SELECT id, texto_clinico FROM prontuarios"
-    df = pd.read_sql_query(query, conn)
-    conn.close()
-    return df
+def carregar_recursos():
+    """Carrega BioBERT e o classificador uma única vez por processo"""
+    global tokenizer, model, motor, clf
+    if motor is None:
+        print(f"--- INICIANDO SISTEMA DE IA ---")
+        # Antes do BioBERT: o max_length do motor é o que o classificador ativo usou no treino
+        clf = ClassificadorRegistrado()
+        print(f"Classificador {clf.versao} (max_length={clf.max_length}).")
+        snapshot = diretorio_snapshot(NOME_MODELO)
+        if os.path.isdir(snapshot):
+            print(f"Carregando o modelo {NOME_MODELO} do snapshot local ({snapshot})...")
+        else:
+            print(f"Carregando o modelo {NOME_MODELO} do Hugging Face Hub "
+                  f"(sem snapshot local: rode 'python baixar_modelo.py' para não depender da rede)...")
+        tokenizer, model = carregar_biobert(NOME_MODELO)
+        motor = CacheEmbeddings(MotorEmbeddings(tokenizer, model, max_length=clf.max_length))
+    return motor, clf
+
+def ler_marca_dagua(conn, nome=NOME_PIPELINE):
+    linha = conn.execute("SELECT ultimo_id FROM controle_pipeline WHERE nome = ?", (nome,)).fetchone()
+    return linha[0] if linha else 0
+
+def gravar_marca_dagua(conn, ultimo_id, ultima_data, nome=NOME_PIPELINE):
+    conn.execute("""INSERT INTO controle_pipeline (nome, ultimo_id, ultima_data_importacao, atualizado_em)
+                    VALUES (?, ?, ?, datetime('now'))
+                    ON CONFLICT(nome) DO UPDATE SET ultimo_id = excluded.ultimo_id,
+                        ultima_data_importacao = excluded.ultima_data_importacao,
+                        atualizado_em = excluded.atualizado_em""",
+                 (nome, ultimo_id, ultima_data))
+
+def obter_prontuarios(conn, apos_id=0, ate_id=None, tamanho_bloco=TAMANHO_BLOCO):
+    """Gera blocos de (id, texto_clinico, data_importacao) com id crescente.
 
+    Paginação por chave (WHERE id > ultimo ORDER BY id LIMIT n) em vez de um
+    cursor aberto: cada bloco é uma leitura curta, então a conexão pode gravar
+    e dar commit entre os blocos sem segurar lock de leitura na tabela.
+    """
+    ultimo = apos_id
+    while True:
+        if ate_id is None:
+            bloco = conn.execute("SELECT id, texto_clinico, data_importacao FROM prontuarios "
+                                 "WHERE id > ? ORDER BY id LIMIT ?", (ultimo, tamanho_bloco)).fetchall()
+        else:
+            bloco = conn.execute("SELECT id, texto_clinico, data_importacao FROM prontuarios "
+                                 "WHERE id > ? AND id <= ? ORDER BY id LIMIT ?",
+                                 (ultimo, ate_id, tamanho_bloco)).fetchall()
+        if not bloco:
+            return
+        yield bloco
+        ultimo = bloco[-1][0]
+
+@instrumentar("processar_texto_biobert")
 def processar_texto_biobert(texto):
     """Gera a representação vetorial (embedding) do texto"""
-    inputs = tokenizer(texto, return_tensors="pt", truncation=True, padding=True, max_length=512)
-    with torch.no_grad():
-        outputs = model(**inputs)
-    return outputs.last_hidden_state[:, 0, :].numpy()[0]
+    motor, _ = carregar_recursos()
+    return motor.gerar_um(texto)
+
+def classificar_vetores(clf, vetores):
+    """Grau CTCAE previsto e a probabilidade da classe escolhida"""
+    with cronometro("classificador"):
+        probas = clf.predict_proba(vetores)
+    melhores = probas.argmax(axis=1)
+    return clf.classes_[melhores], probas[np.arange(len(probas)), melhores]
+
+def classificar_bloco(bloco, motor, clf, triagem=None, dedup=None):
+    """Transforma um bloco de prontuários nas linhas de alertas_ram a inserir.
+
+    Com `dedup` (duplicatas.py), quase-cópias de notas já classificadas herdam
+    o grau e só o resto segue para a triagem/BioBERT. Só as notas que viram
+    alerta passam pela extração (extracao_ram.py), que gera uma linha por par
+    medicamento x reação citado na nota.
+    """
+    def inferir(textos):
+        if triagem is not None:
+            graus, confiancas, _ = triagem.classificar(textos)
+            return graus, confiancas
+        return classificar_vetores(clf, motor.gerar(textos))
+
+    textos = [texto for _, texto, _ in bloco]
+    if dedup is not None:
+        graus, confiancas = dedup.classificar([id_pct for id_pct, _, _ in bloco], textos, inferir)
+    else:
+        graus, confiancas = inferir(textos)
+    alertas, textos_alerta = [], []
+    for (id_pct, texto, _), grau, conf in zip(bloco, graus, confiancas):
+        if grau >= GRAU_MINIMO_ALERTA:
+            alertas.append((int(id_pct), int(grau), float(conf)))
+            textos_alerta.append(texto)
+    return linhas_alertas(alertas, textos_alerta)
+
+def apagar_alertas(conn, apos_id, ate_id):
+    """Remove os alertas dos prontuários com id em (apos_id, ate_id]: regravar um intervalo não duplica"""
+    conn.execute("DELETE FROM alertas_ram WHERE prontuario_id > ? AND prontuario_id <= ?", (apos_id, ate_id))
+
+def gravar_alertas(conn, linhas):
+    """Linhas (prontuario_id, medicamento, reacao_adversa, grau, confiança) num único executemany"""
+    conn.executemany("INSERT INTO alertas_ram (prontuario_id, medicamento, reacao_adversa, gravidade_ctcae, "
+                     "confianca_ia) VALUES (?, ?, ?, ?, ?)", linhas)
 
 # --- FLUXO PRINCIPAL ---
 
-def executar():
+def processar_intervalo(conn, apos_id, ate_id, tamanho_bloco, motor, clf, triagem=None, dedup=None):
+    """Classifica os prontuários com id em (apos_id, ate_id], bloco a bloco; devolve (notas, notas com alerta)"""
+    total, total_alertas, inicio = 0, 0, time.perf_counter()
+    anterior = apos_id
+    for bloco in obter_prontuarios(conn, apos_id, ate_id, tamanho_bloco):
+        with cronometro("bloco_pipeline"):
+            linhas = classificar_bloco(bloco, motor, clf, triagem, dedup)
+            # Alertas, assinaturas e marca d'água na mesma transação: ou o bloco entra inteiro, ou é refeito.
+            # Os alertas antigos da faixa saem antes (--reprocessar, ou retomada depois de um reprocessamento
+            # interrompido): a faixa fica com os alertas de uma classificação só.
+            with cronometro("db_escrita", tabela="alertas_ram"), conn:
+                apagar_alertas(conn, anterior, bloco[-1][0])
+                gravar_alertas(conn, linhas)
+                if dedup is not None:
+                    dedup.gravar()
+                gravar_marca_dagua(conn, bloco[-1][0], bloco[-1][2])
+        anterior = bloco[-1][0]
+        observar("lote_pipeline", len(bloco))
+        contar("prontuarios_processados", len(bloco))
+        # Alerta = nota; as linhas são pares medicamento x reação da mesma nota
+        alertas = notas_com_alerta(linhas)
+        contar("alertas_gravados", alertas)
+        total += len(bloco)
+        total_alertas += alertas
+        print(f"   ... até #{bloco[-1][0]}: {total} prontuários, {total_alertas} com alerta "
+              f"({total / (time.perf_counter() - inicio):.1f} notas/s)")
+    return total, total_alertas
+
+def executar(tamanho_bloco=TAMANHO_BLOCO, reprocessar=False, cascata=False, limiar=None,
+             deduplicar=False, limiar_duplicata=None):
+    """Processa só os prontuários novos desde a última execução"""
+    global triagem, dedup
     try:
-        df = obter_prontuarios()
+        preparar_banco(ARQUIVO_DB)
+        conn = conectar(ARQUIVO_DB)
+        apos_id = 0 if reprocessar else ler_marca_dagua(conn)
     except Exception as e:
         print(f"Erro ao ler banco de dados: {e}")
         return
 
-    print(f"\n>>> Sucesso! Encontrados {len(df)} prontuários para análise.\n")
-    
-    for i, row in df.iterrows():
-        id_pct = row['id']
-        texto = row['texto_clinico']
-        
-        print(f"Processando Prontuário #{id_pct}...")
-        
-        # 1. O BioBERT lê o texto
-        vetor = processar_texto_biobert(texto)
-        
-        # 2. Mostra o que ele 'entendeu' (tokenização)
-        tokens = tokenizer.tokenize(texto)
-        # Filtra termos que começam com '##' (sufixos) ou termos chaves
-        termos_chave = [t for t in tokens if t.startswith('##') or 'cisp' in t or 'rubi' in t]
-        
-        print(f"   -> Vetor gerado (tamanho): {len(vetor)}")
-        print(f"   -> Tokens identificados: {termos_chave[:5]}...") 
-        print("-" * 50)
+    motor, clf = carregar_recursos()
+    if cascata and triagem is None:
+        from triagem_cascata import LIMIAR_PADRAO, TriagemCascata, carregar_estagio1
+        triagem = TriagemCascata(carregar_estagio1(), motor, clf, limiar or LIMIAR_PADRAO)
+    if deduplicar:
+        from duplicatas import LIMIAR, DeduplicadorNotas
+        # Uma por execução: lê e grava pela conexão desta execução
+        dedup = DeduplicadorNotas(conn, clf.versao, limiar_duplicata or LIMIAR)
+    print(f"\n>>> Retomando após o prontuário #{apos_id}.\n")
+
+    with perfilar("biobert_pipeline"):
+        total, total_alertas = processar_intervalo(conn, apos_id, None, tamanho_bloco, motor, clf, triagem, dedup)
+    conn.close()
+
+    if total == 0:
+        print(">>> Nenhum prontuário novo.")
+    else:
+        print(f"\n>>> Sucesso! {total} prontuários processados, {total_alertas} com alerta.")
+        print(f">>> {motor.resumo()}")
+        if triagem is not None:
+            print(f">>> {triagem.resumo()}")
+        if dedup is not None:
+            print(f">>> {dedup.resumo()}")
 
 if __name__ == "__main__":
-    executar()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Classifica prontuários novos e grava em alertas_ram")
+    parser.add_argument("--bloco", type=int, default=TAMANHO_BLOCO, help="Prontuários por transação")
+    parser.add_argument("--reprocessar", action="store_true", help="Ignora a marca d'água e reclassifica tudo (substitui os alertas)")
+    parser.add_argument("--continuo", type=int, metavar="SEGUNDOS",
+                        help="Repete a cada N segundos em vez de rodar uma vez")
+    parser.add_argument("--backfill", type=int, metavar="WORKERS",
+                        help="Processa o passivo em paralelo (ver backfill_pipeline.py)")
+    parser.add_argument("--cascata", action="store_true",
+                        help="Regras/TF-IDF primeiro; BioBERT só para as notas incertas")
+    parser.add_argument("--limiar", type=float, help="Confiança mínima do estágio 1 (ver triagem_cascata.py)")
+    parser.add_argument("--deduplicar", action="store_true",
+                        help="Quase-cópias de notas já classificadas herdam o grau (ver duplicatas.py)")
+    parser.add_argument("--limiar-duplicata", type=float, help="Jaccard estimado mínimo para herdar o grau")
+    args = parser.parse_args()
+
+    iniciar_exportadores()  # METRICAS_PORTA / METRICAS_JSON (ver metricas.py)
+    if args.backfill:
+        from backfill_pipeline import executar_backfill
+        executar_backfill(args.backfill, tamanho_bloco=args.bloco)
+    else:
+        executar(args.bloco, args.reprocessar, args.cascata, args.limiar, args.deduplicar, args.limiar_duplicata)
+    while args.continuo:
+        time.sleep(args.continuo)
+        executar(args.bloco, cascata=args.cascata, limiar=args.limiar, deduplicar=args.deduplicar,
+                 limiar_duplicata=args.limiar_duplicata)
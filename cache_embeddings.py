@@ -0,0 +1,146 @@
+import hashlib
+import time
+import unicodedata
+
+import numpy as np
+
+from esquema_banco import conectar, preparar_banco
+from metricas import contar, cronometro
+
+# --- CONFIGURAÇÃO ---
+ARQUIVO_DB = 'oncologia_farmacovigilancia.db'
+MAX_ITENS = 500_000   # Acima disso os vetores menos usados recentemente são descartados
+
+# Tabela embeddings: migração 9 de esquema_banco.py.
+
+
+def normalizar_texto(texto):
+    """Unicode NFC + espaços colapsados, para que pequenas diferenças de formatação batam no cache"""
+    return " ".join(unicodedata.normalize("NFC", texto).split())
+
+
+def chave_texto(texto, modelo, max_length):
+    bruto = f"{modelo}\x1f{max_length}\x1f{normalizar_texto(texto)}"
+    return hashlib.sha256(bruto.encode("utf-8")).hexdigest()
+
+
+class CacheEmbeddings:
+    """Cache persistente em SQLite na frente de um MotorEmbeddings.
+
+    Tem a mesma interface do motor (`gerar`, `gerar_um`): só os textos que
+    não estão na tabela `embeddings` passam pelo BioBERT. Vetores de outro
+    modelo ou outro max_length caem em outra chave e são tratados como falta.
+    """
+
+    def __init__(self, motor, arquivo_db=ARQUIVO_DB, nome_modelo=None,
+                 dtype="float16", max_itens=MAX_ITENS):
+        self.motor = motor
+        self.arquivo_db = arquivo_db
+        self.nome_modelo = nome_modelo or self._nome_padrao(motor)
+        self.dtype = np.dtype(dtype)
+        self.max_itens = max_itens
+        self.hits = 0
+        self.misses = 0
+        self.descartados = 0
+
+        # Quem usa o cache (treino, índice vetorial) nem sempre passou pelo preparar_banco
+        preparar_banco(self.arquivo_db)
+
+    @staticmethod
+    def _nome_padrao(motor):
+        nome = getattr(motor.model, "name_or_path", "desconhecido")
+        backend = getattr(motor.model, "backend_inferencia", "fp32")
+        # fp32 mantém a chave antiga; int8/torchscript ganham um sufixo próprio
+        if backend != "fp32":
+            nome = f"{nome}@{backend}"
+        # Idem para o modo janelas: vetores agregados de janelas não são o CLS truncado
+        configuracao = getattr(motor, "configuracao", "")
+        return f"{nome}#{configuracao}" if configuracao else nome
+
+    @property
+    def dimensao(self):
+        return self.motor.dimensao
+
+    @property
+    def max_length(self):
+        return self.motor.max_length
+
+    def gerar(self, textos):
+        textos = list(textos)
+        saida = np.zeros((len(textos), self.dimensao), dtype=np.float32)
+        if not textos:
+            return saida
+
+        chaves = [chave_texto(t, self.nome_modelo, self.motor.max_length) for t in textos]
+        unicas = list(dict.fromkeys(chaves))
+        agora = time.time()
+
+        conn = conectar(self.arquivo_db)
+        encontrados = {}
+        # Consulta em blocos para não estourar o limite de parâmetros do SQLite
+        with cronometro("db_leitura", tabela="embeddings"):
+            for i in range(0, len(unicas), 900):
+                bloco = unicas[i:i + 900]
+                marcadores = ",".join("?" * len(bloco))
+                for chave, dtype, vetor in conn.execute(
+                        f"SELECT chave, dtype, vetor FROM embeddings WHERE chave IN ({marcadores})", bloco):
+                    encontrados[chave] = np.frombuffer(vetor, dtype=dtype)
+
+        faltantes = [c for c in unicas if c not in encontrados]
+        if faltantes:
+            primeiro_texto = {}
+            for chave, texto in zip(chaves, textos):
+                primeiro_texto.setdefault(chave, texto)
+            novos = self.motor.gerar([primeiro_texto[c] for c in faltantes]).astype(self.dtype)
+            encontrados.update(zip(faltantes, novos))
+
+        # Inserções, LRU e commit; o forward do BioBERT fica fora da medida
+        with cronometro("db_escrita", tabela="embeddings"):
+            if faltantes:
+                conn.executemany(
+                    "INSERT OR REPLACE INTO embeddings (chave, modelo, max_length, dtype, vetor, ultimo_acesso) "
+                    "VALUES (?, ?, ?, ?, ?, ?)",
+                    [(c, self.nome_modelo, self.motor.max_length, self.dtype.name, v.tobytes(), agora)
+                     for c, v in zip(faltantes, novos)])
+            conjunto_faltantes = set(faltantes)
+            acertos = [c for c in unicas if c not in conjunto_faltantes]
+            if acertos:
+                conn.executemany("UPDATE embeddings SET ultimo_acesso = ? WHERE chave = ?",
+                                 [(agora, c) for c in acertos])
+            if faltantes:
+                self._descartar_excedente(conn)
+            conn.commit()
+        conn.close()
+
+        # Contabiliza por texto pedido (duplicatas dentro do lote contam como acerto)
+        self.misses += len(faltantes)
+        self.hits += len(textos) - len(faltantes)
+        contar("cache_embeddings", len(textos) - len(faltantes), resultado="acerto")
+        contar("cache_embeddings", len(faltantes), resultado="falta")
+
+        for i, chave in enumerate(chaves):
+            saida[i] = encontrados[chave]
+        return saida
+
+    def gerar_um(self, texto):
+        return self.gerar([texto])[0]
+
+    def _descartar_excedente(self, conn):
+        """Política LRU: remove os vetores acessados há mais tempo além de max_itens"""
+        total = conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+        excesso = total - self.max_itens
+        if excesso > 0:
+            conn.execute("DELETE FROM embeddings WHERE chave IN "
+                         "(SELECT chave FROM embeddings ORDER BY ultimo_acesso LIMIT ?)", (excesso,))
+            self.descartados += excesso
+
+    def estatisticas(self):
+        total = self.hits + self.misses
+        taxa = self.hits / total if total else 0.0
+        return {"hits": self.hits, "misses": self.misses, "taxa_acerto": taxa,
+                "descartados": self.descartados}
+
+    def resumo(self):
+        e = self.estatisticas()
+        return (f"Cache de embeddings: {e['hits']} acertos, {e['misses']} faltas "
+                f"({e['taxa_acerto'] * 100:.1f}% de acerto), {e['descartados']} descartados")
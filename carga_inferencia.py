@@ -0,0 +1,100 @@
+import argparse
+import asyncio
+import json
+import time
+from urllib.parse import urlparse
+
+import numpy as np
+
+from benchmark_embeddings import gerar_textos
+from cliente_inferencia import URL_PADRAO
+
+# --- CONFIGURAÇÃO ---
+NIVEIS_CONCORRENCIA = [1, 4, 16, 64]
+REQUISICOES_POR_CLIENTE = 20
+
+
+async def requisitar(reader, writer, host, caminho, dados):
+    """Um POST numa conexão keep-alive; retorna (status, corpo)"""
+    corpo = json.dumps(dados).encode("utf-8")
+    writer.write((f"POST {caminho} HTTP/1.1\r\nHost: {host}\r\nContent-Type: application/json\r\n"
+                  f"Content-Length: {len(corpo)}\r\n\r\n").encode("latin-1") + corpo)
+    await writer.drain()
+    status = int((await reader.readline()).split()[1])
+    tamanho = 0
+    while True:
+        linha = await reader.readline()
+        if linha in (b"\r\n", b"\n", b""):
+            break
+        nome, _, valor = linha.decode("latin-1").partition(":")
+        if nome.strip().lower() == "content-length":
+            tamanho = int(valor)
+    return status, await reader.readexactly(tamanho)
+
+
+async def cliente(host, porta, caminho, textos, latencias, rejeitadas):
+    """Simula um usuário: uma nota por vez, cada uma esperando a anterior"""
+    reader, writer = await asyncio.open_connection(host, porta)
+    try:
+        for texto in textos:
+            t0 = time.perf_counter()
+            status, _ = await requisitar(reader, writer, host, caminho, {"textos": [texto]})
+            if status == 200:
+                latencias.append((time.perf_counter() - t0) * 1000)
+            elif status == 503:
+                rejeitadas.append(1)
+            else:
+                raise RuntimeError(f"HTTP {status}")
+    finally:
+        writer.close()
+
+
+async def saude(host, porta):
+    reader, writer = await asyncio.open_connection(host, porta)
+    writer.write(f"GET /saude HTTP/1.1\r\nHost: {host}\r\nConnection: close\r\n\r\n".encode("latin-1"))
+    await writer.drain()
+    resposta = await reader.read()
+    writer.close()
+    return json.loads(resposta.split(b"\r\n\r\n", 1)[1])
+
+
+async def medir_nivel(host, porta, caminho, concorrencia, por_cliente, textos):
+    latencias, rejeitadas = [], []
+    antes = await saude(host, porta)
+    t0 = time.perf_counter()
+    await asyncio.gather(*(cliente(host, porta, caminho,
+                                   textos[i * por_cliente:(i + 1) * por_cliente], latencias, rejeitadas)
+                           for i in range(concorrencia)))
+    duracao = time.perf_counter() - t0
+    depois = await saude(host, porta)
+    lotes = depois["lotes"] - antes["lotes"]
+    return {"concorrencia": concorrencia, "requisicoes": len(latencias), "rejeitadas": len(rejeitadas),
+            "req_s": len(latencias) / duracao,
+            "p50_ms": float(np.percentile(latencias, 50)) if latencias else float("nan"),
+            "p99_ms": float(np.percentile(latencias, 99)) if latencias else float("nan"),
+            "media_por_lote": (depois["notas"] - antes["notas"]) / lotes if lotes else 0.0}
+
+
+async def executar(url, niveis, por_cliente, caminho):
+    endereco = urlparse(url)
+    host, porta = endereco.hostname, endereco.port or 80
+    textos = gerar_textos(max(niveis) * por_cliente)
+    # Aquecimento: a primeira chamada paga alocações do torch
+    await medir_nivel(host, porta, caminho, 1, 2, textos)
+
+    print(f"\n{'conc.':>6}{'req/s':>9}{'p50 ms':>9}{'p99 ms':>9}{'notas/lote':>12}{'503':>6}")
+    for concorrencia in niveis:
+        r = await medir_nivel(host, porta, caminho, concorrencia, por_cliente, textos)
+        print(f"{r['concorrencia']:>6}{r['req_s']:>9.1f}{r['p50_ms']:>9.1f}{r['p99_ms']:>9.1f}"
+              f"{r['media_por_lote']:>12.1f}{r['rejeitadas']:>6}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Teste de carga do servidor_inferencia.py (p50/p99 e vazão)")
+    parser.add_argument("--url", default=URL_PADRAO)
+    parser.add_argument("--concorrencia", default=",".join(map(str, NIVEIS_CONCORRENCIA)),
+                        help="Níveis separados por vírgula")
+    parser.add_argument("--por-cliente", type=int, default=REQUISICOES_POR_CLIENTE)
+    parser.add_argument("--rota", choices=["/classificar", "/embedding"], default="/classificar")
+    args = parser.parse_args()
+    asyncio.run(executar(args.url, [int(x) for x in args.concorrencia.split(",")], args.por_cliente, args.rota))
@@ -0,0 +1,57 @@
+import json
+import os
+import urllib.error
+import urllib.request
+
+import numpy as np
+
+# --- CONFIGURAÇÃO ---
+URL_PADRAO = "http://127.0.0.1:8765"  # HOST e PORTA padrão do servidor_inferencia.py
+# Ex.: INFERENCIA_URL=http://127.0.0.1:8765. Vazio = cada processo carrega o próprio modelo.
+URL_INFERENCIA = os.environ.get("INFERENCIA_URL", "")
+TIMEOUT = 30
+
+
+class ServidorIndisponivel(Exception):
+    """Servidor fora do ar, fila cheia (503) ou resposta inválida"""
+
+
+class ClienteInferencia:
+    """Cliente síncrono (só biblioteca padrão) para o servidor_inferencia.py"""
+
+    def __init__(self, url=URL_INFERENCIA, timeout=TIMEOUT):
+        self.url = url.rstrip("/")
+        self.timeout = timeout
+
+    def _post(self, rota, dados):
+        requisicao = urllib.request.Request(self.url + rota, data=json.dumps(dados).encode("utf-8"),
+                                            headers={"Content-Type": "application/json"})
+        try:
+            with urllib.request.urlopen(requisicao, timeout=self.timeout) as resposta:
+                return json.loads(resposta.read())
+        except (urllib.error.URLError, OSError, ValueError) as e:
+            raise ServidorIndisponivel(f"{self.url}{rota}: {e}") from e
+
+    def saude(self):
+        """GET /saude: fila, lotes, versão do classificador e configuração dos vetores (features)"""
+        try:
+            with urllib.request.urlopen(self.url + "/saude", timeout=self.timeout) as resposta:
+                return json.loads(resposta.read())
+        except (urllib.error.URLError, OSError, ValueError) as e:
+            raise ServidorIndisponivel(f"{self.url}/saude: {e}") from e
+
+    def classificar(self, textos, vetores=False):
+        """Lista de (grau, confiança, vetor ou None), uma por texto"""
+        resultados = self._post("/classificar", {"textos": list(textos), "vetores": vetores})["resultados"]
+        return [(r["grau"], r["confianca"], np.asarray(r["vetor"], dtype=np.float32) if "vetor" in r else None)
+                for r in resultados]
+
+    def classificar_um(self, texto, vetores=False):
+        return self.classificar([texto], vetores)[0]
+
+    def gerar(self, textos):
+        """Mesma interface do MotorEmbeddings: matriz (len(textos), dimensao) float32"""
+        return np.asarray(self._post("/embedding", {"textos": list(textos)})["vetores"], dtype=np.float32)
+
+    def gerar_um(self, texto):
+        return self.gerar([texto])[0]
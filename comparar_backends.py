@@ -0,0 +1,103 @@
+import argparse
+import multiprocessing as mp
+import sqlite3
+import time
+
+import numpy as np
+
+from esquema_banco import ARQUIVO_DB, conectar
+from motor_embeddings import BACKENDS, NOME_MODELO
+from benchmark_embeddings import gerar_textos
+from registro_modelos import carregar
+
+
+def rss_mb():
+    """Memória residente atual do processo (Linux); cai para o pico se /proc não existir"""
+    try:
+        with open("/proc/self/status") as f:
+            for linha in f:
+                if linha.startswith("VmRSS:"):
+                    return int(linha.split()[1]) / 1024
+    except OSError:
+        pass
+    import resource
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def medir_backend(nome_modelo, backend, textos, max_length):
+    """Roda em processo separado para que a memória de um backend não contamine o outro"""
+    from motor_embeddings import MotorEmbeddings, carregar_biobert
+
+    antes = rss_mb()
+    t0 = time.perf_counter()
+    tokenizer, model = carregar_biobert(nome_modelo, backend)
+    carga = time.perf_counter() - t0
+    motor = MotorEmbeddings(tokenizer, model, max_length=max_length)
+    motor.gerar(textos[:8])  # aquecimento
+
+    t0 = time.perf_counter()
+    vetores = motor.gerar(textos)
+    lote = time.perf_counter() - t0
+
+    latencias = []
+    for texto in textos[:50]:
+        t0 = time.perf_counter()
+        motor.gerar_um(texto)
+        latencias.append((time.perf_counter() - t0) * 1000)
+
+    return {"backend": backend, "vetores": vetores, "carga_s": carga,
+            "textos_s": len(textos) / lote, "p50_ms": float(np.percentile(latencias, 50)),
+            "p99_ms": float(np.percentile(latencias, 99)), "rss_mb": rss_mb() - antes}
+
+
+def carregar_textos(qtd):
+    """Usa dados_treino se existir; senão, o corpus sintético do benchmark"""
+    try:
+        conn = conectar(ARQUIVO_DB)
+        textos = [t for (t,) in conn.execute("SELECT texto_clinico FROM dados_treino LIMIT ?", (qtd,))]
+        conn.close()
+    except sqlite3.Error:
+        textos = []
+    return textos or gerar_textos(qtd)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Paridade e custo dos backends de inferência do BioBERT")
+    parser.add_argument("--modelo", default=NOME_MODELO)
+    parser.add_argument("--versao", help="Versão do registro (padrão: a ativa)")
+    parser.add_argument("--qtd", type=int, default=300)
+    parser.add_argument("--max-length", type=int, help="Padrão: o do manifesto do classificador")
+    args = parser.parse_args()
+
+    clf, manifesto = carregar(args.versao)
+    args.max_length = args.max_length or manifesto["features"]["max_length"]
+    textos = carregar_textos(args.qtd)
+    print(f">>> Comparando {', '.join(BACKENDS)} em {len(textos)} textos...")
+
+    resultados = []
+    contexto = mp.get_context("spawn")
+    for backend in BACKENDS:
+        with contexto.Pool(1) as pool:
+            resultados.append(pool.apply(medir_backend, (args.modelo, backend, textos, args.max_length)))
+
+    referencia = resultados[0]
+    preds_ref = clf.predict(referencia["vetores"])
+    probas_ref = clf.predict_proba(referencia["vetores"])
+
+    print(f"\n{'Backend':<13}{'carga(s)':>9}{'textos/s':>10}{'p50(ms)':>9}{'p99(ms)':>9}"
+          f"{'RSS(MB)':>9}{'cos min':>9}{'concord.':>10}{'Δproba':>8}")
+    for r in resultados:
+        a, b = r["vetores"], referencia["vetores"]
+        cos = (a * b).sum(1) / (np.linalg.norm(a, axis=1) * np.linalg.norm(b, axis=1) + 1e-12)
+        preds = clf.predict(a)
+        concordancia = (preds == preds_ref).mean()
+        delta = np.abs(clf.predict_proba(a) - probas_ref).max()
+        print(f"{r['backend']:<13}{r['carga_s']:>9.1f}{r['textos_s']:>10.1f}{r['p50_ms']:>9.1f}"
+              f"{r['p99_ms']:>9.1f}{r['rss_mb']:>9.0f}{cos.min():>9.4f}{concordancia * 100:>9.1f}%{delta:>8.3f}")
+
+    print("\nconcord. = % de previsões do Random Forest iguais às do fp32; "
+          "Δproba = maior diferença absoluta de probabilidade.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,92 @@
+from datetime import datetime
+
+import pandas as pd
+import streamlit as st
+
+from esquema_banco import ARQUIVO_DB, conectar
+from metricas import cronometro, instrumentar
+from sobrevida import consultar_sobrevida, versao_dados
+
+# --- CONFIGURAÇÃO ---
+TTL_CACHE = 30          # Segundos: o pipeline e outras sessões também gravam no banco
+TAMANHO_PAGINA = 100    # Linhas por página na aba de dados
+TTL_CURVAS = 3600       # As curvas já são chaveadas pela versão dos dados; o TTL só limpa versões velhas
+
+# Tabelas que podem alimentar o painel -> coluna de grau (nomes fixos, nunca vindos do usuário)
+FONTES_GRAU = {"intervencoes": "grau_predito", "dados_treino": "grau_real"}
+
+# --- CONEXÃO ---
+
+def obter_conexao():
+    """Uma conexão por sessão do Streamlit, reaproveitada entre os reruns"""
+    conn = st.session_state.get("conexao_db")
+    if conn is None:
+        # Cada rerun pode rodar numa thread diferente; as funções em cache também usam a conexão
+        conn = conectar(ARQUIVO_DB, check_same_thread=False)
+        st.session_state["conexao_db"] = conn
+    return conn
+
+# --- CONSULTAS ---
+# Recebem a conexão: o benchmark_pipeline.py mede exatamente o SQL do painel, sem Streamlit.
+
+def consultar_fonte(conn):
+    """intervencoes se já houver intervenção registrada; senão dados_treino; None se ambas vazias"""
+    for tabela in FONTES_GRAU:
+        if conn.execute(f"SELECT 1 FROM {tabela} LIMIT 1").fetchone():
+            return tabela
+    return None
+
+def consultar_kpis(conn, tabela):
+    """Total de registros, eventos G3/G4 e taxa, agregados no próprio SQLite"""
+    coluna = FONTES_GRAU[tabela]
+    total, graves = conn.execute(f"SELECT COUNT(*), COALESCE(SUM({coluna} >= 3), 0) FROM {tabela}").fetchone()
+    return {"total": total, "graves": graves, "taxa": graves / total if total else 0.0}
+
+# --- CONSULTAS (CACHED) ---
+# O resultado é compartilhado entre as sessões até o TTL vencer ou salvar_intervencao limpar o cache.
+
+@st.cache_data(ttl=TTL_CACHE, show_spinner=False)
+def fonte_painel():
+    return consultar_fonte(obter_conexao())
+
+@st.cache_data(ttl=TTL_CACHE, show_spinner=False)
+def kpis_toxicidade(tabela):
+    return consultar_kpis(obter_conexao(), tabela)
+
+def versao_sobrevida():
+    """Sem cache: dois MAX(id) e o contador de alterações, lidos a cada rerun para saber se as curvas mudaram"""
+    return versao_dados(obter_conexao())
+
+@st.cache_data(ttl=TTL_CURVAS, max_entries=8, show_spinner=False)
+def curvas_sobrevida(versao, por_medicamento=False):
+    """(curvas, resumo) de sobrevida.py; `versao` só entra na chave do cache"""
+    with cronometro("curvas_sobrevida"):
+        return consultar_sobrevida(obter_conexao(), por_medicamento)
+
+@st.cache_data(ttl=TTL_CACHE, show_spinner=False)
+def contar_intervencoes():
+    return obter_conexao().execute("SELECT COUNT(*) FROM intervencoes").fetchone()[0]
+
+@st.cache_data(ttl=TTL_CACHE, show_spinner=False)
+def pagina_intervencoes(pagina, tamanho=TAMANHO_PAGINA):
+    """Uma página de intervenções, das mais recentes para as mais antigas"""
+    return pd.read_sql("SELECT * FROM intervencoes ORDER BY id DESC LIMIT ? OFFSET ?", obter_conexao(),
+                       params=(tamanho, (pagina - 1) * tamanho))
+
+def limpar_cache():
+    # curvas_sobrevida não entra: intervenções não mudam prontuarios nem alertas_ram
+    for consulta in (fonte_painel, kpis_toxicidade, contar_intervencoes, pagina_intervencoes):
+        consulta.clear()
+
+# --- ESCRITA ---
+
+@instrumentar("salvar_intervencao")
+def salvar_intervencao(texto, grau, tipo_intervencao, notificado):
+    conn = obter_conexao()
+    data_hora = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    with cronometro("db_escrita", tabela="intervencoes"):
+        conn.execute("INSERT INTO intervencoes (data_hora, texto_analisado, grau_predito, tipo_intervencao, notificado_anvisa) VALUES (?, ?, ?, ?, ?)",
+                     (data_hora, texto, int(grau), tipo_intervencao, notificado))
+        conn.commit()
+    # Os KPIs e a tabela precisam refletir a intervenção já no próximo rerun
+    limpar_cache()
@@ -0,0 +1,357 @@
+import argparse
+import re
+import time
+import zlib
+
+import numpy as np
+
+from esquema_banco import ARQUIVO_DB, conectar
+from metricas import contar, cronometro
+from regras_ctcae import MotorRegras, dobrar
+
+# --- CONFIGURAÇÃO ---
+# Evoluções copiadas da consulta anterior com poucas mudanças (e os corpora de
+# gerar_sinteticos.py, montados sobre modelos de frase) pagam um BioBERT inteiro
+# por cópia. A assinatura MinHash das k-palavras ("shingles") de cada nota estima
+# a similaridade de Jaccard entre duas notas; o LSH por bandas acha as candidatas
+# sem comparar a nota com todas as outras.
+TAMANHO_SHINGLE = 3        # Palavras por shingle
+PERMUTACOES = 64           # Tamanho da assinatura (valores uint32)
+BANDAS = 8                 # BANDAS x LINHAS = PERMUTACOES; com 8x8 o "joelho" do LSH fica em ~0.77
+LINHAS = PERMUTACOES // BANDAS
+LIMIAR = 0.9               # Jaccard estimado mínimo para reaproveitar o grau da nota anterior
+MAX_CANDIDATOS = 20        # Candidatas verificadas por nota (modelos de frase lotam os baldes)
+SEMENTE = 42
+PRIMO = (1 << 31) - 1      # a * crc32 + b cabe em uint64 antes do módulo
+CONFIGURACAO = f"k{TAMANHO_SHINGLE}-p{PERMUTACOES}-b{BANDAS}-s{SEMENTE}"
+
+_rng = np.random.default_rng(SEMENTE)
+_A = _rng.integers(1, PRIMO, PERMUTACOES, dtype=np.uint64)
+_B = _rng.integers(0, PRIMO, PERMUTACOES, dtype=np.uint64)
+_MULTIPLICADOR = np.uint64(0x9E3779B97F4A7C15)
+_SEM_ASSINATURA = np.iinfo(np.uint32).max   # Nota sem palavras: nunca é duplicata de nada
+
+_PADRAO_PALAVRA = re.compile(r"\w+")
+_PADRAO_FRASE = re.compile(r"[.;!?\n]+")
+
+# Tabelas minhash_assinaturas e minhash_bandas: migração 6 de esquema_banco.py.
+# Só as notas que passaram pelo classificador entram no índice: uma cópia
+# reaproveitada já está representada pela original, e os baldes ficam pequenos.
+
+
+# --- ASSINATURAS ---
+
+def shingles(texto, k=TAMANHO_SHINGLE):
+    """crc32 das sequências de k palavras do texto sem acento e sem caixa (estável entre processos)"""
+    palavras = _PADRAO_PALAVRA.findall(dobrar(texto))
+    if len(palavras) < k:
+        palavras = [" ".join(palavras)] if palavras else []
+        k = 1
+    return {zlib.crc32(" ".join(palavras[i:i + k]).encode("utf-8")) for i in range(len(palavras) - k + 1)}
+
+
+def assinaturas(textos, k=TAMANHO_SHINGLE):
+    """Matriz (n, PERMUTACOES) uint32 do MinHash de cada texto.
+
+    Os shingles do lote inteiro vão para um único vetor: as PERMUTACOES
+    funções hash são uma conta NumPy só, e o mínimo por nota sai de um
+    np.minimum.reduceat sobre os deslocamentos.
+    """
+    conjuntos = [shingles(t, k) for t in textos]
+    saida = np.full((len(conjuntos), PERMUTACOES), _SEM_ASSINATURA, dtype=np.uint32)
+    com_palavras = [i for i, c in enumerate(conjuntos) if c]
+    if not com_palavras:
+        return saida
+    tamanhos = np.array([len(conjuntos[i]) for i in com_palavras])
+    valores = np.fromiter((h for i in com_palavras for h in conjuntos[i]), dtype=np.uint64, count=tamanhos.sum())
+    deslocamentos = np.concatenate(([0], np.cumsum(tamanhos)[:-1]))
+    hashes = (valores[:, None] * _A + _B) % PRIMO
+    saida[com_palavras] = np.minimum.reduceat(hashes, deslocamentos, axis=0).astype(np.uint32)
+    return saida
+
+
+def hashes_bandas(assinaturas_):
+    """(n, BANDAS) int64: uma chave por banda, com o número da banda misturado (baldes não se cruzam)"""
+    bandas = assinaturas_.reshape(len(assinaturas_), BANDAS, LINHAS).astype(np.uint64)
+    h = np.arange(1, BANDAS + 1, dtype=np.uint64) * _MULTIPLICADOR
+    h = np.broadcast_to(h, (len(assinaturas_), BANDAS)).copy()
+    for r in range(LINHAS):
+        h = (h ^ bandas[:, :, r]) * _MULTIPLICADOR   # uint64 dá a volta sem aviso
+    return h.view(np.int64)
+
+
+def similaridade(a, b):
+    """Jaccard estimado: fração de posições iguais nas duas assinaturas"""
+    if a[0] == _SEM_ASSINATURA or b[0] == _SEM_ASSINATURA:
+        return 0.0
+    return float(np.mean(a == b))
+
+
+def frases(texto):
+    return {" ".join(_PADRAO_PALAVRA.findall(f)) for f in _PADRAO_FRASE.split(dobrar(texto))} - {""}
+
+
+# --- REAPROVEITAMENTO NO PIPELINE ---
+
+class DeduplicadorNotas:
+    """Etapa na frente do classificador do biobert_pipeline.py.
+
+    Para cada nota do bloco procura, pelo LSH, uma nota já classificada com o
+    mesmo classificador (no banco ou antes no próprio bloco) com Jaccard
+    estimado >= limiar. Achando, reaproveita o grau e a confiança dela: a
+    cópia não gera embedding nem passa pelo Random Forest. As frases que a
+    cópia acrescentou são reavaliadas pelas regras CTCAE (regras_ctcae.py);
+    se alguma afirmar um termo mais grave que o grau herdado, a nota vai para
+    o classificador. Frases removidas ou negadas não derrubam o grau herdado,
+    que fica do lado conservador.
+
+    Lê pela conexão do pipeline (banco já levado à versão atual por
+    preparar_banco); as assinaturas novas ficam pendentes até `gravar`,
+    chamado na mesma transação dos alertas e da marca d'água.
+    """
+
+    def __init__(self, conn, versao_modelo, limiar=LIMIAR, regras=None, max_candidatos=MAX_CANDIDATOS):
+        self.conn = conn
+        self.configuracao = f"{versao_modelo}/{CONFIGURACAO}"
+        self.limiar = limiar
+        self.regras = regras or MotorRegras()
+        self.max_candidatos = max_candidatos
+        self.pendentes = []
+        self.total = 0
+        self.reaproveitadas = 0
+        self.recusadas_regras = 0
+
+    def _candidatas_banco(self, chaves):
+        """{hash de banda: [prontuario_id, ...]} das bandas já gravadas"""
+        baldes = {}
+        unicas = list(dict.fromkeys(chaves))
+        # Consulta em blocos para não estourar o limite de parâmetros do SQLite
+        for i in range(0, len(unicas), 900):
+            bloco = unicas[i:i + 900]
+            for h, id_ in self.conn.execute(f"SELECT hash, prontuario_id FROM minhash_bandas "
+                                            f"WHERE hash IN ({','.join('?' * len(bloco))})", bloco):
+                baldes.setdefault(h, []).append(id_)
+        return baldes
+
+    def _fontes_banco(self, ids):
+        """{prontuario_id: (assinatura, grau, confianca, texto)} das candidatas com a mesma configuração"""
+        fontes = {}
+        ids = list(ids)
+        for i in range(0, len(ids), 900):
+            bloco = ids[i:i + 900]
+            for id_, assinatura, grau, confianca, texto in self.conn.execute(
+                    f"""SELECT m.prontuario_id, m.assinatura, m.grau, m.confianca, p.texto_clinico
+                        FROM minhash_assinaturas m JOIN prontuarios p ON p.id = m.prontuario_id
+                        WHERE m.prontuario_id IN ({','.join('?' * len(bloco))}) AND m.configuracao = ?""",
+                    [*bloco, self.configuracao]):
+                fontes[id_] = (np.frombuffer(assinatura, dtype=np.uint32), grau, confianca, texto)
+        return fontes
+
+    def _pode_herdar(self, texto, texto_fonte, grau):
+        """Nenhuma frase nova afirma um termo CTCAE acima do grau herdado"""
+        novas = frases(texto) - frases(texto_fonte)
+        if novas and self.regras.classificar(" . ".join(novas)) > grau:
+            self.recusadas_regras += 1
+            return False
+        return True
+
+    def classificar(self, ids, textos, inferir):
+        """(graus, confiancas) alinhados com `textos`; `inferir(textos)` só recebe as notas sem cópia"""
+        ids, textos = [int(i) for i in ids], list(textos)
+        with cronometro("deduplicacao"):
+            sigs = assinaturas(textos)
+            chaves = hashes_bandas(sigs)
+            baldes = self._candidatas_banco(chaves.ravel().tolist())
+            candidatas = []
+            for id_, linha in zip(ids, chaves.tolist()):
+                vistas = dict.fromkeys(c for h in linha for c in baldes.get(h, ()) if c < id_)
+                candidatas.append(list(vistas)[:self.max_candidatos])
+            fontes = self._fontes_banco({c for lista in candidatas for c in lista})
+
+            graus = np.zeros(len(textos), dtype=int)
+            confiancas = np.zeros(len(textos))
+            herdeiras, lideres, baldes_bloco = {}, [], {}  # herdeira -> líder no bloco
+            for i, (sig, linha) in enumerate(zip(sigs, chaves.tolist())):
+                melhor = max(((similaridade(sig, fontes[c][0]), c) for c in candidatas[i] if c in fontes),
+                             default=(0.0, None))
+                if melhor[0] >= self.limiar and self._pode_herdar(textos[i], fontes[melhor[1]][3],
+                                                                   fontes[melhor[1]][1]):
+                    _, graus[i], confiancas[i], _ = fontes[melhor[1]]
+                    continue
+                # Sem cópia no banco: talvez uma nota anterior do mesmo bloco
+                vistas = dict.fromkeys(j for h in linha for j in baldes_bloco.get(h, ()))
+                lider = next((j for j in list(vistas)[:self.max_candidatos]
+                              if similaridade(sig, sigs[j]) >= self.limiar), None)
+                if lider is not None:
+                    herdeiras[i] = lider
+                    continue
+                lideres.append(i)
+                for h in linha:
+                    baldes_bloco.setdefault(h, []).append(i)
+
+        if lideres:
+            graus[lideres], confiancas[lideres] = inferir([textos[i] for i in lideres])
+        # A checagem das frases novas precisa do grau do líder, que só agora existe
+        tardias = []
+        for i, lider in herdeiras.items():
+            if self._pode_herdar(textos[i], textos[lider], graus[lider]):
+                graus[i], confiancas[i] = graus[lider], confiancas[lider]
+            else:
+                tardias.append(i)
+        if tardias:
+            graus[tardias], confiancas[tardias] = inferir([textos[i] for i in tardias])
+            lideres += tardias
+
+        self.pendentes += [(ids[i], sigs[i], chaves[i], int(graus[i]), float(confiancas[i])) for i in lideres]
+        reaproveitadas = len(textos) - len(lideres)
+        self.total += len(textos)
+        self.reaproveitadas += reaproveitadas
+        contar("deduplicacao", reaproveitadas, resultado="reaproveitada")
+        contar("deduplicacao", len(lideres), resultado="inferida")
+        return graus, confiancas
+
+    def gravar(self):
+        """Grava as assinaturas das notas classificadas (dentro da transação de quem chama)"""
+        if not self.pendentes:
+            return
+        self.conn.executemany(
+            "INSERT OR REPLACE INTO minhash_assinaturas (prontuario_id, configuracao, assinatura, grau, confianca) "
+            "VALUES (?, ?, ?, ?, ?)",
+            [(id_, self.configuracao, sig.tobytes(), grau, conf) for id_, sig, _, grau, conf in self.pendentes])
+        # --reprocessar passa de novo pelas mesmas notas: as bandas antigas saem antes
+        self.conn.executemany("DELETE FROM minhash_bandas WHERE prontuario_id = ?",
+                              [(id_,) for id_, *_ in self.pendentes])
+        self.conn.executemany("INSERT INTO minhash_bandas (hash, prontuario_id) VALUES (?, ?)",
+                              [(h, id_) for id_, _, chaves, _, _ in self.pendentes for h in chaves.tolist()])
+        self.pendentes = []
+
+    def resumo(self):
+        fracao = self.reaproveitadas / self.total if self.total else 0.0
+        return (f"Deduplicação (Jaccard >= {self.limiar:.2f}): {self.reaproveitadas} de {self.total} notas "
+                f"reaproveitaram o grau de uma cópia ({fracao * 100:.1f}% da inferência evitada), "
+                f"{self.recusadas_regras} vetadas pelas regras nas frases novas")
+
+
+# --- VAZAMENTO ENTRE TREINO E TESTE ---
+
+def pares_vazados(textos_treino, textos_teste, limiar=LIMIAR, max_candidatos=MAX_CANDIDATOS):
+    """[(índice no teste, índice no treino, Jaccard estimado)]: notas de teste com quase-cópia no treino.
+
+    O LSH do treino fica em memória (dicionário por hash de banda); cada nota
+    de teste verifica no máximo `max_candidatos` notas do treino.
+    """
+    sig_treino, sig_teste = assinaturas(textos_treino), assinaturas(textos_teste)
+    baldes = {}
+    for j, linha in enumerate(hashes_bandas(sig_treino).tolist()):
+        for h in linha:
+            baldes.setdefault(h, []).append(j)
+    pares = []
+    for i, linha in enumerate(hashes_bandas(sig_teste).tolist()):
+        vistas = dict.fromkeys(j for h in linha for j in baldes.get(h, ())[:max_candidatos])
+        melhor = max(((similaridade(sig_teste[i], sig_treino[j]), j) for j in list(vistas)[:max_candidatos]),
+                     default=(0.0, None))
+        if melhor[0] >= limiar:
+            pares.append((i, melhor[1], melhor[0]))
+    return pares
+
+
+def grupos_quase_copias(textos, limiar=LIMIAR, max_candidatos=MAX_CANDIDATOS):
+    """Rótulo de grupo por texto: quase-cópias (Jaccard estimado >= limiar) ficam no mesmo grupo.
+
+    Os pares achados pelo LSH são unidos em cadeia (union-find), então A~B e
+    B~C põem A, B e C juntos. É o que a validação cruzada por grupos precisa:
+    uma nota e a cópia dela nunca ficam uma no treino e outra no teste.
+    """
+    sig = assinaturas(textos)
+    vazias = sig[:, 0] == _SEM_ASSINATURA
+    pai = np.arange(len(textos))
+
+    def raiz(i):
+        while pai[i] != i:
+            pai[i] = pai[pai[i]]
+            i = pai[i]
+        return i
+
+    baldes = {}
+    for i, linha in enumerate(hashes_bandas(sig).tolist()):
+        if not vazias[i]:
+            candidatas = list(dict.fromkeys(j for h in linha for j in baldes.get(h, ())[:max_candidatos]))
+            candidatas = np.array(candidatas[:max_candidatos], dtype=np.int64)
+            if len(candidatas):
+                for j in candidatas[np.mean(sig[candidatas] == sig[i], axis=1) >= limiar]:
+                    a, b = raiz(i), raiz(j)
+                    pai[max(a, b)] = min(a, b)
+        for h in linha:
+            baldes.setdefault(h, []).append(i)
+    return np.array([raiz(i) for i in range(len(textos))])
+
+
+def textos_dados_treino(conn, ids):
+    """Textos de dados_treino na ordem de `ids`"""
+    textos = {}
+    ids = [int(i) for i in ids]
+    for i in range(0, len(ids), 900):
+        bloco = ids[i:i + 900]
+        textos.update(conn.execute(f"SELECT id, texto_clinico FROM dados_treino "
+                                   f"WHERE id IN ({','.join('?' * len(bloco))})", bloco).fetchall())
+    return [textos[i] or "" for i in ids]
+
+
+def avisar_vazamento(ids_treino, ids_teste, arquivo_db=ARQUIVO_DB, limiar=LIMIAR, textos=None):
+    """Imprime quantas notas do teste têm quase-cópia no treino; devolve a fração.
+
+    `textos` ({id: texto}) evita reler o banco quando a mesma base é checada
+    várias vezes (um split por fold).
+    """
+    if textos is None:
+        conn = conectar(arquivo_db)
+        treino, teste = textos_dados_treino(conn, ids_treino), textos_dados_treino(conn, ids_teste)
+        conn.close()
+    else:
+        treino, teste = [textos[i] for i in ids_treino], [textos[i] for i in ids_teste]
+    with cronometro("vazamento"):
+        pares = pares_vazados(treino, teste, limiar)
+    fracao = len(pares) / len(teste) if teste else 0.0
+    if pares:
+        print(f"   [AVISO] {len(pares)} de {len(teste)} notas de teste ({fracao * 100:.1f}%) têm quase-cópia "
+              f"no treino (Jaccard >= {limiar:.2f}): a acurácia de teste fica otimista.")
+    else:
+        print(f"   [OK] Nenhuma nota de teste com quase-cópia no treino (Jaccard >= {limiar:.2f}).")
+    return fracao
+
+
+# --- CLI ---
+
+def main():
+    parser = argparse.ArgumentParser(description="Quase-duplicatas (MinHash + LSH) nas notas clínicas")
+    parser.add_argument("--vazamento", action="store_true",
+                        help="Quase-cópias entre treino e teste no split do treinar_modelo.py (dados_treino)")
+    parser.add_argument("--teste", type=float, default=0.2, help="Fração de teste do split")
+    parser.add_argument("--comparar", nargs=2, metavar="TEXTO", help="Jaccard estimado entre dois textos")
+    parser.add_argument("--limiar", type=float, default=LIMIAR)
+    parser.add_argument("--db", default=ARQUIVO_DB)
+    args = parser.parse_args()
+
+    if args.comparar:
+        a, b = assinaturas(args.comparar)
+        print(f"Jaccard estimado: {similaridade(a, b):.3f} (limiar {args.limiar:.2f})")
+    elif args.vazamento:
+        from sklearn.model_selection import train_test_split
+
+        conn = conectar(args.db)
+        ids = np.array([i for (i,) in conn.execute("SELECT id FROM dados_treino ORDER BY id")])
+        conn.close()
+        if not len(ids):
+            print("ERRO: Tabela vazia. Rode 'python gerar_sinteticos.py' primeiro.")
+            return
+        # Mesmo split (por posição, random_state=42) do treinar_modelo.treinar
+        idx_treino, idx_teste = train_test_split(np.arange(len(ids)), test_size=args.teste, random_state=42)
+        t0 = time.perf_counter()
+        avisar_vazamento(ids[np.sort(idx_treino)], ids[np.sort(idx_teste)], args.db, args.limiar)
+        print(f">>> {len(ids)} notas em {time.perf_counter() - t0:.1f}s")
+    else:
+        parser.print_help()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,252 @@
+import sqlite3
+
+# --- CONFIGURAÇÃO ---
+ARQUIVO_DB = 'oncologia_farmacovigilancia.db'
+TIMEOUT = 30  # Segundos esperando um lock antes de "database is locked"
+
+# Aplicados a cada conexão (o journal_mode=WAL fica gravado no arquivo, ver preparar_banco)
+PRAGMAS = {
+    "synchronous": "NORMAL",    # Em WAL é seguro contra corrupção; só o último commit pode se perder numa queda de energia
+    "busy_timeout": TIMEOUT * 1000,
+    "cache_size": -65536,       # 64 MB de cache de páginas (valor negativo = KiB)
+    "temp_store": "MEMORY",     # ORDER BY/GROUP BY grandes ordenam em memória
+    "mmap_size": 268435456,     # Leituras via mmap (256 MB)
+}
+
+# --- MIGRAÇÕES ---
+# A versão do esquema fica em PRAGMA user_version. Cada migração roda uma
+# única vez, dentro da mesma transação que avança a versão.
+
+def _v1_tabelas_base(conn):
+    """Tabelas que antes eram criadas por criar_banco.py e por app.init_db"""
+    conn.execute("""
+    CREATE TABLE IF NOT EXISTS prontuarios (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        paciente_hash VARCHAR(100),  -- Anonimizado
+        texto_clinico TEXT NOT NULL, -- O texto não estruturado para o BioBERT
+        data_importacao DATETIME DEFAULT CURRENT_TIMESTAMP
+    )""")
+    conn.execute("""
+    CREATE TABLE IF NOT EXISTS alertas_ram (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        prontuario_id INTEGER,
+        medicamento VARCHAR(100),       -- Extraído (WhoDRUG)
+        reacao_adversa VARCHAR(100),    -- Extraído (MedDRA)
+        gravidade_ctcae INTEGER,        -- Classificado (1-5) via Random Forest
+        confianca_ia FLOAT,             -- Probabilidade do modelo
+        validado_farmaceutico BOOLEAN DEFAULT 0, -- Para validação humana posterior
+        FOREIGN KEY(prontuario_id) REFERENCES prontuarios(id)
+    )""")
+    # Tabela de Dados Históricos (Treino/Sintéticos)
+    conn.execute("""
+    CREATE TABLE IF NOT EXISTS dados_treino (
+        id INTEGER PRIMARY KEY,
+        texto_clinico TEXT,
+        grau_real INTEGER
+    )""")
+    # Tabela de Intervenções (Vida Real). data_hora em texto ISO 'AAAA-MM-DD HH:MM:SS',
+    # que ordena igual à cronologia e permite filtrar por intervalo usando o índice
+    conn.execute("""
+    CREATE TABLE IF NOT EXISTS intervencoes (
+        id INTEGER PRIMARY KEY,
+        data_hora TEXT,
+        texto_analisado TEXT,
+        grau_predito INTEGER,
+        tipo_intervencao TEXT,
+        notificado_anvisa BOOLEAN
+    )""")
+
+def _v2_coluna_texto_dados_treino(conn):
+    """Bancos antigos têm dados_treino.texto (gerar_sinteticos.py); o nome oficial é texto_clinico"""
+    colunas = {linha[1] for linha in conn.execute("PRAGMA table_info(dados_treino)")}
+    if "texto" not in colunas:
+        return
+    if "texto_clinico" not in colunas:
+        conn.execute("ALTER TABLE dados_treino RENAME COLUMN texto TO texto_clinico")
+    else:
+        conn.execute("UPDATE dados_treino SET texto_clinico = texto WHERE texto_clinico IS NULL")
+        conn.execute("ALTER TABLE dados_treino DROP COLUMN texto")
+
+def _v3_indices(conn):
+    """Índices dos caminhos de acesso usados pelo pipeline e pelo dashboard"""
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_alertas_prontuario ON alertas_ram (prontuario_id)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_alertas_gravidade ON alertas_ram (gravidade_ctcae)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_intervencoes_data ON intervencoes (data_hora)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_prontuarios_paciente ON prontuarios (paciente_hash)")
+
+def _v4_indice_paciente_data(conn):
+    """Índice de cobertura da sobrevida (sobrevida.py): primeira/última data por paciente sem ler a tabela"""
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_prontuarios_paciente_data "
+                 "ON prontuarios (paciente_hash, data_importacao)")
+    # O antigo é prefixo do novo: só custaria nas inserções
+    conn.execute("DROP INDEX IF EXISTS idx_prontuarios_paciente")
+
+def _v5_contador_alteracoes(conn):
+    """Conta UPDATE/DELETE em prontuarios e alertas_ram (INSERT já muda o MAX(id)): chave dos caches do painel"""
+    conn.execute("""
+    CREATE TABLE IF NOT EXISTS contador_alteracoes (
+        tabela VARCHAR(50) PRIMARY KEY,
+        alteracoes INTEGER NOT NULL DEFAULT 0
+    )""")
+    for tabela in ("prontuarios", "alertas_ram"):
+        conn.execute("INSERT OR IGNORE INTO contador_alteracoes (tabela) VALUES (?)", (tabela,))
+        for evento in ("UPDATE", "DELETE"):
+            conn.execute(f"""
+            CREATE TRIGGER IF NOT EXISTS trg_{tabela}_{evento.lower()} AFTER {evento} ON {tabela}
+            BEGIN
+                UPDATE contador_alteracoes SET alteracoes = alteracoes + 1 WHERE tabela = '{tabela}';
+            END""")
+
+def _v6_minhash(conn):
+    """Assinaturas MinHash e baldes do LSH das notas classificadas (duplicatas.py)"""
+    conn.execute("""
+    CREATE TABLE IF NOT EXISTS minhash_assinaturas (
+        prontuario_id INTEGER PRIMARY KEY,
+        configuracao VARCHAR(100),      -- versão do classificador + parâmetros do MinHash
+        assinatura BLOB NOT NULL,       -- PERMUTACOES x uint32
+        grau INTEGER,
+        confianca FLOAT
+    )""")
+    conn.execute("""
+    CREATE TABLE IF NOT EXISTS minhash_bandas (
+        hash INTEGER NOT NULL,          -- hash das LINHAS valores de uma banda (com o número da banda)
+        prontuario_id INTEGER NOT NULL
+    )""")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_minhash_bandas_hash ON minhash_bandas (hash)")
+
+def _v7_ingestao_arquivos(conn):
+    """Arquivos já carregados pelo ingestao.py e onde cada um parou"""
+    conn.execute("""
+    CREATE TABLE IF NOT EXISTS ingestao_arquivos (
+        caminho TEXT PRIMARY KEY,       -- Caminho absoluto do arquivo carregado
+        tamanho INTEGER,
+        modificado_ns INTEGER,          -- tamanho + mtime identificam a versão do arquivo
+        registros INTEGER DEFAULT 0,    -- Registros do arquivo já consumidos (ponto de retomada)
+        inseridos INTEGER DEFAULT 0,
+        rejeitados INTEGER DEFAULT 0,
+        status VARCHAR(20) DEFAULT 'em_andamento',  -- em_andamento | concluido
+        atualizado_em DATETIME
+    )""")
+
+def _v8_controle_exportacao(conn):
+    """Marca d'água de cada exportação incremental (exportacao.py)"""
+    conn.execute("""
+    CREATE TABLE IF NOT EXISTS controle_exportacao (
+        nome VARCHAR(100) PRIMARY KEY,  -- Uma marca por exportação incremental (padrão: o conjunto)
+        conjunto VARCHAR(50),
+        ultimo_id INTEGER NOT NULL,     -- Maior id já coberto por uma exportação
+        filtros TEXT,                   -- JSON dos filtros da última execução
+        arquivo TEXT,
+        linhas INTEGER,
+        atualizado_em DATETIME
+    )""")
+
+def _v9_cache_embeddings(conn):
+    """Cache persistente de vetores do BioBERT (cache_embeddings.py)"""
+    conn.execute("""
+    CREATE TABLE IF NOT EXISTS embeddings (
+        chave TEXT PRIMARY KEY,         -- sha256(modelo | max_length | texto normalizado)
+        modelo VARCHAR(100),
+        max_length INTEGER,
+        dtype VARCHAR(10),              -- float16 ou float32
+        vetor BLOB NOT NULL,
+        ultimo_acesso REAL              -- time.time() do último uso (política LRU)
+    )""")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_embeddings_acesso ON embeddings (ultimo_acesso)")
+
+def _v10_controle_pipeline(conn):
+    """Marca d'água do biobert_pipeline.py (e de quem mais processar prontuarios em ordem de id)"""
+    conn.execute("""
+    CREATE TABLE IF NOT EXISTS controle_pipeline (
+        nome VARCHAR(50) PRIMARY KEY,   -- Qual processo é dono da marca d'água
+        ultimo_id INTEGER NOT NULL,     -- Maior prontuarios.id já processado
+        ultima_data_importacao DATETIME,
+        atualizado_em DATETIME
+    )""")
+
+def _v11_backfill_shards(conn):
+    """Faixas de ids do backfill paralelo (backfill_pipeline.py): unidade de retomada após falha"""
+    conn.execute("""
+    CREATE TABLE IF NOT EXISTS backfill_shards (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        inicio INTEGER NOT NULL,        -- prontuarios.id > inicio
+        fim INTEGER NOT NULL,           -- prontuarios.id <= fim
+        status VARCHAR(20) DEFAULT 'pendente',  -- pendente | concluido
+        notas INTEGER,
+        alertas INTEGER,                -- Notas com alerta (não linhas: cada par medicamento x reação é uma)
+        segundos FLOAT,
+        worker_pid INTEGER,
+        concluido_em DATETIME
+    )""")
+
+def _v12_linhas_cobertas_exportacao(conn):
+    """Quantas linhas com id <= ultimo_id existiam na última exportação: se cair, linhas já exportadas sumiram"""
+    colunas = {linha[1] for linha in conn.execute("PRAGMA table_info(controle_exportacao)")}
+    if "linhas_cobertas" not in colunas:
+        conn.execute("ALTER TABLE controle_exportacao ADD COLUMN linhas_cobertas INTEGER")
+
+MIGRACOES = [
+    (1, _v1_tabelas_base),
+    (2, _v2_coluna_texto_dados_treino),
+    (3, _v3_indices),
+    (4, _v4_indice_paciente_data),
+    (5, _v5_contador_alteracoes),
+    (6, _v6_minhash),
+    (7, _v7_ingestao_arquivos),
+    (8, _v8_controle_exportacao),
+    (9, _v9_cache_embeddings),
+    (10, _v10_controle_pipeline),
+    (11, _v11_backfill_shards),
+    (12, _v12_linhas_cobertas_exportacao),
+]
+VERSAO_ATUAL = MIGRACOES[-1][0]
+
+# --- CONEXÃO ---
+
+def conectar(arquivo=ARQUIVO_DB, **kwargs):
+    """sqlite3.connect com timeout e os PRAGMAS de desempenho"""
+    conn = sqlite3.connect(arquivo, timeout=TIMEOUT, **kwargs)
+    for nome, valor in PRAGMAS.items():
+        conn.execute(f"PRAGMA {nome} = {valor}")
+    return conn
+
+def versao_esquema(conn):
+    return conn.execute("PRAGMA user_version").fetchone()[0]
+
+def migrar(conn):
+    """Aplica as migrações pendentes; retorna as versões aplicadas"""
+    aplicadas = []
+    for versao, migracao in MIGRACOES:
+        if versao <= versao_esquema(conn):
+            continue
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            # Relê dentro da transação: outro processo pode ter migrado enquanto esperávamos o lock
+            if versao > versao_esquema(conn):
+                migracao(conn)
+                conn.execute(f"PRAGMA user_version = {versao}")
+                aplicadas.append(versao)
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+    return aplicadas
+
+def preparar_banco(arquivo=ARQUIVO_DB):
+    """Liga o WAL e leva o esquema à versão atual. Barato quando já está em dia."""
+    conn = conectar(arquivo)
+    try:
+        # WAL: leitores (dashboard) não bloqueiam o escritor (pipeline) e vice-versa
+        conn.execute("PRAGMA journal_mode = WAL")
+        aplicadas = migrar(conn)
+    finally:
+        conn.close()
+    return aplicadas
+
+
+if __name__ == "__main__":
+    aplicadas = preparar_banco()
+    if aplicadas:
+        print(f">>> Esquema migrado para a versão {VERSAO_ATUAL} (aplicadas: {aplicadas})")
+    else:
+        print(f">>> Esquema já está na versão {VERSAO_ATUAL}")
@@ -0,0 +1,349 @@
+import argparse
+import csv
+import json
+import os
+import tempfile
+import time
+from datetime import date, datetime, timedelta
+
+from esquema_banco import ARQUIVO_DB, conectar, preparar_banco
+from metricas import contar, cronometro
+
+# --- CONFIGURAÇÃO ---
+# Exportação em fluxo: um cursor só (um snapshot consistente do banco) lido com
+# fetchmany, e cada lote vai direto para o arquivo. Nada passa pelo pandas, e a
+# memória é a de um lote, qualquer que seja o tamanho da tabela.
+# pyarrow (Parquet/Arrow) é importado só quando usado; o CSV não precisa dele.
+TAMANHO_LOTE = 50_000        # Linhas por fetchmany (= um row group no Parquet)
+DIRETORIO_EXPORTACOES = "exportacoes"
+FORMATOS = {"parquet": ".parquet", "arrow": ".arrow", "csv": ".csv"}
+MIMES = {"parquet": "application/vnd.apache.parquet", "arrow": "application/vnd.apache.arrow.file",
+         "csv": "text/csv"}
+
+# Conjunto -> FROM, coluna de id (chave do incremental), de data e de grau, e as colunas
+# (nome, expressão SQL, tipo). Nomes fixos: nada aqui vem do usuário.
+CONJUNTOS = {
+    "intervencoes": {
+        "origem": "intervencoes i",
+        "id": "i.id", "data": "i.data_hora", "grau": "i.grau_predito",
+        "colunas": [("id", "i.id", "int64"), ("data_hora", "i.data_hora", "data"),
+                    ("texto_analisado", "i.texto_analisado", "texto"), ("grau_predito", "i.grau_predito", "int8"),
+                    ("tipo_intervencao", "i.tipo_intervencao", "texto"),
+                    ("notificado_anvisa", "i.notificado_anvisa", "bool")],
+    },
+    "alertas": {
+        # LEFT JOIN: alertas_ram sempre por fora e o prontuário de cada alerta pela chave;
+        # alerta cujo prontuário sumiu sai com os campos do prontuário nulos
+        "origem": "alertas_ram a LEFT JOIN prontuarios p ON p.id = a.prontuario_id",
+        "id": "a.id", "data": "p.data_importacao", "grau": "a.gravidade_ctcae",
+        "colunas": [("id", "a.id", "int64"), ("prontuario_id", "a.prontuario_id", "int64"),
+                    ("paciente_hash", "p.paciente_hash", "texto"), ("data_importacao", "p.data_importacao", "data"),
+                    ("medicamento", "a.medicamento", "texto"), ("reacao_adversa", "a.reacao_adversa", "texto"),
+                    ("gravidade_ctcae", "a.gravidade_ctcae", "int8"), ("confianca_ia", "a.confianca_ia", "float64"),
+                    ("validado_farmaceutico", "a.validado_farmaceutico", "bool")],
+        # Só com --com-texto: a evolução é o grosso do arquivo e o dado mais sensível
+        "texto": ("texto_clinico", "p.texto_clinico", "texto"),
+        # Uma linha por par medicamento x reação: o alerta é a nota, contada por prontuario_id
+        "unidade": "COUNT(DISTINCT a.prontuario_id)",
+    },
+}
+
+# Tabela controle_exportacao (marcas do incremental): migração 8 de esquema_banco.py.
+
+
+# --- CONSULTA ---
+
+def colunas_conjunto(conjunto, com_texto=False):
+    definicao = CONJUNTOS[conjunto]
+    return definicao["colunas"] + ([definicao["texto"]] if com_texto and "texto" in definicao else [])
+
+
+def montar_consulta(conjunto, de=None, ate=None, grau_min=None, grau_max=None, apos_id=None, ate_id=None,
+                    com_texto=False, selecao=None):
+    """(SQL, parâmetros) com os filtros no WHERE; datas em texto ISO comparam na ordem cronológica"""
+    definicao = CONJUNTOS[conjunto]
+    condicoes, parametros = [], []
+    if apos_id is not None:
+        condicoes.append(f"{definicao['id']} > ?")
+        parametros.append(apos_id)
+    if ate_id is not None:
+        condicoes.append(f"{definicao['id']} <= ?")
+        parametros.append(ate_id)
+    if de is not None:
+        condicoes.append(f"{definicao['data']} >= ?")
+        parametros.append(de.isoformat())
+    if ate is not None:
+        # Dia inteiro: '2024-03-31 18:00:00' >= '2024-03-31', então o corte é o dia seguinte
+        condicoes.append(f"{definicao['data']} < ?")
+        parametros.append((ate + timedelta(days=1)).isoformat())
+    if grau_min is not None:
+        condicoes.append(f"{definicao['grau']} >= ?")
+        parametros.append(grau_min)
+    if grau_max is not None:
+        condicoes.append(f"{definicao['grau']} <= ?")
+        parametros.append(grau_max)
+    selecao = selecao or ", ".join(expressao for _, expressao, _ in colunas_conjunto(conjunto, com_texto))
+    onde = f" WHERE {' AND '.join(condicoes)}" if condicoes else ""
+    return f"SELECT {selecao} FROM {definicao['origem']}{onde}", parametros
+
+
+def contar_unidades(conn, conjunto, **filtros):
+    """Alertas (notas) distintos que a exportação com esses filtros cobre; None se o conjunto é 1 linha = 1 item"""
+    selecao = CONJUNTOS[conjunto].get("unidade")
+    if selecao is None:
+        return None
+    sql, parametros = montar_consulta(conjunto, selecao=selecao, **filtros)
+    return conn.execute(sql, parametros).fetchone()[0]
+
+
+def ultimo_id_tabela(conn, conjunto):
+    tabela = CONJUNTOS[conjunto]["origem"].split()[0]
+    return conn.execute(f"SELECT COALESCE(MAX(id), 0) FROM {tabela}").fetchone()[0]
+
+
+def linhas_ate(conn, conjunto, ate_id):
+    """Linhas da tabela do conjunto com id <= ate_id (faixa da chave primária, sem os filtros)"""
+    tabela = CONJUNTOS[conjunto]["origem"].split()[0]
+    return conn.execute(f"SELECT COUNT(*) FROM {tabela} WHERE id <= ?", (ate_id,)).fetchone()[0]
+
+
+# --- ESCRITORES ---
+# Mesma interface: escrever(linhas) por lote e fechar() no fim.
+
+class EscritorCSV:
+    def __init__(self, caminho, colunas):
+        self.arquivo = open(caminho, "w", newline="", encoding="utf-8")
+        self.csv = csv.writer(self.arquivo, lineterminator="\n")
+        self.csv.writerow([nome for nome, _, _ in colunas])
+
+    def escrever(self, linhas):
+        self.csv.writerows(linhas)
+
+    def fechar(self):
+        self.arquivo.close()
+
+
+def esquema_arrow(colunas):
+    import pyarrow as pa
+
+    tipos = {"int64": pa.int64(), "int8": pa.int8(), "float64": pa.float64(), "texto": pa.string(),
+             "data": pa.timestamp("s"), "bool": pa.bool_()}
+    return pa.schema([(nome, tipos[tipo]) for nome, _, tipo in colunas])
+
+
+def lote_arrow(linhas, colunas, esquema):
+    """RecordBatch tipado de um lote de tuplas do SQLite"""
+    import pyarrow as pa
+    import pyarrow.compute as pc
+
+    arrays = []
+    for (nome, _, tipo), valores in zip(colunas, zip(*linhas)):
+        if tipo == "data":
+            # Texto ISO com ou sem hora ('2024-08-06' do gerar_sinteticos, '2024-08-06 10:00:00' do app)
+            texto = pa.array(valores, pa.string())
+            arrays.append(pc.coalesce(pc.strptime(texto, "%Y-%m-%d %H:%M:%S", "s", error_is_null=True),
+                                      pc.strptime(texto, "%Y-%m-%d", "s", error_is_null=True)))
+        elif tipo == "bool":
+            arrays.append(pa.array([None if v is None else bool(v) for v in valores], pa.bool_()))
+        else:
+            arrays.append(pa.array(valores, esquema.field(nome).type))
+    return pa.RecordBatch.from_arrays(arrays, schema=esquema)
+
+
+class EscritorParquet:
+    """Um row group por lote, zstd"""
+
+    def __init__(self, caminho, colunas):
+        import pyarrow.parquet as pq
+
+        self.colunas = colunas
+        self.esquema = esquema_arrow(colunas)
+        self.escritor = pq.ParquetWriter(caminho, self.esquema, compression="zstd")
+
+    def escrever(self, linhas):
+        self.escritor.write_batch(lote_arrow(linhas, self.colunas, self.esquema))
+
+    def fechar(self):
+        self.escritor.close()
+
+
+class EscritorArrow:
+    """Arquivo Arrow IPC (Feather v2), um record batch por lote"""
+
+    def __init__(self, caminho, colunas):
+        import pyarrow as pa
+
+        self.colunas = colunas
+        self.esquema = esquema_arrow(colunas)
+        self.destino = pa.OSFile(caminho, "wb")
+        self.escritor = pa.ipc.new_file(self.destino, self.esquema)
+
+    def escrever(self, linhas):
+        self.escritor.write_batch(lote_arrow(linhas, self.colunas, self.esquema))
+
+    def fechar(self):
+        self.escritor.close()
+        self.destino.close()
+
+
+ESCRITORES = {"parquet": EscritorParquet, "arrow": EscritorArrow, "csv": EscritorCSV}
+
+
+# --- EXPORTAÇÃO ---
+
+def exportar(conn, conjunto, caminho, formato="parquet", tamanho_lote=TAMANHO_LOTE, com_texto=False, **filtros):
+    """Grava o resultado da consulta em `caminho`, lote a lote; devolve o número de linhas.
+
+    Escreve num temporário ao lado e troca de uma vez no fim: quem lê o
+    diretório (o BI, por exemplo) nunca vê um Parquet pela metade.
+    """
+    colunas = colunas_conjunto(conjunto, com_texto)
+    sql, parametros = montar_consulta(conjunto, com_texto=com_texto, **filtros)
+    temporario = f"{caminho}.tmp"
+    escritor = ESCRITORES[formato](temporario, colunas)
+    linhas = 0
+    try:
+        with cronometro("exportacao", conjunto=conjunto, formato=formato):
+            cursor = conn.execute(sql, parametros)
+            while lote := cursor.fetchmany(tamanho_lote):
+                escritor.escrever(lote)
+                linhas += len(lote)
+    except BaseException:
+        # A limpeza não pode trocar o erro original por outro (fechar um Parquet
+        # depois de um lote rejeitado, por exemplo, pode falhar também)
+        try:
+            escritor.fechar()
+        except Exception as e:
+            print(f"   [AVISO] Falha ao fechar {temporario}: {e}")
+        try:
+            os.remove(temporario)
+        except OSError:
+            pass
+        raise
+    escritor.fechar()
+    os.replace(temporario, caminho)
+    contar("linhas_exportadas", linhas, conjunto=conjunto, formato=formato)
+    return linhas
+
+
+def exportar_incremental(conn, conjunto, formato="parquet", nome=None, caminho=None,
+                         diretorio=DIRETORIO_EXPORTACOES, tamanho_lote=TAMANHO_LOTE, com_texto=False, **filtros):
+    """Só as linhas com id acima da marca de `nome` (padrão: o conjunto), num arquivo novo por execução.
+
+    A marca vai até o MAX(id) lido antes da consulta: linhas gravadas durante a
+    exportação ficam para a próxima. Alterações em linhas antigas (validação do
+    farmacêutico, por exemplo) não reaparecem: o incremental segue o id.
+
+    Remoções aparecem: o --reprocessar do pipeline e o backfill apagam os
+    alertas da faixa e os regravam com ids novos. Quando há menos linhas até a
+    marca do que na última exportação, a parte sai completa (desde o id 1, com
+    "completo" no nome) e substitui todas as anteriores; sem isso, os alertas
+    regravados chegariam em dobro e os apagados nunca sairiam do destino.
+    Devolve (caminho, linhas), com caminho None se não havia nada novo.
+    Espera o banco já migrado (preparar_banco).
+    """
+    nome = nome or conjunto
+    linha = conn.execute("SELECT ultimo_id, filtros, linhas_cobertas FROM controle_exportacao WHERE nome = ?",
+                         (nome,)).fetchone()
+    apos_id = linha[0] if linha else 0
+    completo = bool(linha and linha[2] is not None and linhas_ate(conn, conjunto, apos_id) < linha[2])
+    if completo:
+        print(f"   [AVISO] {linha[2] - linhas_ate(conn, conjunto, apos_id)} linhas já exportadas em '{nome}' "
+              f"foram removidas (reprocessamento?): esta parte é completa e substitui as anteriores.")
+        apos_id = 0
+    filtros_json = json.dumps({**{k: str(v) for k, v in filtros.items() if v is not None}, "com_texto": com_texto},
+                              sort_keys=True)
+    if linha and linha[1] != filtros_json:
+        print(f"   [AVISO] Filtros diferentes da última exportação '{nome}' ({linha[1]}): "
+              f"as partes anteriores não seguem os filtros atuais.")
+    ate_id = ultimo_id_tabela(conn, conjunto)
+    if ate_id <= apos_id:
+        return None, 0
+    # Contada antes da consulta, como a marca: uma remoção durante a exportação aparece na próxima
+    cobertas = linhas_ate(conn, conjunto, ate_id)
+    if caminho is None:
+        os.makedirs(diretorio, exist_ok=True)
+        parte = f"completo-{ate_id}" if completo else f"{apos_id + 1}-{ate_id}"
+        caminho = os.path.join(diretorio, f"{nome}-{parte}{FORMATOS[formato]}")
+    linhas = exportar(conn, conjunto, caminho, formato, tamanho_lote, com_texto,
+                      apos_id=apos_id, ate_id=ate_id, **filtros)
+    # A marca só avança depois que o arquivo está no lugar
+    with conn:
+        conn.execute("""INSERT INTO controle_exportacao (nome, conjunto, ultimo_id, filtros, arquivo, linhas,
+                                                         linhas_cobertas, atualizado_em)
+                        VALUES (?, ?, ?, ?, ?, ?, ?, datetime('now'))
+                        ON CONFLICT(nome) DO UPDATE SET ultimo_id = excluded.ultimo_id, filtros = excluded.filtros,
+                            arquivo = excluded.arquivo, linhas = excluded.linhas,
+                            linhas_cobertas = excluded.linhas_cobertas, atualizado_em = excluded.atualizado_em""",
+                     (nome, conjunto, ate_id, filtros_json, caminho, linhas, cobertas))
+    return caminho, linhas
+
+
+def exportar_bytes(conjunto, formato="csv", arquivo_db=ARQUIVO_DB, **filtros):
+    """Conteúdo do arquivo exportado (botão de download do app.py, que precisa dos bytes).
+
+    Conexão própria: o Streamlit chama a função numa thread separada do rerun.
+    """
+    conn = conectar(arquivo_db)
+    try:
+        with tempfile.TemporaryDirectory() as diretorio:
+            caminho = os.path.join(diretorio, f"{conjunto}{FORMATOS[formato]}")
+            exportar(conn, conjunto, caminho, formato, **filtros)
+            with open(caminho, "rb") as f:
+                return f.read()
+    finally:
+        conn.close()
+
+
+# --- CLI ---
+
+def data_iso(texto):
+    return date.fromisoformat(texto)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Exporta intervenções e alertas em Parquet, Arrow ou CSV")
+    parser.add_argument("conjunto", choices=list(CONJUNTOS))
+    parser.add_argument("--formato", choices=list(FORMATOS), default="parquet")
+    parser.add_argument("--saida", help=f"Arquivo de destino (padrão: {DIRETORIO_EXPORTACOES}/...)")
+    parser.add_argument("--de", type=data_iso, metavar="AAAA-MM-DD", help="Data inicial (inclusive)")
+    parser.add_argument("--ate", type=data_iso, metavar="AAAA-MM-DD", help="Data final (inclusive)")
+    parser.add_argument("--grau-min", type=int)
+    parser.add_argument("--grau-max", type=int)
+    parser.add_argument("--com-texto", action="store_true", help="Inclui a evolução (só alertas)")
+    parser.add_argument("--incremental", action="store_true",
+                        help="Só o que entrou desde a última exportação incremental com o mesmo --nome")
+    parser.add_argument("--nome", help="Nome da marca do incremental (padrão: o conjunto)")
+    parser.add_argument("--lote", type=int, default=TAMANHO_LOTE, help="Linhas por lote")
+    parser.add_argument("--db", default=ARQUIVO_DB)
+    args = parser.parse_args()
+
+    preparar_banco(args.db)
+    conn = conectar(args.db)
+    filtros = {"de": args.de, "ate": args.ate, "grau_min": args.grau_min, "grau_max": args.grau_max}
+    t0 = time.perf_counter()
+    if args.incremental:
+        caminho, linhas = exportar_incremental(conn, args.conjunto, args.formato, args.nome, args.saida,
+                                               tamanho_lote=args.lote, com_texto=args.com_texto, **filtros)
+    else:
+        caminho = args.saida
+        if caminho is None:
+            os.makedirs(DIRETORIO_EXPORTACOES, exist_ok=True)
+            caminho = os.path.join(DIRETORIO_EXPORTACOES, f"{args.conjunto}-{datetime.now():%Y%m%d-%H%M%S}"
+                                                          f"{FORMATOS[args.formato]}")
+        linhas = exportar(conn, args.conjunto, caminho, args.formato, args.lote, args.com_texto, **filtros)
+    unidades = contar_unidades(conn, args.conjunto, **filtros) if caminho and not args.incremental else None
+    conn.close()
+    duracao = time.perf_counter() - t0
+
+    if caminho is None:
+        print(">>> Nada novo desde a última exportação.")
+        return
+    print(f">>> {linhas} linhas em {caminho} ({os.path.getsize(caminho) / 2**20:.1f} MB) em {duracao:.1f}s "
+          f"({linhas / max(duracao, 1e-9):,.0f} linhas/s)")
+    if unidades is not None:
+        print(f"   ... {unidades} prontuários com alerta (uma linha por par medicamento x reação)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,282 @@
+import argparse
+import json
+import os
+import re
+import time
+
+from esquema_banco import ARQUIVO_DB, conectar
+from metricas import contar, cronometro
+from regras_ctcae import GATILHOS_NEGACAO, JANELA_NEGACAO, montar_arvore, normalizar_termo, tokenizar, varrer
+
+# --- LÉXICOS PADRÃO ---
+# Nome canônico -> formas encontradas nas evoluções (o canônico também vale como forma).
+# A comparação é sem acento e sem caixa, pela mesma árvore de tokens do regras_ctcae.py;
+# siglas curtas escritas em maiúsculas aqui ("AC") só valem em maiúsculas no texto.
+# Fica de fora "TC" (docetaxel + ciclofosfamida): nas evoluções é quase sempre tomografia.
+MEDICAMENTOS = {
+    "Cisplatina": ["cddp"],
+    "Carboplatina": ["carbo"],
+    "Oxaliplatina": ["oxali"],
+    "Paclitaxel": ["ptx", "taxol"],
+    "Docetaxel": ["taxotere"],
+    "Trastuzumabe": ["trastuzumab", "herceptin"],
+    "Pertuzumabe": ["pertuzumab"],
+    "Pembrolizumabe": ["pembrolizumab", "keytruda"],
+    "Nivolumabe": ["nivolumab", "opdivo"],
+    "Bevacizumabe": ["bevacizumab", "avastin"],
+    "Cetuximabe": ["cetuximab"],
+    "Rituximabe": ["rituximab"],
+    "Capecitabina": ["xeloda"],
+    "Fluorouracil": ["5-fu", "5fu", "5 fluorouracil"],
+    "Irinotecano": ["irinotecan", "cpt-11"],
+    "Gencitabina": ["gemcitabina"],
+    "Doxorrubicina": ["adriamicina", "doxorrubicina lipossomal"],
+    "Ciclofosfamida": ["endoxan"],
+    "Etoposideo": ["etoposido", "vp-16"],
+    "Vincristina": ["oncovin"],
+    "Metotrexato": ["mtx"],
+    "Tamoxifeno": [],
+    "Anastrozol": [],
+    "Letrozol": [],
+    "Imatinibe": ["imatinib", "glivec"],
+}
+# Esquemas de quimioterapia entram como medicamento com o nome do esquema
+REGIMES = {
+    "FOLFOX": ["mfolfox6", "folfox6"],
+    "FOLFIRI": [],
+    "FOLFIRINOX": [],
+    "CAPOX": ["xelox"],
+    "R-CHOP": ["rchop"],
+    "CHOP": [],
+    "AC": [],
+    "AC-T": ["ac-tc"],
+    "EC": [],
+    "ABVD": [],
+}
+# Siglas de esquema que também são estadiamento ("Ca Mama EC IIB"): só valem depois de uma
+# palavra de esquema ou de um ciclo ("esquema EC", "C3 de AC", "QT com AC"); "AC-T" não precisa
+REGIMES_AMBIGUOS = {"AC", "EC"}
+CONTEXTO_REGIME = {"esquema", "protocolo", "regime", "qt", "quimioterapia", "ciclo", "ciclos"}
+_PADRAO_CICLO = re.compile(r"[cd]\d+$")   # C3, D1
+_CONECTIVOS = {"de", "do", "da", "com", "o", "a"}
+# Termos preferidos (estilo MedDRA PT, em português) -> formas nas evoluções
+REACOES = {
+    "Náusea": ["enjoo"],
+    "Vômito": ["emese"],
+    "Diarreia": ["diarreia liquida", "evacuacoes liquidas"],
+    "Desidratação": [],
+    "Neutropenia febril": [],
+    "Neutropenia": [],
+    "Plaquetopenia": ["trombocitopenia"],
+    "Anemia": [],
+    "Sangramento digestivo": ["hemorragia digestiva"],
+    "Mucosite": ["mucosite oral", "estomatite"],
+    "Neuropatia periférica": ["parestesia", "formigamento nas maos", "formigamento", "neuropatia"],
+    "Rash cutâneo": ["rash", "erupcao cutanea", "exantema"],
+    "Síndrome mão-pé": ["sindrome mao pe", "eritrodisestesia palmo-plantar"],
+    "Reação anafilática": ["anafilaxia", "choque anafilatico"],
+    "Reação infusional": ["flushing", "rubor facial"],
+    "Insuficiência renal aguda": ["insuficiencia renal", "lesao renal aguda"],
+    "Dispneia": ["dispneia em repouso"],
+    "Fadiga": ["astenia", "cansaco"],
+    "Tontura": [],
+    "Febre": [],
+    "Sepse": ["choque septico"],
+    "Alopecia": [],
+    "Hepatotoxicidade": ["elevacao de transaminases"],
+    "Cardiotoxicidade": ["queda da fracao de ejecao"],
+    "Colite": [],
+    "Pneumonite": [],
+    "Hipotireoidismo": [],
+    "Fogachos": ["ondas de calor"],
+}
+
+LEXICO_EXTRACAO = os.environ.get("EXTRACAO_LEXICO", "")   # JSON {"medicamentos": {...}, "reacoes": {...}}
+MAX_PARES = 20           # Teto de linhas por nota (produto medicamentos x reações)
+# (nota, medicamentos esperados): o primeiro é o caso 1 de inserir_dados_teste.py
+EXEMPLOS_EXTRACAO = [
+    ("Paciente 45a, Ca Mama EC IIB. Retorna para C3 de AC. Relata que 2 dias após a última infusão "
+     "apresentou 7 episódios de vômito em 24h, necessitando hidratação venosa. Nega febre.", ["AC"]),
+    ("Estadio EC IIIA, inicia esquema EC.", ["EC"]),
+    ("Completou AC-T há 2 meses.", ["AC-T"]),
+]
+TAMANHO_BLOCO = 5000     # Alertas por transação no --preencher
+TAMANHO_SIGLA = 3        # Formas em maiúsculas até este tamanho exigem maiúsculas no texto
+
+
+def contexto_regime(tokens, i):
+    """Se um dos dois tokens antes de tokens[i] (pulando conectivos) é palavra de esquema ou ciclo"""
+    anteriores = [t for t in tokens[max(0, i - 3):i] if t not in _CONECTIVOS][-2:]
+    return any(t in CONTEXTO_REGIME or _PADRAO_CICLO.match(t) for t in anteriores)
+
+
+def carregar_lexicos(caminho):
+    """(medicamentos, reacoes) de um JSON no formato dos dicionários acima; regimes vão em medicamentos"""
+    with open(caminho, encoding="utf-8") as f:
+        lexicos = json.load(f)
+    return lexicos["medicamentos"], lexicos["reacoes"]
+
+
+class ExtratorRAM:
+    """Medicamentos e reações adversas citados numa nota, por dicionário.
+
+    Os dois léxicos vão para uma única árvore de tokens (a mesma do
+    MotorRegras, com negação): cada nota é tokenizada uma vez e cada token
+    custa uma consulta a dicionário. Nada passa pelo BioBERT, então a
+    extração não acrescenta forward pass ao pipeline e roda na casa das
+    dezenas de milhares de notas/s, muito acima da classificação.
+    Menções negadas ("nega náuseas", "sem mucosite") ficam de fora.
+    """
+
+    def __init__(self, medicamentos=None, reacoes=None, gatilhos_negacao=GATILHOS_NEGACAO,
+                 janela_negacao=JANELA_NEGACAO):
+        if medicamentos is None:
+            medicamentos = {**MEDICAMENTOS, **REGIMES}
+        reacoes = REACOES if reacoes is None else reacoes
+        termos, self.siglas = {}, set()
+        for tipo, lexico in (("medicamento", medicamentos), ("reacao", reacoes)):
+            for canonico, formas in lexico.items():
+                for forma in [canonico, *formas]:
+                    chave = normalizar_termo(forma)
+                    termos.setdefault(chave, (tipo, canonico))
+                    if forma.isupper() and len(forma.replace("-", "")) <= TAMANHO_SIGLA:
+                        self.siglas.add(chave)  # "AC", "EC": em minúsculas são palavras comuns
+        self.arvore = montar_arvore(termos, gatilhos_negacao)
+        self.janela_negacao = janela_negacao
+
+    def extrair(self, texto):
+        """(medicamentos, reações): nomes canônicos sem repetição, na ordem em que aparecem"""
+        tokens, achados = tokenizar(texto)
+        encontrados = {"medicamento": {}, "reacao": {}}
+        for i, k, termo, (tipo, canonico), negado in varrer(self.arvore, tokens, self.janela_negacao):
+            if negado:
+                continue
+            if termo in self.siglas and not texto[achados[i].start():achados[i + k - 1].end()].isupper():
+                continue
+            if canonico in REGIMES_AMBIGUOS and k == 1 and not contexto_regime(tokens, i):
+                continue
+            encontrados[tipo].setdefault(canonico, None)
+        return list(encontrados["medicamento"]), list(encontrados["reacao"])
+
+    def extrair_lote(self, textos):
+        return [self.extrair(t) for t in textos]
+
+
+def pares(medicamentos, reacoes, max_pares=MAX_PARES):
+    """Uma linha por par medicamento x reação; sem um dos lados, o outro vai com None"""
+    return [(m, r) for m in (medicamentos or [None]) for r in (reacoes or [None])][:max_pares]
+
+
+_extrator = None
+
+def extrator_padrao():
+    """ExtratorRAM do processo (léxico de EXTRACAO_LEXICO, se definido); montado no primeiro uso"""
+    global _extrator
+    if _extrator is None:
+        _extrator = ExtratorRAM(*carregar_lexicos(LEXICO_EXTRACAO)) if LEXICO_EXTRACAO else ExtratorRAM()
+    return _extrator
+
+
+def notas_com_alerta(linhas):
+    """Quantos prontuários as linhas cobrem: uma nota vira até MAX_PARES linhas, e é a nota que conta como alerta"""
+    return len({linha[0] for linha in linhas})
+
+
+def linhas_alertas(alertas, textos, extrator=None):
+    """[(prontuario_id, grau, confianca)] + textos -> linhas de alertas_ram com medicamento e reação"""
+    extrator = extrator or extrator_padrao()
+    with cronometro("extracao"):
+        entidades = extrator.extrair_lote(textos)
+    linhas = [(id_pct, medicamento, reacao, grau, confianca)
+              for (id_pct, grau, confianca), (medicamentos, reacoes) in zip(alertas, entidades)
+              for medicamento, reacao in pares(medicamentos, reacoes)]
+    contar("pares_extraidos", sum(m is not None or r is not None for _, m, r, _, _ in linhas))
+    return linhas
+
+
+def conferir_exemplos(extrator=None, exemplos=EXEMPLOS_EXTRACAO):
+    """[(nota, esperados, obtidos)] dos exemplos em que a extração erra os medicamentos (vazia = tudo certo)"""
+    extrator = extrator or extrator_padrao()
+    return [(texto, esperados, obtidos) for texto, esperados in exemplos
+            if (obtidos := extrator.extrair(texto)[0]) != esperados]
+
+
+# --- PREENCHIMENTO DOS ALERTAS ANTIGOS ---
+
+def preencher(conn, tamanho_bloco=TAMANHO_BLOCO, extrator=None):
+    """Completa os alertas gravados antes da extração (medicamento e reação nulos).
+
+    Paginação por chave sobre alertas_ram.id; cada bloco é uma transação. O
+    primeiro par de cada alerta atualiza a própria linha (mantém o id e a
+    validação do farmacêutico); os demais pares entram como linhas novas.
+    """
+    extrator = extrator or extrator_padrao()
+    ultimo, lidos, atualizados, inseridos = 0, 0, 0, 0
+    while True:
+        bloco = conn.execute("""SELECT a.id, a.prontuario_id, a.gravidade_ctcae, a.confianca_ia,
+                                       a.validado_farmaceutico, p.texto_clinico
+                                FROM alertas_ram a JOIN prontuarios p ON p.id = a.prontuario_id
+                                WHERE a.id > ? AND a.medicamento IS NULL AND a.reacao_adversa IS NULL
+                                ORDER BY a.id LIMIT ?""", (ultimo, tamanho_bloco)).fetchall()
+        if not bloco:
+            break
+        atualizacoes, novas = [], []
+        for (id_alerta, id_pct, grau, confianca, validado, _), (medicamentos, reacoes) in zip(
+                bloco, extrator.extrair_lote([texto for *_, texto in bloco])):
+            if not medicamentos and not reacoes:
+                continue
+            (medicamento, reacao), *resto = pares(medicamentos, reacoes)
+            atualizacoes.append((medicamento, reacao, id_alerta))
+            novas += [(id_pct, m, r, grau, confianca, validado) for m, r in resto]
+        with cronometro("db_escrita", tabela="alertas_ram"), conn:
+            conn.executemany("UPDATE alertas_ram SET medicamento = ?, reacao_adversa = ? WHERE id = ?",
+                             atualizacoes)
+            conn.executemany("INSERT INTO alertas_ram (prontuario_id, medicamento, reacao_adversa, "
+                             "gravidade_ctcae, confianca_ia, validado_farmaceutico) VALUES (?, ?, ?, ?, ?, ?)",
+                             novas)
+        ultimo = bloco[-1][0]
+        lidos += len(bloco)
+        atualizados += len(atualizacoes)
+        inseridos += len(novas)
+        print(f"   ... até o alerta #{ultimo}: {lidos} lidos, {atualizados} completados, {inseridos} pares novos")
+    return lidos, atualizados, inseridos
+
+
+# --- CLI ---
+
+def main():
+    parser = argparse.ArgumentParser(description="Extração de medicamentos e reações adversas (alertas_ram)")
+    parser.add_argument("texto", nargs="?", help="Mostra o que seria extraído de um texto")
+    parser.add_argument("--preencher", action="store_true",
+                        help="Completa os alertas já gravados sem medicamento/reação")
+    parser.add_argument("--conferir", action="store_true", help="Confere os EXEMPLOS_EXTRACAO (siglas ambíguas)")
+    parser.add_argument("--bloco", type=int, default=TAMANHO_BLOCO)
+    parser.add_argument("--db", default=ARQUIVO_DB)
+    args = parser.parse_args()
+
+    if args.texto:
+        medicamentos, reacoes = extrator_padrao().extrair(args.texto)
+        print(f"Medicamentos: {', '.join(medicamentos) or '-'}")
+        print(f"Reações:      {', '.join(reacoes) or '-'}")
+        for medicamento, reacao in pares(medicamentos, reacoes):
+            print(f"   {medicamento or '-'} -> {reacao or '-'}")
+    elif args.conferir:
+        erros = conferir_exemplos()
+        for texto, esperados, obtidos in erros:
+            print(f"   [ERRO] '{texto[:60]}...': {obtidos}, esperado {esperados}")
+        if not erros:
+            print(f"   [OK] {len(EXEMPLOS_EXTRACAO)} exemplos com os medicamentos esperados.")
+    elif args.preencher:
+        conn = conectar(args.db)
+        t0 = time.perf_counter()
+        lidos, atualizados, inseridos = preencher(conn, args.bloco)
+        conn.close()
+        duracao = time.perf_counter() - t0
+        print(f"\n>>> {lidos} alertas em {duracao:.1f}s ({lidos / max(duracao, 1e-9):,.0f}/s): "
+              f"{atualizados} completados, {inseridos} linhas novas.")
+    else:
+        parser.print_help()
+
+
+if __name__ == "__main__":
+    main()
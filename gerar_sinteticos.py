@@ -1,9 +1,25 @@
-import sqlite3
+import argparse
+import multiprocessing as mp
+import os
 import random
+import time
+from collections import deque
+from datetime import date, timedelta
+
+from esquema_banco import conectar, preparar_banco
 
 # --- CONFIGURAÇÃO ---
 QTD_CASOS = 300  # Aumentei para 300 para ter mais exemplos
 ARQUIVO_DB = 'oncologia_farmacovigilancia.db'
+SEMENTE = 42
+TAMANHO_BLOCO = 10_000     # Notas por tarefa de worker e por transação/row group
+MIX_PADRAO = {"grave": 0.33, "leve": 0.33, "normal": 0.34}
+NOTAS_POR_PACIENTE = 20    # Média, para o destino prontuarios (paciente_hash)
+# Apagadas junto com prontuarios (--substituir): apontam para prontuarios.id ou para o que já foi carregado
+DEPENDENTES_PRONTUARIOS = ["alertas_ram", "minhash_bandas", "minhash_assinaturas", "controle_pipeline",
+                           "backfill_shards", "ingestao_arquivos"]
+INICIO_SERIE = date(2023, 1, 1)
+DIAS_SERIE = 3 * 365       # As datas de importação se espalham por três anos
 
 # --- TEMPLATES (O Segredo da Calibragem) ---
 
@@ -43,45 +59,241 @@ templates_normais = [
     "Nega nauseas, nega vomitos, nega febre. Apto para infusao."
 ]
 
-def gerar_dataset():
-    conn = sqlite3.connect(ARQUIVO_DB)
-    cursor = conn.cursor()
-    
-    cursor.execute("DELETE FROM dados_treino")
-    
-    dados = []
-    print(f"Gerando {QTD_CASOS} novos prontuários calibrados...")
-    
-    for _ in range(QTD_CASOS):
-        dado_random = random.random()
-        
-        # 33% Graves
-        if dado_random < 0.33:
-            txt = random.choice(templates_graves).format(
-                sintoma=random.choice(sintomas_graves),
-                acao=random.choice(acoes_graves)
-            )
-            grau = random.choice([3, 4])
-            
-        # 33% Leves
-        elif dado_random < 0.66:
-            txt = random.choice(templates_leves).format(
-                sintoma=random.choice(sintomas_leves),
-                med_suporte=random.choice(meds_suporte)
-            )
-            grau = random.choice([1, 2])
-            
-        # 33% Normais (Garante que ele veja bastante caso "limpo")
+# --- VARIAÇÕES (escala) ---
+
+# Negação de sintomas: grau 0 que contém termos de toxicidade (casos difíceis para regras)
+templates_negacao = [
+    "Nega {sintoma}. Boa tolerancia ao ciclo anterior.",
+    "Sem {sintoma} desde a ultima infusao. Segue conduta.",
+    "Nao apresenta {sintoma} no momento. Liberado para quimio.",
+    "Paciente nega {sintoma} e nega febre. Apto para infusao.",
+    "Ausencia de {sintoma}. Exames sem alteracoes.",
+]
+
+# Contexto de tratamento que abre algumas notas (útil para extração de medicamentos)
+templates_contexto = [
+    "Em uso de {medicamento}.",
+    "C{ciclo} de {medicamento}.",
+    "D{dia} pos {medicamento}.",
+]
+medicamentos = ["Paclitaxel", "Cisplatina", "Carboplatina", "Doxorrubicina + Ciclofosfamida seguido de Paclitaxel",
+                "FOLFOX", "Capecitabina", "Docetaxel", "Trastuzumabe", "Pembrolizumabe", "Gencitabina"]
+
+# Forma por extenso -> abreviação usada nas evoluções reais
+ABREVIACOES = {
+    "Doxorrubicina + Ciclofosfamida seguido de Paclitaxel": "AC-T",
+    "Paclitaxel": "PTX",
+    "Paciente": "Pct",
+    "paciente": "pct",
+    "membros inferiores": "MMII",
+    "quimio": "QT",
+    "internacao hospitalar": "IH",
+    "hidratacao venosa": "HV",
+    "transferencia para UTI": "transf. UTI",
+    "sem necessidade": "s/ necessidade",
+    "com ": "c/ ",
+}
+
+
+class GeradorNotas:
+    """Sorteia notas sintéticas com um rng próprio (nunca o `random` global).
+
+    mix: fração de notas graves/leves/normais; negacao: fração das normais
+    escritas como negação de sintomas; abreviacoes: probabilidade de cada
+    forma por extenso virar abreviação; ruido: probabilidade de cada palavra
+    sofrer um erro de digitação (troca, omissão ou duplicação de letra).
+    """
+
+    def __init__(self, mix=None, negacao=0.2, abreviacoes=0.0, ruido=0.0, contexto=0.0):
+        mix = mix or MIX_PADRAO
+        total = sum(mix.values())
+        self.limite_grave = mix.get("grave", 0) / total
+        self.limite_leve = self.limite_grave + mix.get("leve", 0) / total
+        self.negacao = negacao
+        self.abreviacoes = abreviacoes
+        self.ruido = ruido
+        self.contexto = contexto
+
+    def nota(self, rng):
+        """(texto, grau_real)"""
+        dado = rng.random()
+        if dado < self.limite_grave:
+            txt = rng.choice(templates_graves).format(sintoma=rng.choice(sintomas_graves),
+                                                      acao=rng.choice(acoes_graves))
+            grau = rng.choice([3, 4])
+        elif dado < self.limite_leve:
+            txt = rng.choice(templates_leves).format(sintoma=rng.choice(sintomas_leves),
+                                                     med_suporte=rng.choice(meds_suporte))
+            grau = rng.choice([1, 2])
         else:
-            txt = random.choice(templates_normais)
-            grau = 0 # ZERO absoluto
-            
-        dados.append((txt, grau))
-    
-    cursor.executemany("INSERT INTO dados_treino (texto, grau_real) VALUES (?, ?)", dados)
-    conn.commit()
+            if rng.random() < self.negacao:
+                txt = rng.choice(templates_negacao).format(
+                    sintoma=rng.choice(sintomas_leves + sintomas_graves))
+            else:
+                txt = rng.choice(templates_normais)
+            grau = 0
+
+        if self.contexto and rng.random() < self.contexto:
+            txt = rng.choice(templates_contexto).format(medicamento=rng.choice(medicamentos),
+                                                        ciclo=rng.randint(1, 8), dia=rng.randint(1, 21)) + " " + txt
+        if self.abreviacoes:
+            for extenso, abreviado in ABREVIACOES.items():
+                if extenso in txt and rng.random() < self.abreviacoes:
+                    txt = txt.replace(extenso, abreviado)
+        if self.ruido:
+            txt = " ".join(self._digitar(p, rng) if len(p) > 3 and rng.random() < self.ruido else p
+                           for p in txt.split(" "))
+        return txt, grau
+
+    @staticmethod
+    def _digitar(palavra, rng):
+        i = rng.randrange(len(palavra) - 1)
+        erro = rng.randrange(3)
+        if erro == 0:
+            return palavra[:i] + palavra[i + 1] + palavra[i] + palavra[i + 2:]  # troca
+        if erro == 1:
+            return palavra[:i] + palavra[i + 1:]  # omissão
+        return palavra[:i] + palavra[i] + palavra[i:]  # duplicação
+
+
+# --- GERAÇÃO EM BLOCOS (PARALELA E REPRODUZÍVEL) ---
+
+def gerar_bloco(tarefa):
+    """Linhas (paciente_hash, texto, data_importacao, grau_real) de um bloco.
+
+    O rng do bloco é semeado por (semente, índice do bloco): a saída é a mesma
+    com 1 ou N workers, e qualquer bloco pode ser refeito isoladamente.
+    """
+    indice, tamanho, semente, opcoes, n_pacientes = tarefa
+    rng = random.Random(f"{semente}:{indice}")
+    gerador = GeradorNotas(**opcoes)
+    linhas = []
+    for _ in range(tamanho):
+        texto, grau = gerador.nota(rng)
+        paciente = f"PT_SIM_{rng.randrange(n_pacientes):07d}"
+        data = (INICIO_SERIE + timedelta(days=rng.randrange(DIAS_SERIE))).isoformat()
+        linhas.append((paciente, texto, data, grau))
+    return linhas
+
+
+def gerar_blocos(qtd, semente=SEMENTE, opcoes=None, workers=1, tamanho_bloco=TAMANHO_BLOCO):
+    """Gera os blocos em ordem; com workers > 1, no máximo 2 blocos por worker ficam em memória"""
+    n_pacientes = max(1, qtd // NOTAS_POR_PACIENTE)
+    tarefas = ((i, min(tamanho_bloco, qtd - inicio), semente, opcoes or {}, n_pacientes)
+               for i, inicio in enumerate(range(0, qtd, tamanho_bloco)))
+    if workers <= 1:
+        yield from map(gerar_bloco, tarefas)
+        return
+    # spawn: mesmo comportamento no Windows e no Linux
+    with mp.get_context("spawn").Pool(workers) as pool:
+        pendentes = deque(pool.apply_async(gerar_bloco, (t,)) for _, t in zip(range(2 * workers), tarefas))
+        while pendentes:
+            linhas = pendentes.popleft().get()
+            proxima = next(tarefas, None)
+            if proxima is not None:
+                pendentes.append(pool.apply_async(gerar_bloco, (proxima,)))
+            yield linhas
+
+
+# --- DESTINOS ---
+
+def banco_producao(arquivo_db):
+    return os.path.abspath(arquivo_db) == os.path.abspath(ARQUIVO_DB)
+
+
+def gravar_sqlite(blocos, tabela="dados_treino", anexar=False, arquivo_db=ARQUIVO_DB):
+    """Uma transação por bloco; a memória não cresce com o total de linhas.
+
+    Sem `anexar`, a tabela é esvaziada antes. Para prontuarios isso leva junto os
+    alertas, assinaturas e marcas d'água que apontam para ela, e só é aceito num
+    banco separado: o de produção guarda as notas clínicas reais.
+    """
+    if tabela == "prontuarios" and not anexar and banco_producao(arquivo_db):
+        raise ValueError(f"Substituir prontuarios exige um banco separado (--db), não {ARQUIVO_DB}")
+    preparar_banco(arquivo_db)  # Garante dados_treino com a coluna texto_clinico
+    conn = conectar(arquivo_db)
+    if not anexar:
+        existentes = {nome for (nome,) in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+        dependentes = DEPENDENTES_PRONTUARIOS if tabela == "prontuarios" else []
+        with conn:
+            for dependente in dependentes:
+                if dependente in existentes:
+                    conn.execute(f"DELETE FROM {dependente}")
+            conn.execute(f"DELETE FROM {tabela}")
+        if dependentes:
+            print(f"   [AVISO] {arquivo_db}: notas substituídas; alertas, assinaturas e marcas d'água apagados junto.")
+    total = 0
+    for linhas in blocos:
+        with conn:
+            if tabela == "dados_treino":
+                conn.executemany("INSERT INTO dados_treino (texto_clinico, grau_real) VALUES (?, ?)",
+                                 [(texto, grau) for _, texto, _, grau in linhas])
+            else:
+                conn.executemany("INSERT INTO prontuarios (paciente_hash, texto_clinico, data_importacao) "
+                                 "VALUES (?, ?, ?)", [(p, texto, d) for p, texto, d, _ in linhas])
+        total += len(linhas)
+        yield total
     conn.close()
+
+
+def gravar_parquet(blocos, caminho):
+    """Um row group por bloco via ParquetWriter (pyarrow)"""
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    esquema = pa.schema([("paciente_hash", pa.string()), ("texto_clinico", pa.string()),
+                         ("data_importacao", pa.string()), ("grau_real", pa.int8())])
+    total = 0
+    with pq.ParquetWriter(caminho, esquema, compression="zstd") as escritor:
+        for linhas in blocos:
+            colunas = list(zip(*linhas))
+            escritor.write_table(pa.Table.from_arrays([pa.array(c) for c in colunas], schema=esquema))
+            total += len(linhas)
+            yield total
+
+
+def gerar_dataset(qtd=QTD_CASOS, destino="dados_treino", semente=SEMENTE, workers=1,
+                  tamanho_bloco=TAMANHO_BLOCO, anexar=False, arquivo_parquet=None, arquivo_db=ARQUIVO_DB,
+                  substituir=False, **opcoes):
+    """dados_treino é substituída (salvo `anexar`); prontuarios recebe as notas no fim, salvo `substituir`"""
+    if destino == "prontuarios":
+        anexar = not substituir
+    blocos = gerar_blocos(qtd, semente, opcoes, workers, tamanho_bloco)
+    print(f"Gerando {qtd} novos prontuários calibrados...")
+    if destino == "parquet":
+        progresso = gravar_parquet(blocos, arquivo_parquet or "dados_sinteticos.parquet")
+    else:
+        progresso = gravar_sqlite(blocos, destino, anexar, arquivo_db)
+
+    inicio = time.perf_counter()
+    for total in progresso:
+        if qtd > tamanho_bloco:
+            print(f"   ... {total} de {qtd} ({total / (time.perf_counter() - inicio):.0f} notas/s)")
     print(">>> Sucesso! Base de dados recalibrada.")
 
+
 if __name__ == "__main__":
-    gerar_dataset()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Gera notas sintéticas (reprodutível, em paralelo e em blocos)")
+    parser.add_argument("--qtd", type=int, default=QTD_CASOS)
+    parser.add_argument("--destino", choices=["dados_treino", "prontuarios", "parquet"], default="dados_treino")
+    parser.add_argument("--arquivo", help="Caminho do .parquet (destino parquet)")
+    parser.add_argument("--db", default=ARQUIVO_DB, help="Banco SQLite de destino")
+    parser.add_argument("--anexar", action="store_true", help="dados_treino: não apaga as linhas existentes")
+    parser.add_argument("--substituir", action="store_true",
+                        help="prontuarios: apaga as notas (e alertas) existentes; só com --db de teste")
+    parser.add_argument("--semente", type=int, default=SEMENTE)
+    parser.add_argument("--workers", type=int, default=1)
+    parser.add_argument("--bloco", type=int, default=TAMANHO_BLOCO)
+    parser.add_argument("--mix", default="0.33,0.33,0.34", help="Frações grave,leve,normal")
+    parser.add_argument("--negacao", type=float, default=0.2, help="Fração das normais escritas como negação")
+    parser.add_argument("--abreviacoes", type=float, default=0.0, help="Probabilidade de abreviar (PTX, AC-T...)")
+    parser.add_argument("--ruido", type=float, default=0.0, help="Probabilidade de erro de digitação por palavra")
+    parser.add_argument("--contexto", type=float, default=0.0, help="Fração com frase de medicamento/ciclo")
+    args = parser.parse_args()
+    if args.destino == "prontuarios" and args.substituir and banco_producao(args.db):
+        parser.error(f"--substituir apagaria as notas reais de {ARQUIVO_DB}; use --db com um banco de teste")
+
+    grave, leve, normal = (float(x) for x in args.mix.split(","))
+    gerar_dataset(args.qtd, args.destino, args.semente, args.workers, args.bloco, args.anexar, args.arquivo,
+                  args.db, args.substituir, mix={"grave": grave, "leve": leve, "normal": normal},
+                  negacao=args.negacao, abreviacoes=args.abreviacoes, ruido=args.ruido, contexto=args.contexto)
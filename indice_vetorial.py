@@ -0,0 +1,332 @@
+import argparse
+import json
+import os
+import shutil
+import time
+
+import numpy as np
+
+from esquema_banco import conectar
+from registro_modelos import ClassificadorRegistrado, campos_diferentes, configuracao_features, manifesto_legado
+
+# --- CONFIGURAÇÃO ---
+ARQUIVO_DB = 'oncologia_farmacovigilancia.db'
+DIRETORIO_INDICES = "dados/indices"
+# O índice usa as features do classificador ativo (max_length, pooling, janelas,
+# gravadas no meta.json): o dashboard reaproveita o vetor que já calculou para
+# classificar a nota como consulta, sem um segundo forward pass.
+TAMANHO_BLOCO_BUSCA = 65536   # Linhas por multiplicação na busca exata
+BITS_LSH = 12                 # Bits por tabela de hash (2^12 baldes)
+TABELAS_LSH = 8               # Tabelas independentes: mais tabelas = mais recall, mais candidatos
+FRACAO_CAUDA = 0.1            # Recompacta os baldes quando a parte não indexada passa disso
+
+# Consultas de texto de cada tabela indexável
+CONSULTAS_TABELA = {
+    "prontuarios": "SELECT id, texto_clinico FROM prontuarios WHERE id > ? ORDER BY id LIMIT ?",
+    "dados_treino": "SELECT id, texto_clinico FROM dados_treino WHERE id > ? ORDER BY id LIMIT ?",
+}
+
+
+def normalizar_l2(vetores):
+    vetores = np.atleast_2d(np.asarray(vetores, dtype=np.float32))
+    normas = np.linalg.norm(vetores, axis=1, keepdims=True)
+    return vetores / np.maximum(normas, 1e-12)
+
+
+class IndiceVetorial:
+    """Índice de vizinhos mais próximos (cosseno) sobre embeddings em disco.
+
+    Os vetores normalizados ficam num arquivo binário lido por np.memmap, então
+    abrir o índice não carrega a matriz na memória e `adicionar` só acrescenta
+    ao final dos arquivos. Dois modos de busca:
+
+    - exato: produto escalar em blocos de TAMANHO_BLOCO_BUSCA linhas;
+    - aproximado: LSH por projeções aleatórias (TABELAS_LSH tabelas de
+      BITS_LSH bits); só os vetores que caem no mesmo balde da consulta em
+      alguma tabela são reordenados pelo cosseno exato. Os baldes ficam em
+      listas invertidas (índices ordenados por código + offsets); o que foi
+      adicionado depois da última compactação é varrido linearmente até a
+      cauda passar de FRACAO_CAUDA do índice.
+
+    float32 é o padrão porque a conversão de float16 domina a busca exata;
+    float16 corta o disco pela metade quando a busca for quase toda aproximada.
+    """
+
+    def __init__(self, diretorio, dimensao=768, dtype="float32", bits=BITS_LSH, tabelas=TABELAS_LSH, seed=42,
+                 features=None):
+        self.diretorio = diretorio
+        os.makedirs(diretorio, exist_ok=True)
+        self.caminho_meta = os.path.join(diretorio, "meta.json")
+        if os.path.exists(self.caminho_meta):
+            with open(self.caminho_meta) as f:
+                self.meta = json.load(f)
+        else:
+            self.meta = {"dimensao": dimensao, "dtype": dtype, "bits": bits, "tabelas": tabelas,
+                         "n": 0, "n_compactado": 0, "features": features}
+            planos = np.random.default_rng(seed).standard_normal((dimensao, bits * tabelas)).astype(np.float32)
+            np.save(os.path.join(diretorio, "planos.npy"), planos)
+            self._gravar_meta()
+        self.planos = np.load(os.path.join(diretorio, "planos.npy"))
+        self._pesos_bits = (1 << np.arange(self.meta["bits"], dtype=np.uint32)).astype(np.uint32)
+        self._abrir()
+
+    # --- arquivos ---
+
+    def _caminho(self, nome):
+        return os.path.join(self.diretorio, nome)
+
+    def _gravar_meta(self):
+        temporario = self.caminho_meta + ".tmp"
+        with open(temporario, "w") as f:
+            json.dump(self.meta, f)
+        os.replace(temporario, self.caminho_meta)  # troca atômica: leitores nunca veem meta pela metade
+
+    def _abrir(self):
+        n, d = self.meta["n"], self.meta["dimensao"]
+        self._mtime = os.path.getmtime(self.caminho_meta)
+        if n == 0:
+            self.vetores = np.zeros((0, d), dtype=self.meta["dtype"])
+            self.ids = np.zeros(0, dtype=np.int64)
+            self.codigos = np.zeros((0, self.meta["tabelas"]), dtype=np.uint16)
+            self.baldes_ordem = self.baldes_offsets = None
+            return
+        self.vetores = np.memmap(self._caminho("vetores.bin"), dtype=self.meta["dtype"], mode="r", shape=(n, d))
+        self.ids = np.memmap(self._caminho("ids.bin"), dtype=np.int64, mode="r", shape=(n,))
+        self.codigos = np.memmap(self._caminho("codigos.bin"), dtype=np.uint16, mode="r",
+                                 shape=(n, self.meta["tabelas"]))
+        if self.meta["n_compactado"]:
+            self.baldes_ordem = np.load(self._caminho("baldes_ordem.npy"), mmap_mode="r")
+            self.baldes_offsets = np.load(self._caminho("baldes_offsets.npy"))
+        else:
+            self.baldes_ordem = self.baldes_offsets = None
+
+    def recarregar_se_mudou(self):
+        """Reabre os memmaps se outro processo acrescentou vetores"""
+        if os.path.getmtime(self.caminho_meta) != self._mtime:
+            with open(self.caminho_meta) as f:
+                self.meta = json.load(f)
+            self._abrir()
+
+    def __len__(self):
+        return self.meta["n"]
+
+    @property
+    def features(self):
+        """Configuração dos vetores indexados; índices sem ela são do CLS de 128 tokens de antes do registro"""
+        return self.meta.get("features") or manifesto_legado()["features"]
+
+    @property
+    def ultimo_id(self):
+        return int(self.ids[-1]) if len(self) else 0
+
+    # --- escrita ---
+
+    def _hash(self, vetores):
+        """Código LSH (um uint16 por tabela) de cada vetor: sinal das projeções empacotado em bits"""
+        bits = (vetores @ self.planos) > 0
+        bits = bits.reshape(len(vetores), self.meta["tabelas"], self.meta["bits"])
+        return (bits * self._pesos_bits).sum(axis=2).astype(np.uint16)
+
+    def _bytes_por_linha(self):
+        return {"vetores.bin": self.meta["dimensao"] * np.dtype(self.meta["dtype"]).itemsize,
+                "ids.bin": np.dtype(np.int64).itemsize,
+                "codigos.bin": self.meta["tabelas"] * np.dtype(np.uint16).itemsize}
+
+    def _descartar_sobras(self):
+        """Corta dos .bin o que passa de meta["n"] linhas.
+
+        Uma escrita interrompida entre os .bin e o meta deixa bytes a mais no
+        fim; sem o corte, o próximo acréscimo ficaria desalinhado do meta e a
+        busca devolveria ids trocados. Só quem escreve corta (um leitor cortaria
+        o acréscimo em andamento de outro processo).
+        """
+        n = self.meta["n"]
+        for nome, tamanho in self._bytes_por_linha().items():
+            caminho = self._caminho(nome)
+            if os.path.exists(caminho) and os.path.getsize(caminho) > n * tamanho:
+                print(f"   [AVISO] {nome}: descartando {os.path.getsize(caminho) - n * tamanho} bytes "
+                      f"de uma escrita interrompida.")
+                os.truncate(caminho, n * tamanho)
+
+    def adicionar(self, ids, vetores):
+        """Acrescenta vetores (normalizados aqui) ao final do índice; o meta é gravado por último"""
+        self._descartar_sobras()
+        vetores = normalizar_l2(vetores)
+        ids = np.asarray(ids, dtype=np.int64)
+        with open(self._caminho("vetores.bin"), "ab") as f:
+            f.write(vetores.astype(self.meta["dtype"]).tobytes())
+        with open(self._caminho("ids.bin"), "ab") as f:
+            f.write(ids.tobytes())
+        with open(self._caminho("codigos.bin"), "ab") as f:
+            f.write(self._hash(vetores).tobytes())
+        self.meta["n"] += len(ids)
+        self._gravar_meta()
+        self._abrir()
+        if len(self) - self.meta["n_compactado"] > FRACAO_CAUDA * len(self):
+            self.compactar()
+
+    def compactar(self):
+        """Reconstrói as listas invertidas dos baldes LSH cobrindo todos os vetores atuais"""
+        n, tabelas, baldes = len(self), self.meta["tabelas"], 1 << self.meta["bits"]
+        codigos = np.asarray(self.codigos)
+        ordem = np.empty((tabelas, n), dtype=np.int32)
+        offsets = np.empty((tabelas, baldes + 1), dtype=np.int64)
+        for t in range(tabelas):
+            ordem[t] = np.argsort(codigos[:, t], kind="stable")
+            offsets[t, 0] = 0
+            offsets[t, 1:] = np.cumsum(np.bincount(codigos[:, t], minlength=baldes))
+        # Grava em arquivos novos e troca: um leitor com os antigos abertos não é afetado
+        np.save(self._caminho("baldes_ordem.tmp.npy"), ordem)
+        np.save(self._caminho("baldes_offsets.tmp.npy"), offsets)
+        os.replace(self._caminho("baldes_ordem.tmp.npy"), self._caminho("baldes_ordem.npy"))
+        os.replace(self._caminho("baldes_offsets.tmp.npy"), self._caminho("baldes_offsets.npy"))
+        self.meta["n_compactado"] = n
+        self._gravar_meta()
+        self._abrir()
+
+    # --- busca ---
+
+    def _buscar_exato(self, consultas, k, bloco):
+        melhores_idx = np.zeros((len(consultas), 0), dtype=np.int64)
+        melhores_sim = np.zeros((len(consultas), 0), dtype=np.float32)
+        for inicio in range(0, len(self), bloco):
+            sims = consultas @ np.asarray(self.vetores[inicio:inicio + bloco], dtype=np.float32).T
+            kk = min(k, sims.shape[1])
+            parciais = np.argpartition(-sims, kk - 1, axis=1)[:, :kk]
+            melhores_idx = np.hstack([melhores_idx, parciais + inicio])
+            melhores_sim = np.hstack([melhores_sim, np.take_along_axis(sims, parciais, axis=1)])
+            if melhores_idx.shape[1] > k:
+                manter = np.argpartition(-melhores_sim, k - 1, axis=1)[:, :k]
+                melhores_idx = np.take_along_axis(melhores_idx, manter, axis=1)
+                melhores_sim = np.take_along_axis(melhores_sim, manter, axis=1)
+        return melhores_idx, melhores_sim
+
+    def _buscar_aproximado(self, consultas, k):
+        codigos_consulta = self._hash(consultas)
+        idx_saida = np.full((len(consultas), k), -1, dtype=np.int64)
+        sim_saida = np.full((len(consultas), k), -np.inf, dtype=np.float32)
+        m = self.meta["n_compactado"]
+        for q, codigo in enumerate(codigos_consulta):
+            partes = []
+            if m:
+                for t, c in enumerate(codigo):
+                    partes.append(self.baldes_ordem[t, self.baldes_offsets[t, c]:self.baldes_offsets[t, c + 1]])
+            # Cauda ainda não compactada: varredura linear
+            partes.append(m + np.flatnonzero((self.codigos[m:] == codigo).any(axis=1)))
+            candidatos = np.unique(np.concatenate(partes)).astype(np.int64)
+            # Baldes recompactados por outro processo podem citar vetores que este ainda não abriu
+            candidatos = candidatos[candidatos < len(self)]
+            if len(candidatos) == 0:
+                continue
+            sims = np.asarray(self.vetores[candidatos], dtype=np.float32) @ consultas[q]
+            kk = min(k, len(candidatos))
+            melhores = np.argpartition(-sims, kk - 1)[:kk]
+            idx_saida[q, :kk] = candidatos[melhores]
+            sim_saida[q, :kk] = sims[melhores]
+        return idx_saida, sim_saida
+
+    def buscar(self, consultas, k=5, modo="exato", bloco=TAMANHO_BLOCO_BUSCA):
+        """Retorna (ids, similaridades), cada um (n_consultas, k), do mais para o menos parecido.
+
+        No modo aproximado, posições sem candidato suficiente vêm com id -1.
+        """
+        consultas = normalizar_l2(consultas)
+        if len(self) == 0:
+            return np.full((len(consultas), 0), -1, dtype=np.int64), np.zeros((len(consultas), 0), np.float32)
+        k = min(k, len(self))
+        if modo == "exato":
+            idx, sims = self._buscar_exato(consultas, k, bloco)
+        elif modo == "aproximado":
+            idx, sims = self._buscar_aproximado(consultas, k)
+        else:
+            raise ValueError(f"Modo de busca desconhecido: {modo}")
+        ordem = np.argsort(-sims, axis=1)
+        idx, sims = np.take_along_axis(idx, ordem, axis=1), np.take_along_axis(sims, ordem, axis=1)
+        ids = np.where(idx >= 0, np.asarray(self.ids)[np.maximum(idx, 0)], -1)
+        return ids, sims
+
+
+def abrir_indice(tabela="prontuarios", dimensao=768, features=None):
+    """Com `features`, um índice gerado com outra configuração é apagado e recomeça vazio"""
+    diretorio = os.path.join(DIRETORIO_INDICES, tabela)
+    if features is not None and os.path.exists(os.path.join(diretorio, "meta.json")):
+        diferentes = campos_diferentes(IndiceVetorial(diretorio).features, features)
+        if diferentes:
+            print(f"   [AVISO] Índice de {tabela} gerado com outro {', '.join(diferentes)}: reconstruindo.")
+            shutil.rmtree(diretorio)
+    indice = IndiceVetorial(diretorio, dimensao=dimensao, features=features)
+    if features is not None and indice.meta.get("features") is None:
+        indice.meta["features"] = features  # Índice antigo e compatível: passa a registrar a configuração
+        indice._gravar_meta()
+    return indice
+
+
+def atualizar_indice(indice, motor, tabela="prontuarios", tamanho_bloco=1000):
+    """Embeda e indexa só as linhas com id maior que o último já indexado"""
+    conn = conectar(ARQUIVO_DB)
+    total = 0
+    while True:
+        linhas = conn.execute(CONSULTAS_TABELA[tabela], (indice.ultimo_id, tamanho_bloco)).fetchall()
+        if not linhas:
+            break
+        indice.adicionar([i for i, _ in linhas], motor.gerar([t for _, t in linhas]))
+        total += len(linhas)
+        print(f"   ... indexados {total} (até #{linhas[-1][0]})")
+    conn.close()
+    return total
+
+
+def benchmark(n, dimensao, k, consultas=100):
+    """Latência e recall@k do modo aproximado contra o exato.
+
+    Vetores sintéticos em grupos de ~10 notas parecidas (cosseno ~0.95 dentro
+    do grupo), imitando evoluções do mesmo paciente/protocolo.
+    """
+    import tempfile
+    rng = np.random.default_rng(0)
+    centros = rng.standard_normal((max(1, n // 10), dimensao)).astype(np.float32)
+    with tempfile.TemporaryDirectory() as tmp:
+        indice = IndiceVetorial(tmp, dimensao=dimensao)
+        for inicio in range(0, n, 100_000):
+            m = min(100_000, n - inicio)
+            x = centros[rng.integers(0, len(centros), m)] + 0.25 * rng.standard_normal((m, dimensao), dtype=np.float32)
+            indice.adicionar(np.arange(inicio, inicio + m), x)
+        # Consultas = notas já indexadas com pequenas edições (o caso "evolução parecida")
+        alvos = rng.integers(0, n, consultas)
+        q = np.asarray(indice.vetores[alvos]) + 0.005 * rng.standard_normal((consultas, dimensao), dtype=np.float32)
+        resultados = {}
+        for modo in ("exato", "aproximado"):
+            tempos, ids = [], []
+            for v in q:
+                t0 = time.perf_counter()
+                ids.append(indice.buscar(v, k, modo)[0][0])
+                tempos.append((time.perf_counter() - t0) * 1000)
+            resultados[modo] = (np.percentile(tempos, 50), np.percentile(tempos, 99), ids)
+        recall = np.mean([len(set(a) & set(e)) / k for a, e in zip(resultados["aproximado"][2], resultados["exato"][2])])
+        print(f"{n:,} vetores x {dimensao} dims, top-{k}")
+        for modo in ("exato", "aproximado"):
+            p50, p99, _ = resultados[modo]
+            print(f"   {modo:<11} p50 {p50:7.2f} ms | p99 {p99:7.2f} ms")
+        print(f"   recall@{k} do aproximado: {recall * 100:.1f}%")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Índice de notas semelhantes (embeddings BioBERT)")
+    parser.add_argument("--atualizar", action="store_true", help="Indexa as notas novas da tabela")
+    parser.add_argument("--tabela", choices=list(CONSULTAS_TABELA), default="prontuarios")
+    parser.add_argument("--benchmark", type=int, metavar="N", help="Mede latência/recall com N vetores sintéticos")
+    parser.add_argument("--k", type=int, default=5)
+    args = parser.parse_args()
+
+    if args.atualizar:
+        from motor_embeddings import MotorEmbeddings, carregar_biobert
+        from cache_embeddings import CacheEmbeddings
+        # Vetores no mesmo espaço dos da classificação (as mesmas features do classificador ativo)
+        max_length = ClassificadorRegistrado().max_length
+        tokenizer, model = carregar_biobert()
+        motor = CacheEmbeddings(MotorEmbeddings(tokenizer, model, max_length=max_length))
+        indice = abrir_indice(args.tabela, motor.dimensao, configuracao_features(max_length))
+        novos = atualizar_indice(indice, motor, args.tabela)
+        print(f">>> {novos} notas novas indexadas; índice com {len(indice)} vetores.")
+    if args.benchmark:
+        benchmark(args.benchmark, 768, args.k)
@@ -0,0 +1,520 @@
+import argparse
+import asyncio
+import codecs
+import csv
+import gzip
+import hashlib
+import hmac
+import json
+import os
+import re
+import time
+import unicodedata
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from functools import lru_cache
+
+from esquema_banco import ARQUIVO_DB, conectar, preparar_banco
+from metricas import contar, cronometro, iniciar_exportadores
+
+# --- CONFIGURAÇÃO ---
+# Carga de exportações do prontuário eletrônico (CSV, JSONL, HL7 v2 em texto) em prontuarios.
+# Leitura e gravação correm em paralelo: uma thread lê e normaliza o próximo lote
+# enquanto a outra grava o anterior; a fila entre as duas tem MAX_LOTES_FILA lotes,
+# então a memória não cresce com o tamanho do arquivo.
+TAMANHO_LOTE = 20_000      # Registros por transação
+MAX_LOTES_FILA = 4         # Lotes lidos aguardando gravação
+AMOSTRA_CODIFICACAO = 1 << 20   # Bytes lidos para decidir entre UTF-8 e CP1252
+CHAVE_PACIENTE = os.environ.get("INGESTAO_CHAVE_PACIENTE", "")   # HMAC do identificador; obrigatória (ver --sem-chave)
+TAMANHO_HASH = 32          # Caracteres hexadecimais guardados em paciente_hash
+MAX_DIAS_FUTURO = 1        # Datas além de hoje + isso são rejeitadas
+ANO_MINIMO = 1900
+
+# Só nesta conexão e só durante a carga. Em WAL, synchronous=OFF não corrompe o
+# banco numa queda: no máximo perde os últimos lotes, que a retomada refaz.
+PRAGMAS_CARGA = {
+    "synchronous": "OFF",
+    "cache_size": -262144,          # 256 MB
+    "wal_autocheckpoint": 100_000,  # Páginas; o checkpoint final (TRUNCATE) devolve o espaço
+}
+
+# Nomes aceitos para cada coluna (sem caixa); --col-* sobrepõe. paciente_hash fica de fora:
+# já é pseudônimo, e passar pelo HMAC de novo o separaria das linhas que o paciente já tem.
+COLUNAS = {
+    "paciente": ("paciente_id", "id_paciente", "paciente", "prontuario", "patient_id", "mrn"),
+    "texto": ("texto_clinico", "texto", "evolucao", "nota", "descricao", "note_text", "text"),
+    "data": ("data_atendimento", "data_evolucao", "data", "data_hora", "data_importacao", "date", "datetime"),
+}
+FORMATOS = ("csv", "jsonl", "hl7")
+EXTENSOES = {".csv": "csv", ".tsv": "csv", ".jsonl": "jsonl", ".ndjson": "jsonl", ".hl7": "hl7"}
+
+# Tabela ingestao_arquivos (ponto de retomada por arquivo): migração 7 de esquema_banco.py.
+
+
+# --- NORMALIZAÇÃO ---
+
+@lru_cache(maxsize=200_000)
+def hash_paciente(identificador, chave=CHAVE_PACIENTE):
+    """Pseudônimo estável do paciente; o identificador original nunca chega ao banco"""
+    bruto = identificador.strip().encode("utf-8")
+    if chave:
+        return hmac.new(chave.encode("utf-8"), bruto, hashlib.sha256).hexdigest()[:TAMANHO_HASH]
+    return hashlib.sha256(bruto).hexdigest()[:TAMANHO_HASH]
+
+
+_PADROES_DATA = [
+    re.compile(r"(\d{4})-(\d{2})-(\d{2})(?:[T ](\d{2}):(\d{2})(?::(\d{2}))?)?"),   # ISO
+    re.compile(r"(\d{2})/(\d{2})/(\d{4})(?: (\d{2}):(\d{2})(?::(\d{2}))?)?"),      # DD/MM/AAAA
+    re.compile(r"(\d{4})(\d{2})(\d{2})(?:(\d{2})(\d{2})(\d{2})?)?"),                # HL7 (AAAAMMDD[HHMM[SS]])
+]
+_LIMITE_FUTURO = datetime.now() + timedelta(days=MAX_DIAS_FUTURO)
+
+@lru_cache(maxsize=100_000)
+def normalizar_data(valor):
+    """'AAAA-MM-DD HH:MM:SS' (o formato do CURRENT_TIMESTAMP do SQLite) ou None se inválida"""
+    valor = valor.strip()
+    for i, padrao in enumerate(_PADROES_DATA):
+        m = padrao.match(valor)
+        if m is None:
+            continue
+        partes = m.groups()
+        if i == 1:
+            partes = (partes[2], partes[1], partes[0], *partes[3:])
+        try:
+            data = datetime(*(int(p or 0) for p in partes))
+        except ValueError:
+            return None
+        if data.year < ANO_MINIMO or data > _LIMITE_FUTURO:
+            return None
+        return data.strftime("%Y-%m-%d %H:%M:%S")
+    return None
+
+
+# Controles C0/C1 viram espaço (exceto \n e \t); \r some depois do replace de quebras
+_CONTROLES = {c: " " for c in [*range(0x00, 0x09), 0x0B, 0x0C, *range(0x0E, 0x20), *range(0x7F, 0xA0)]}
+
+def normalizar_texto(texto):
+    """NFC, UTF-8 lido como CP1252 desfeito, quebras \\n, sem controles e sem espaços repetidos.
+
+    As quebras de linha ficam: as regras CTCAE usam a quebra como fim do escopo de negação.
+    """
+    if "Ã" in texto or "Â" in texto:
+        # "NÃ¡usea": a exportação gravou UTF-8 e alguém leu como CP1252
+        try:
+            texto = texto.encode("cp1252").decode("utf-8")
+            contar("ingestao_mojibake_corrigido")
+        except UnicodeError:
+            pass
+    texto = unicodedata.normalize("NFC", texto).replace("\r\n", "\n").replace("\r", "\n").translate(_CONTROLES)
+    return "\n".join(linha for linha in (" ".join(l.split()) for l in texto.split("\n")) if linha)
+
+
+def validar(paciente, texto, data):
+    """(paciente_hash, texto, data) pronto para o INSERT, ou o motivo da rejeição"""
+    if paciente is None and texto is None:
+        return "registro ilegível"
+    paciente = str(paciente).strip() if paciente is not None else ""
+    if not paciente:
+        return "paciente ausente"
+    texto = normalizar_texto(str(texto)) if texto is not None else ""
+    if not texto:
+        return "texto vazio"
+    if data is None or not str(data).strip():
+        return "data ausente"
+    data = normalizar_data(str(data))
+    if data is None:
+        return "data inválida"
+    return hash_paciente(paciente), texto, data
+
+
+# --- LEITORES ---
+# Cada leitor gera (nº do registro, paciente, texto, data) com os valores como vieram do arquivo.
+
+def abrir(caminho, codificacao, newline=None):
+    if caminho.endswith(".gz"):
+        return gzip.open(caminho, "rt", encoding=codificacao, errors="replace", newline=newline)
+    return open(caminho, encoding=codificacao, errors="replace", newline=newline)
+
+
+def detectar_codificacao(caminho, amostra=AMOSTRA_CODIFICACAO):
+    """utf-8-sig se o começo do arquivo for UTF-8 válido (com ou sem BOM); senão cp1252"""
+    with (gzip.open(caminho, "rb") if caminho.endswith(".gz") else open(caminho, "rb")) as f:
+        bruto = f.read(amostra)
+    try:
+        # final=False: um caractere cortado no fim da amostra não conta como erro
+        codecs.getincrementaldecoder("utf-8")().decode(bruto, final=False)
+        return "utf-8-sig"
+    except UnicodeDecodeError:
+        return "cp1252"
+
+
+def detectar_formato(caminho):
+    base = caminho[:-3] if caminho.endswith(".gz") else caminho
+    formato = EXTENSOES.get(os.path.splitext(base)[1].lower())
+    if formato is None:
+        raise ValueError(f"Formato de {caminho} não reconhecido pela extensão; use --formato ({', '.join(FORMATOS)})")
+    return formato
+
+
+def _coluna(nomes, papel, escolhida=None):
+    """Nome da coluna do arquivo para o papel (paciente, texto, data)"""
+    if escolhida:
+        if escolhida not in nomes:
+            raise ValueError(f"Coluna '{escolhida}' não existe no arquivo (colunas: {', '.join(nomes)})")
+        return escolhida
+    por_nome = {n.strip().lower(): n for n in nomes}
+    return next((por_nome[c] for c in COLUNAS[papel] if c in por_nome), None)
+
+
+def ler_csv(caminho, codificacao, colunas):
+    csv.field_size_limit(2**31 - 1)  # Evoluções longas passam do limite padrão de 128 KB
+    with abrir(caminho, codificacao, newline="") as f:
+        amostra = f.read(64 * 1024)
+        f.seek(0)
+        try:
+            dialeto = csv.Sniffer().sniff(amostra, delimiters=",;\t|")
+        except csv.Error:
+            dialeto = csv.excel
+        leitor = csv.reader(f, dialeto)
+        cabecalho = next(leitor, [])
+        indices = {papel: cabecalho.index(c) if c is not None else None
+                   for papel in COLUNAS for c in [_coluna(cabecalho, papel, colunas.get(papel))]}
+        if indices["paciente"] is None or indices["texto"] is None:
+            raise ValueError(f"{caminho}: colunas de paciente/texto não encontradas (cabeçalho: {cabecalho}); "
+                             f"use --col-paciente/--col-texto")
+        for n, linha in enumerate(leitor, 1):
+            yield (n, *(linha[i] if i is not None and i < len(linha) else None
+                        for i in (indices["paciente"], indices["texto"], indices["data"])))
+
+
+def ler_jsonl(caminho, codificacao, colunas):
+    chaves = None
+    with abrir(caminho, codificacao) as f:
+        for n, linha in enumerate(f, 1):
+            if not linha.strip():
+                continue
+            try:
+                registro = json.loads(linha)
+            except json.JSONDecodeError:
+                yield n, None, None, None
+                continue
+            if not isinstance(registro, dict):
+                yield n, None, None, None
+                continue
+            if chaves is None:
+                chaves = {papel: _coluna(list(registro), papel, colunas.get(papel)) for papel in COLUNAS}
+            yield (n, *(registro.get(chaves[papel]) if chaves[papel] else None for papel in COLUNAS))
+
+
+_ESCAPES_HL7 = re.compile(r"\\(F|S|T|R|E|\.br)\\")
+
+def analisar_hl7(segmentos):
+    """(paciente, texto, data) de uma mensagem HL7 v2: PID-3, OBX-5/NTE-3 e OBR-7, OBX-14 ou MSH-7"""
+    msh = segmentos[0]
+    separador = msh[3] if msh.startswith("MSH") and len(msh) > 3 else "|"
+    componente, repeticao = (msh[4], msh[5]) if len(msh) > 5 else ("^", "~")
+    subcomponente = msh[7] if len(msh) > 7 else "&"
+    troca = {"F": separador, "S": componente, "T": subcomponente, "R": repeticao, "E": "\\", ".br": "\n"}
+
+    def limpar(valor):
+        return _ESCAPES_HL7.sub(lambda m: troca[m.group(1)], valor)
+
+    paciente, textos, datas = None, [], {}
+    for segmento in segmentos:
+        campos = segmento.split(separador)
+        tipo = campos[0]
+        if tipo == "MSH" and len(campos) > 6:
+            datas.setdefault("MSH", campos[6])
+        elif tipo == "PID" and len(campos) > 3 and paciente is None:
+            paciente = campos[3].split(repeticao)[0].split(componente)[0] or None
+        elif tipo == "OBR" and len(campos) > 7 and campos[7]:
+            datas.setdefault("OBR", campos[7])
+        elif tipo == "OBX" and len(campos) > 5:
+            if campos[2] in ("", "TX", "FT", "ST"):
+                textos += [limpar(v) for v in campos[5].split(repeticao)]
+            if len(campos) > 14 and campos[14]:
+                datas.setdefault("OBX", campos[14])
+        elif tipo == "NTE" and len(campos) > 3:
+            textos.append(limpar(campos[3]))
+    data = next((datas[s] for s in ("OBR", "OBX", "MSH") if datas.get(s)), None)
+    return paciente, "\n".join(t for t in textos if t) or None, data
+
+
+def ler_hl7(caminho, codificacao, _colunas):
+    """Uma mensagem por MSH; segmentos separados por \\r, \\n ou \\r\\n (quebra universal do open)"""
+    mensagem, n = [], 0
+    with abrir(caminho, codificacao) as f:
+        for linha in f:
+            linha = linha.rstrip("\n")
+            if linha.startswith("MSH") and mensagem:
+                n += 1
+                yield (n, *analisar_hl7(mensagem))
+                mensagem = []
+            if linha.strip():
+                mensagem.append(linha)
+    if mensagem:
+        yield (n + 1, *analisar_hl7(mensagem))
+
+
+LEITORES = {"csv": ler_csv, "jsonl": ler_jsonl, "hl7": ler_hl7}
+
+
+def lotes_arquivo(caminho, formato, codificacao, colunas, pular=0, tamanho_lote=TAMANHO_LOTE, rejeitos=None):
+    """Gera (linhas válidas, registros consumidos até aqui, Counter de motivos de rejeição) por lote.
+
+    `pular` registros do começo são ignorados (retomada). Os rejeitados vão
+    para `rejeitos` (JSONL aberto) só com o número e o motivo: nada do paciente.
+    """
+    linhas, motivos, consumidos = [], Counter(), pular
+    for n, paciente, texto, data in LEITORES[formato](caminho, codificacao, colunas):
+        if n <= pular:
+            continue
+        consumidos = n
+        resultado = validar(paciente, texto, data)
+        if isinstance(resultado, str):
+            motivos[resultado] += 1
+            if rejeitos is not None:
+                rejeitos.write(json.dumps({"arquivo": caminho, "registro": n, "motivo": resultado},
+                                          ensure_ascii=False) + "\n")
+        else:
+            linhas.append(resultado)
+        if len(linhas) + sum(motivos.values()) >= tamanho_lote:
+            yield linhas, consumidos, motivos
+            linhas, motivos = [], Counter()
+    if linhas or motivos:
+        yield linhas, consumidos, motivos
+
+
+# --- GRAVAÇÃO ---
+
+def planejar_arquivos(conn, caminhos, forcar=False):
+    """[(caminho absoluto, registros a pular)], sem os arquivos já carregados por inteiro"""
+    plano = []
+    for caminho in caminhos:
+        caminho = os.path.abspath(caminho)
+        estado = os.stat(caminho)
+        linha = conn.execute("SELECT tamanho, modificado_ns, registros, status FROM ingestao_arquivos "
+                             "WHERE caminho = ?", (caminho,)).fetchone()
+        mesmo_arquivo = linha is not None and (linha[0], linha[1]) == (estado.st_size, estado.st_mtime_ns)
+        if mesmo_arquivo and linha[3] == "concluido" and not forcar:
+            print(f"   [OK] {caminho} já foi carregado ({linha[2]} registros); --forcar para carregar de novo.")
+            continue
+        pular = linha[2] if mesmo_arquivo and not forcar else 0
+        if linha is not None and not mesmo_arquivo:
+            print(f"   [AVISO] {caminho} mudou desde a última carga: começando do zero "
+                  f"(linhas da carga anterior continuam em prontuarios).")
+        with conn:
+            conn.execute("""INSERT INTO ingestao_arquivos (caminho, tamanho, modificado_ns, registros, status,
+                                                           atualizado_em)
+                            VALUES (?, ?, ?, ?, 'em_andamento', datetime('now'))
+                            ON CONFLICT(caminho) DO UPDATE SET tamanho = excluded.tamanho,
+                                modificado_ns = excluded.modificado_ns, registros = excluded.registros,
+                                status = excluded.status, atualizado_em = excluded.atualizado_em""",
+                         (caminho, estado.st_size, estado.st_mtime_ns, pular))
+        if pular:
+            print(f"   ... {caminho}: retomando após o registro {pular}.")
+        plano.append((caminho, pular))
+    return plano
+
+
+def gravar_lote(conn, caminho, linhas, consumidos, rejeitados):
+    """Lote + ponto de retomada na mesma transação; devolve o maior prontuarios.id (o do lote)"""
+    with cronometro("db_escrita", tabela="prontuarios"), conn:
+        conn.executemany("INSERT INTO prontuarios (paciente_hash, texto_clinico, data_importacao) "
+                         "VALUES (?, ?, ?)", linhas)
+        conn.execute("UPDATE ingestao_arquivos SET registros = ?, inseridos = inseridos + ?, "
+                     "rejeitados = rejeitados + ?, atualizado_em = datetime('now') WHERE caminho = ?",
+                     (consumidos, len(linhas), rejeitados, caminho))
+        ultimo_id, = conn.execute("SELECT MAX(id) FROM prontuarios").fetchone()
+    contar("ingestao_registros", len(linhas), resultado="inserido")
+    contar("ingestao_registros", rejeitados, resultado="rejeitado")
+    return ultimo_id
+
+
+def concluir_arquivo(conn, caminho):
+    with conn:
+        conn.execute("UPDATE ingestao_arquivos SET status = 'concluido', atualizado_em = datetime('now') "
+                     "WHERE caminho = ?", (caminho,))
+
+
+# --- CLASSIFICAÇÃO DOS NOVOS ---
+
+class FilaClassificacao:
+    """Entrega ao biobert_pipeline os ids recém-gravados enquanto a carga continua.
+
+    A fila leva só o maior id de cada lote; o consumidor junta o que acumulou
+    e classifica da marca d'água do pipeline até esse id, com a conexão e a
+    thread dele (o torch solta o GIL). Não rode o biobert_pipeline.py --continuo
+    ao mesmo tempo: os dois disputariam a mesma marca d'água.
+    """
+
+    def __init__(self, arquivo_db=ARQUIVO_DB):
+        self.arquivo_db = arquivo_db
+        self.fila = asyncio.Queue()
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="ingestao-classificacao")
+        self.notas = 0
+        self.alertas = 0
+        self._conn = None
+        self._tarefa = None
+
+    def iniciar(self):
+        self._tarefa = asyncio.get_running_loop().create_task(self._laco())
+
+    def avisar(self, ultimo_id):
+        self.fila.put_nowait(ultimo_id)
+
+    def _classificar_ate(self, ultimo_id):
+        import biobert_pipeline as pipeline
+
+        if self._conn is None:
+            self._conn = conectar(self.arquivo_db, check_same_thread=False)
+        motor, clf = pipeline.carregar_recursos()
+        notas, alertas = pipeline.processar_intervalo(self._conn, pipeline.ler_marca_dagua(self._conn), ultimo_id,
+                                                      pipeline.TAMANHO_BLOCO, motor, clf)
+        self.notas += notas
+        self.alertas += alertas
+
+    async def _laco(self):
+        loop = asyncio.get_running_loop()
+        fim = False
+        while not fim:
+            ids = [await self.fila.get()]
+            while not self.fila.empty():
+                ids.append(self.fila.get_nowait())
+            fim = None in ids
+            ids = [i for i in ids if i is not None]
+            if ids:
+                await loop.run_in_executor(self.executor, self._classificar_ate, max(ids))
+
+    async def encerrar(self):
+        """Espera a classificação alcançar o último lote gravado"""
+        self.fila.put_nowait(None)
+        await self._tarefa
+        if self._conn is not None:
+            await asyncio.get_running_loop().run_in_executor(self.executor, self._conn.close)
+        self.executor.shutdown()
+
+
+# --- FLUXO PRINCIPAL ---
+
+async def ingerir(caminhos, formato=None, codificacao=None, colunas=None, tamanho_lote=TAMANHO_LOTE,
+                  arquivo_db=ARQUIVO_DB, classificar=False, forcar=False, arquivo_rejeitados=None, sem_chave=False):
+    """Carrega os arquivos em prontuarios; devolve (inseridos, Counter de rejeições).
+
+    Sem INGESTAO_CHAVE_PACIENTE, só com `sem_chave`: o SHA-256 puro de um
+    número de prontuário curto se reverte por força bruta.
+    """
+    if not CHAVE_PACIENTE and not sem_chave:
+        raise ValueError("INGESTAO_CHAVE_PACIENTE vazia: paciente_hash sem chave não é pseudônimo")
+    loop = asyncio.get_running_loop()
+    preparar_banco(arquivo_db)
+    # Só a thread de gravação usa a conexão depois do planejamento
+    conn = conectar(arquivo_db, check_same_thread=False)
+    for nome, valor in PRAGMAS_CARGA.items():
+        conn.execute(f"PRAGMA {nome} = {valor}")
+    plano = planejar_arquivos(conn, caminhos, forcar)
+    if not plano:
+        conn.close()
+        return 0, Counter()
+
+    fila = asyncio.Queue(maxsize=MAX_LOTES_FILA)
+    leitura = ThreadPoolExecutor(max_workers=1, thread_name_prefix="ingestao-leitura")
+    escrita = ThreadPoolExecutor(max_workers=1, thread_name_prefix="ingestao-escrita")
+    classificacao = FilaClassificacao(arquivo_db) if classificar else None
+    if classificacao is not None:
+        classificacao.iniciar()
+    rejeitos = open(arquivo_rejeitados, "a", encoding="utf-8") if arquivo_rejeitados else None
+
+    async def ler():
+        try:
+            for caminho, pular in plano:
+                formato_arquivo = formato or detectar_formato(caminho)
+                codificacao_arquivo = codificacao or detectar_codificacao(caminho)
+                print(f">>> {caminho} ({formato_arquivo}, {codificacao_arquivo})")
+                lotes = lotes_arquivo(caminho, formato_arquivo, codificacao_arquivo, colunas or {}, pular,
+                                      tamanho_lote, rejeitos)
+                while (lote := await loop.run_in_executor(leitura, next, lotes, None)) is not None:
+                    await fila.put((caminho, lote))
+                await fila.put((caminho, None))  # Fim do arquivo
+        finally:
+            await fila.put(None)
+
+    async def gravar():
+        inseridos, motivos, inicio = 0, Counter(), time.perf_counter()
+        while (item := await fila.get()) is not None:
+            caminho, lote = item
+            if lote is None:
+                await loop.run_in_executor(escrita, concluir_arquivo, conn, caminho)
+                continue
+            linhas, consumidos, motivos_lote = lote
+            ultimo_id = await loop.run_in_executor(escrita, gravar_lote, conn, caminho, linhas, consumidos,
+                                                   sum(motivos_lote.values()))
+            if classificacao is not None and linhas:
+                classificacao.avisar(ultimo_id)
+            inseridos += len(linhas)
+            motivos += motivos_lote
+            print(f"   ... {os.path.basename(caminho)} até o registro {consumidos}: {inseridos} inseridos, "
+                  f"{sum(motivos.values())} rejeitados ({inseridos / (time.perf_counter() - inicio):,.0f}/s)")
+        return inseridos, motivos
+
+    try:
+        # Erro na leitura (coluna ausente, formato errado) encerra a gravação pelo None do finally
+        leitor = loop.create_task(ler())
+        inseridos, motivos = await gravar()
+        await leitor
+    finally:
+        if rejeitos is not None:
+            rejeitos.close()
+        leitura.shutdown()
+        await loop.run_in_executor(escrita, lambda: conn.execute("PRAGMA wal_checkpoint(TRUNCATE)"))
+        escrita.shutdown()
+        conn.close()
+    if classificacao is not None:
+        print(">>> Carga concluída; aguardando a classificação alcançar o último lote...")
+        await classificacao.encerrar()
+        print(f">>> Classificação: {classificacao.notas} prontuários, {classificacao.alertas} com alerta.")
+    return inseridos, motivos
+
+
+# --- CLI ---
+
+def main():
+    parser = argparse.ArgumentParser(description="Carga de notas clínicas (CSV, JSONL, HL7 v2) em prontuarios")
+    parser.add_argument("arquivos", nargs="+", help="Arquivos a carregar (.gz aceito)")
+    parser.add_argument("--formato", choices=FORMATOS, help="Padrão: pela extensão")
+    parser.add_argument("--codificacao", help="Padrão: UTF-8 se válido, senão CP1252")
+    parser.add_argument("--col-paciente", help="Coluna/chave com o identificador do paciente")
+    parser.add_argument("--col-texto", help="Coluna/chave com a evolução")
+    parser.add_argument("--col-data", help="Coluna/chave com a data do atendimento")
+    parser.add_argument("--lote", type=int, default=TAMANHO_LOTE, help="Registros por transação")
+    parser.add_argument("--rejeitados", metavar="JSONL", help="Grava número e motivo de cada registro rejeitado")
+    parser.add_argument("--classificar", action="store_true",
+                        help="Classifica os novos prontuários (biobert_pipeline) enquanto carrega")
+    parser.add_argument("--forcar", action="store_true", help="Carrega de novo arquivos já concluídos")
+    parser.add_argument("--sem-chave", action="store_true",
+                        help="Aceita rodar sem INGESTAO_CHAVE_PACIENTE (SHA-256 sem chave; só para testes)")
+    parser.add_argument("--db", default=ARQUIVO_DB)
+    args = parser.parse_args()
+
+    if not CHAVE_PACIENTE:
+        if not args.sem_chave:
+            parser.error("defina INGESTAO_CHAVE_PACIENTE (chave do HMAC do paciente): sem ela, números de "
+                         "prontuário curtos são revertidos por força bruta. --sem-chave aceita, só para testes.")
+        print("   [AVISO] INGESTAO_CHAVE_PACIENTE vazia: paciente_hash é SHA-256 sem chave "
+              "(identificadores previsíveis podem ser revertidos por força bruta).")
+    iniciar_exportadores()
+    colunas = {papel: valor for papel, valor in (("paciente", args.col_paciente), ("texto", args.col_texto),
+                                                 ("data", args.col_data)) if valor}
+    t0 = time.perf_counter()
+    inseridos, motivos = asyncio.run(ingerir(args.arquivos, args.formato, args.codificacao, colunas, args.lote,
+                                             args.db, args.classificar, args.forcar, args.rejeitados,
+                                             args.sem_chave))
+    duracao = time.perf_counter() - t0
+    print(f"\n>>> {inseridos} prontuários inseridos em {duracao:.1f}s ({inseridos / max(duracao, 1e-9):,.0f}/s).")
+    for motivo, qtd in motivos.most_common():
+        print(f"   [AVISO] {qtd} rejeitados: {motivo}")
+
+
+if __name__ == "__main__":
+    main()
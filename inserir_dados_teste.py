@@ -1,6 +1,8 @@
 import sqlite3
 from datetime import datetime
 
+from esquema_banco import conectar
+
 # Lista de 12 prontuários fictícios simulando anotações médicas reais (Desestruturadas)
 # Cenários variados para desafiar o BioBERT depois
 dados_ficticios = [
@@ -41,7 +43,7 @@ dados_ficticios = [
     ("PT_ONCO_012", "Em uso de hormonoterapia adjuvante. Queixa principal: fogachos noturnos que atrapalham o sono esporadicamente. Sem sangramento vaginal. Mantida conduta.", "2023-10-12")
 ]
 
-conn = sqlite3.connect('oncologia_farmacovigilancia.db')
+conn = conectar()
 cursor = conn.cursor()
 
 # Comando SQL de inserção
@@ -0,0 +1,132 @@
+import hashlib
+import json
+import os
+
+import numpy as np
+
+from esquema_banco import conectar
+
+# --- CONFIGURAÇÃO ---
+ARQUIVO_DB = 'oncologia_farmacovigilancia.db'
+DIRETORIO_MATRIZES = "dados/embeddings"
+TAMANHO_BLOCO = 2000   # Linhas lidas do SQLite e embedadas por vez
+
+
+class MatrizEmbeddings:
+    """Matriz de embeddings em disco (.npy) com sidecar de ids e rótulos.
+
+    Arquivos no diretório:
+      X.npy        float32 (n, dimensao), escrita bloco a bloco via open_memmap
+      ids.npy      int64 (n,)   id da linha de origem
+      rotulos.npy  int64 (n,)   grau_real
+      meta.json    modelo, max_length, assinatura dos dados e quantas linhas já foram escritas
+
+    A leitura usa np.load(mmap_mode='r'): nada é copiado para a memória até ser
+    usado, então a matriz pode ser maior que a RAM. Se a escrita for
+    interrompida, a próxima chamada com a mesma assinatura continua de onde parou.
+    """
+
+    def __init__(self, diretorio):
+        self.diretorio = diretorio
+        self.caminho_meta = os.path.join(diretorio, "meta.json")
+
+    def _caminho(self, nome):
+        return os.path.join(self.diretorio, nome)
+
+    @property
+    def meta(self):
+        if not os.path.exists(self.caminho_meta):
+            return None
+        with open(self.caminho_meta) as f:
+            return json.load(f)
+
+    def _gravar_meta(self, meta):
+        temporario = self.caminho_meta + ".tmp"
+        with open(temporario, "w") as f:
+            json.dump(meta, f)
+        os.replace(temporario, self.caminho_meta)
+
+    def valida(self, assinatura):
+        meta = self.meta
+        return bool(meta and meta["assinatura"] == assinatura and meta["escritos"] == meta["n"])
+
+    def abrir(self):
+        """(X, ids, rotulos) mapeados em memória, somente leitura"""
+        return tuple(np.load(self._caminho(nome), mmap_mode="r") for nome in ("X.npy", "ids.npy", "rotulos.npy"))
+
+    def escrever(self, motor, blocos, n, assinatura, nome_modelo):
+        """Embeda os blocos de (id, texto, rotulo) e grava direto nos arquivos mapeados"""
+        os.makedirs(self.diretorio, exist_ok=True)
+        meta = self.meta
+        retomar = bool(meta and meta["assinatura"] == assinatura and meta["n"] == n)
+        modo = "r+" if retomar else "w+"
+        abrir = np.lib.format.open_memmap
+        X = abrir(self._caminho("X.npy"), mode=modo, dtype=np.float32, shape=(n, motor.dimensao))
+        ids = abrir(self._caminho("ids.npy"), mode=modo, dtype=np.int64, shape=(n,))
+        rotulos = abrir(self._caminho("rotulos.npy"), mode=modo, dtype=np.int64, shape=(n,))
+
+        escritos = meta["escritos"] if retomar else 0
+        ultimo_id = int(ids[escritos - 1]) if escritos else 0
+        meta = {"modelo": nome_modelo, "max_length": motor.max_length, "dimensao": motor.dimensao,
+                "n": n, "escritos": escritos, "assinatura": assinatura}
+        if retomar and escritos:
+            print(f"   ... retomando após {escritos} linhas já gravadas")
+
+        for bloco in blocos(ultimo_id):
+            fim = escritos + len(bloco)
+            X[escritos:fim] = motor.gerar([texto for _, texto, _ in bloco])
+            ids[escritos:fim] = [i for i, _, _ in bloco]
+            rotulos[escritos:fim] = [r for _, _, r in bloco]
+            escritos = fim
+            # Flush antes do meta: o meta nunca aponta para linhas que não estão no disco
+            for arquivo in (X, ids, rotulos):
+                arquivo.flush()
+            meta["escritos"] = escritos
+            self._gravar_meta(meta)
+            print(f"   ... embedados {escritos} de {n}")
+        del X, ids, rotulos
+        return self.abrir()
+
+
+# --- ORIGEM: TABELA dados_treino ---
+
+def assinatura_dados_treino(conn, nome_modelo, max_length):
+    """Hash de (id, texto, grau) de todas as linhas + configuração do modelo"""
+    h = hashlib.sha256(f"{nome_modelo}|{max_length}".encode())
+    n = 0
+    for id_, texto, grau in conn.execute("SELECT id, texto_clinico, grau_real FROM dados_treino ORDER BY id"):
+        h.update(f"\x1e{id_}\x1f{grau}\x1f{texto}".encode("utf-8"))
+        n += 1
+    return h.hexdigest(), n
+
+
+def matriz_dados_treino(obter_motor, nome_modelo, max_length, diretorio=None, tamanho_bloco=TAMANHO_BLOCO):
+    """Abre a matriz de dados_treino, embedando só se os dados ou o modelo mudaram.
+
+    `obter_motor` é chamado apenas quando é preciso embedar: com a matriz em
+    dia o BioBERT nem é carregado.
+    """
+    matriz = MatrizEmbeddings(diretorio or os.path.join(DIRETORIO_MATRIZES, "dados_treino"))
+    conn = conectar(ARQUIVO_DB)
+    assinatura, n = assinatura_dados_treino(conn, nome_modelo, max_length)
+    if n == 0:
+        conn.close()
+        return None
+    if matriz.valida(assinatura):
+        conn.close()
+        print(f">>> Matriz de embeddings em dia ({n} linhas): reaproveitando {matriz.diretorio}")
+        return matriz.abrir()
+
+    def blocos(apos_id):
+        while True:
+            bloco = conn.execute("SELECT id, texto_clinico, grau_real FROM dados_treino WHERE id > ? ORDER BY id LIMIT ?",
+                                 (apos_id, tamanho_bloco)).fetchall()
+            if not bloco:
+                return
+            yield bloco
+            apos_id = bloco[-1][0]
+
+    print(f">>> Gerando matriz de embeddings para {n} linhas em {matriz.diretorio}...")
+    resultado = matriz.escrever(obter_motor(), blocos, n, assinatura, nome_modelo)
+    conn.close()
+    return resultado
@@ -0,0 +1,300 @@
+import atexit
+import bisect
+import cProfile
+import json
+import os
+import sys
+import threading
+import time
+from collections import Counter, deque
+from contextlib import contextmanager
+from datetime import datetime
+from functools import wraps
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# --- CONFIGURAÇÃO ---
+# Só biblioteca padrão: importado por scripts que nem carregam torch.
+PORTA = int(os.environ.get("METRICAS_PORTA", "0"))              # /metrics (Prometheus); 0 = desligado
+ARQUIVO_JSON = os.environ.get("METRICAS_JSON", "")               # Dump periódico; vazio = desligado
+INTERVALO_JSON = float(os.environ.get("METRICAS_INTERVALO", "30"))
+PERFIL = os.environ.get("METRICAS_PERFIL", "")                   # "cprofile", "amostragem" ou vazio
+DIRETORIO_PERFIS = os.environ.get("METRICAS_DIRETORIO_PERFIS", "perfis")
+INTERVALO_AMOSTRAGEM = 0.005                                     # Segundos entre duas leituras das pilhas
+MODOS_PERFIL = ("cprofile", "amostragem")
+
+PREFIXO = "farmacovigilancia_"
+LIMITES_SEGUNDOS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+LIMITES_TAMANHO = (1, 2, 4, 8, 16, 32, 64, 128, 256, 512, 1024)
+AMOSTRAS_QUANTIS = 1024   # Últimas observações de cada série, para p50/p95
+
+
+# --- REGISTRO ---
+
+class Serie:
+    """Histograma com baldes fixos (Prometheus) + as últimas observações (quantis no painel)"""
+
+    __slots__ = ("limites", "baldes", "contagem", "soma", "maximo", "recentes")
+
+    def __init__(self, limites):
+        self.limites = limites
+        self.baldes = [0] * (len(limites) + 1)
+        self.contagem = 0
+        self.soma = 0.0
+        self.maximo = 0.0
+        self.recentes = deque(maxlen=AMOSTRAS_QUANTIS)
+
+    def observar(self, valor):
+        self.baldes[bisect.bisect_left(self.limites, valor)] += 1
+        self.contagem += 1
+        self.soma += valor
+        self.maximo = max(self.maximo, valor)
+        self.recentes.append(valor)
+
+    def quantil(self, q):
+        ordenados = sorted(self.recentes)
+        return ordenados[min(int(q * len(ordenados)), len(ordenados) - 1)] if ordenados else 0.0
+
+
+class Metricas:
+    """Contadores e histogramas do processo, com rótulos (etapa, tabela, ...).
+
+    Cada observação custa um perf_counter, uma trava e um append: dá para
+    deixar ligado em produção. Os nomes de tempo terminam em _segundos.
+    """
+
+    def __init__(self):
+        self._trava = threading.Lock()
+        self.contadores = {}
+        self.series = {}
+        self.inicio = time.time()
+
+    def contar(self, nome, valor=1, **rotulos):
+        chave = (nome, tuple(sorted(rotulos.items())))
+        with self._trava:
+            self.contadores[chave] = self.contadores.get(chave, 0) + valor
+
+    def observar(self, nome, valor, limites=LIMITES_TAMANHO, **rotulos):
+        chave = (nome, tuple(sorted(rotulos.items())))
+        with self._trava:
+            serie = self.series.get(chave)
+            if serie is None:
+                serie = self.series[chave] = Serie(limites)
+            serie.observar(valor)
+
+    @contextmanager
+    def cronometro(self, nome, **rotulos):
+        t0 = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observar(f"{nome}_segundos", time.perf_counter() - t0, LIMITES_SEGUNDOS, **rotulos)
+
+    def instantaneo(self):
+        """Cópia serializável (JSON) de tudo o que foi medido até agora"""
+        with self._trava:
+            contadores = [{"nome": n, "rotulos": dict(r), "valor": v} for (n, r), v in self.contadores.items()]
+            series = [{"nome": n, "rotulos": dict(r), "contagem": s.contagem, "soma": s.soma,
+                       "media": s.soma / s.contagem if s.contagem else 0.0,
+                       "p50": s.quantil(0.5), "p95": s.quantil(0.95), "maximo": s.maximo}
+                      for (n, r), s in self.series.items()]
+        return {"data": datetime.now().strftime("%Y-%m-%d %H:%M:%S"), "uptime_s": time.time() - self.inicio,
+                "pid": os.getpid(), "contadores": contadores, "series": series}
+
+    def texto_prometheus(self):
+        """Formato de exposição em texto do Prometheus (counter e histogram)"""
+        def rotulos(pares, extra=()):
+            pares = list(pares) + list(extra)
+            return "{" + ",".join(f'{k}="{v}"' for k, v in pares) + "}" if pares else ""
+
+        linhas = []
+        with self._trava:
+            for nome in sorted({n for n, _ in self.contadores}):
+                linhas.append(f"# TYPE {PREFIXO}{nome}_total counter")
+                linhas += [f"{PREFIXO}{nome}_total{rotulos(r)} {v}"
+                           for (n, r), v in self.contadores.items() if n == nome]
+            for nome in sorted({n for n, _ in self.series}):
+                linhas.append(f"# TYPE {PREFIXO}{nome} histogram")
+                for (n, r), s in self.series.items():
+                    if n != nome:
+                        continue
+                    acumulado = 0
+                    for limite, qtd in zip(list(s.limites) + ["+Inf"], s.baldes):
+                        acumulado += qtd
+                        linhas.append(f"{PREFIXO}{nome}_bucket{rotulos(r, [('le', limite)])} {acumulado}")
+                    linhas.append(f"{PREFIXO}{nome}_sum{rotulos(r)} {s.soma}")
+                    linhas.append(f"{PREFIXO}{nome}_count{rotulos(r)} {s.contagem}")
+        return "\n".join(linhas) + "\n"
+
+    def zerar(self):
+        with self._trava:
+            self.contadores.clear()
+            self.series.clear()
+            self.inicio = time.time()
+
+
+METRICAS = Metricas()
+contar = METRICAS.contar
+observar = METRICAS.observar
+cronometro = METRICAS.cronometro
+
+
+def instrumentar(nome):
+    """Decorador: tempo de cada chamada em `nome`_segundos e exceções em `nome`_erros"""
+    def decorador(funcao):
+        @wraps(funcao)
+        def envoltorio(*args, **kwargs):
+            try:
+                with cronometro(nome):
+                    return funcao(*args, **kwargs)
+            except Exception:
+                contar(f"{nome}_erros")
+                raise
+        return envoltorio
+    return decorador
+
+
+# --- EXPORTAÇÃO ---
+
+class _RotasMetricas(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path == "/metrics":
+            corpo, tipo = METRICAS.texto_prometheus().encode("utf-8"), "text/plain; version=0.0.4"
+        elif self.path == "/metrics.json":
+            corpo, tipo = json.dumps(METRICAS.instantaneo()).encode("utf-8"), "application/json"
+        else:
+            self.send_error(404)
+            return
+        self.send_response(200)
+        self.send_header("Content-Type", tipo)
+        self.send_header("Content-Length", str(len(corpo)))
+        self.end_headers()
+        self.wfile.write(corpo)
+
+    def log_message(self, *_):
+        pass  # Um scrape a cada 15 s não precisa ir para o terminal
+
+
+def servir_prometheus(porta=PORTA, host="127.0.0.1"):
+    """GET /metrics e /metrics.json numa thread de fundo"""
+    servidor = ThreadingHTTPServer((host, porta), _RotasMetricas)
+    threading.Thread(target=servidor.serve_forever, daemon=True, name="metricas-http").start()
+    print(f">>> Métricas em http://{host}:{porta}/metrics")
+    return servidor
+
+
+def gravar_json(caminho=ARQUIVO_JSON):
+    """Grava o instantâneo num temporário e troca de uma vez (quem lê nunca vê arquivo pela metade)"""
+    temporario = f"{caminho}.tmp"
+    with open(temporario, "w") as f:
+        json.dump(METRICAS.instantaneo(), f, indent=2)
+    os.replace(temporario, caminho)
+
+
+def iniciar_dump_json(caminho=ARQUIVO_JSON, intervalo=INTERVALO_JSON):
+    def laco():
+        while True:
+            time.sleep(intervalo)
+            gravar_json(caminho)
+    threading.Thread(target=laco, daemon=True, name="metricas-json").start()
+
+
+_exportadores_iniciados = False
+
+def iniciar_exportadores(porta=PORTA, arquivo_json=ARQUIVO_JSON, intervalo=INTERVALO_JSON):
+    """Liga o que estiver configurado (METRICAS_PORTA / METRICAS_JSON); chamadas repetidas não fazem nada.
+
+    O JSON também é gravado na saída do processo: um treino curto termina antes do primeiro intervalo.
+    """
+    global _exportadores_iniciados
+    if _exportadores_iniciados:
+        return
+    _exportadores_iniciados = True
+    if porta:
+        servir_prometheus(porta)
+    if arquivo_json:
+        iniciar_dump_json(arquivo_json, intervalo)
+        atexit.register(gravar_json, arquivo_json)
+
+
+# --- PERFIL (OPT-IN) ---
+
+class AmostradorPilhas:
+    """Perfil por amostragem no estilo do py-spy, sem dependência externa.
+
+    Uma thread lê a pilha de todas as outras threads a cada `intervalo` e
+    conta as pilhas iguais. O custo não depende de quantas funções o código
+    chama (ao contrário do cProfile), e o resultado sai no formato "folded"
+    (uma pilha por linha), que flamegraph.pl e speedscope abrem direto.
+    """
+
+    def __init__(self, intervalo=INTERVALO_AMOSTRAGEM):
+        self.intervalo = intervalo
+        self.pilhas = Counter()
+        self.amostras = 0
+        self._parar = threading.Event()
+        self._thread = None
+
+    def _laco(self):
+        proprio = threading.get_ident()
+        while not self._parar.wait(self.intervalo):
+            for ident, quadro in sys._current_frames().items():
+                if ident == proprio:
+                    continue
+                pilha = []
+                while quadro is not None:
+                    codigo = quadro.f_code
+                    pilha.append(f"{os.path.basename(codigo.co_filename)}:{codigo.co_name}")
+                    quadro = quadro.f_back
+                self.pilhas[";".join(reversed(pilha))] += 1
+            self.amostras += 1
+
+    def iniciar(self):
+        self._thread = threading.Thread(target=self._laco, daemon=True, name="metricas-amostragem")
+        self._thread.start()
+        return self
+
+    def parar(self):
+        self._parar.set()
+        self._thread.join()
+
+    def funcoes_mais_frequentes(self, n=20):
+        """(função, fração das amostras em que estava na pilha), como o "top" do py-spy"""
+        presencas = Counter()
+        for pilha, qtd in self.pilhas.items():
+            for funcao in set(pilha.split(";")):
+                presencas[funcao] += qtd
+        total = sum(self.pilhas.values()) or 1
+        return [(funcao, qtd / total) for funcao, qtd in presencas.most_common(n)]
+
+    def gravar(self, caminho):
+        with open(caminho, "w") as f:
+            f.writelines(f"{pilha} {qtd}\n" for pilha, qtd in self.pilhas.most_common())
+
+
+@contextmanager
+def perfilar(nome, modo=PERFIL):
+    """Perfil do bloco em DIRETORIO_PERFIS quando METRICAS_PERFIL estiver ligado; senão não custa nada"""
+    if not modo:
+        yield
+        return
+    if modo not in MODOS_PERFIL:
+        raise ValueError(f"Modo de perfil desconhecido: {modo} (opções: {', '.join(MODOS_PERFIL)})")
+    os.makedirs(DIRETORIO_PERFIS, exist_ok=True)
+    base = os.path.join(DIRETORIO_PERFIS, f"{nome}-{datetime.now().strftime('%Y%m%d-%H%M%S')}-{os.getpid()}")
+    if modo == "cprofile":
+        perfil = cProfile.Profile()
+        perfil.enable()
+        try:
+            yield
+        finally:
+            perfil.disable()
+            perfil.dump_stats(f"{base}.prof")
+            print(f"   ... perfil em {base}.prof (python -m pstats {base}.prof)")
+    else:
+        amostrador = AmostradorPilhas().iniciar()
+        try:
+            yield
+        finally:
+            amostrador.parar()
+            amostrador.gravar(f"{base}.folded")
+            print(f"   ... {amostrador.amostras} amostras em {base}.folded")
@@ -0,0 +1,148 @@
+import hashlib
+import json
+import os
+import shutil
+import time
+from contextlib import contextmanager
+from datetime import datetime
+
+from metricas import LIMITES_SEGUNDOS, observar
+
+# --- CONFIGURAÇÃO ---
+# Sem torch/transformers aqui: este módulo é importado por quem ainda não sabe se vai precisar do modelo.
+NOME_MODELO = "pucpr/biobertpt-clin"
+DIRETORIO_SNAPSHOTS = "models/snapshots"
+ARQUIVO_MANIFESTO = "manifesto.json"
+
+# Backend de inferência em CPU: fp32 (original), int8 (quantização dinâmica das
+# camadas Linear) ou torchscript (grafo traçado e congelado). Escolhido pela
+# variável de ambiente para valer em todos os scripts e no dashboard.
+BACKENDS = ("fp32", "int8", "torchscript")
+BACKEND = os.environ.get("BIOBERT_BACKEND", "fp32")
+
+# Notas longas: BIOBERT_JANELA=256 liga o modo janelas do MotorEmbeddings (0 = truncar em max_length).
+# Como o backend, vale para treino, pipeline, servidor e dashboard: o Random Forest
+# precisa ver vetores gerados do mesmo jeito que foi treinado.
+POOLINGS = ("mean", "max", "atencao")
+JANELA = int(os.environ.get("BIOBERT_JANELA", "0")) or None
+PASSO_JANELA = int(os.environ.get("BIOBERT_PASSO", "0")) or None   # Padrão: metade da janela
+POOLING = os.environ.get("BIOBERT_POOLING", "mean")
+MAX_JANELAS = int(os.environ.get("BIOBERT_MAX_JANELAS", "8")) or None
+
+
+def configuracao_janelas(janela=JANELA, passo=PASSO_JANELA, pooling=POOLING, max_janelas=MAX_JANELAS):
+    """Identificador do modo janelas ("" = truncado). Entra no nome das features no cache e nas matrizes."""
+    if not janela:
+        return ""
+    return f"janela{janela}-passo{passo or janela // 2}-{pooling}-max{max_janelas or 0}"
+
+
+class SnapshotInvalido(Exception):
+    """Arquivo do snapshot ausente ou com checksum diferente do manifesto"""
+
+
+# --- TEMPOS DE INICIALIZAÇÃO ---
+
+TEMPOS_INICIALIZACAO = {}
+
+@contextmanager
+def medir(etapa):
+    """Acumula em TEMPOS_INICIALIZACAO os segundos gastos em `etapa` (imports, carga de modelos)"""
+    t0 = time.perf_counter()
+    try:
+        yield
+    finally:
+        duracao = time.perf_counter() - t0
+        TEMPOS_INICIALIZACAO[etapa] = TEMPOS_INICIALIZACAO.get(etapa, 0.0) + duracao
+        observar("inicializacao_segundos", duracao, LIMITES_SEGUNDOS, etapa=etapa)
+
+def resumo_inicializacao():
+    return " · ".join(f"{etapa}: {s:.2f} s" for etapa, s in TEMPOS_INICIALIZACAO.items())
+
+# --- SNAPSHOT LOCAL ---
+
+def diretorio_snapshot(nome_modelo=NOME_MODELO):
+    return os.path.join(DIRETORIO_SNAPSHOTS, nome_modelo.replace("/", "__"))
+
+def sha256_arquivo(caminho, tamanho_bloco=1 << 20):
+    h = hashlib.sha256()
+    with open(caminho, "rb") as f:
+        for bloco in iter(lambda: f.read(tamanho_bloco), b""):
+            h.update(bloco)
+    return h.hexdigest()
+
+def ler_manifesto(diretorio):
+    with open(os.path.join(diretorio, ARQUIVO_MANIFESTO)) as f:
+        return json.load(f)
+
+def criar_snapshot(nome_modelo=NOME_MODELO, destino=None, revisao=None, forcar_download=False):
+    """Baixa (ou reaproveita o cache do Hugging Face) e grava tokenizer + pesos em safetensors.
+
+    O manifesto guarda sha256 e tamanho de cada arquivo. A gravação é feita num
+    diretório temporário e só troca o snapshot antigo no fim, então uma queda
+    no meio do download nunca deixa um snapshot pela metade.
+    """
+    from transformers import AutoModel, AutoTokenizer
+
+    destino = destino or diretorio_snapshot(nome_modelo)
+    temporario = destino + ".tmp"
+    shutil.rmtree(temporario, ignore_errors=True)
+
+    tokenizer = AutoTokenizer.from_pretrained(nome_modelo, revision=revisao, force_download=forcar_download)
+    model = AutoModel.from_pretrained(nome_modelo, revision=revisao, force_download=forcar_download)
+    tokenizer.save_pretrained(temporario)
+    model.save_pretrained(temporario, safe_serialization=True)
+
+    arquivos = {}
+    for nome in sorted(os.listdir(temporario)):
+        caminho = os.path.join(temporario, nome)
+        arquivos[nome] = {"sha256": sha256_arquivo(caminho), "bytes": os.path.getsize(caminho)}
+    manifesto = {"modelo": nome_modelo, "revisao": revisao or getattr(model.config, "_commit_hash", None),
+                 "criado_em": datetime.now().strftime("%Y-%m-%d %H:%M:%S"), "arquivos": arquivos}
+    with open(os.path.join(temporario, ARQUIVO_MANIFESTO), "w") as f:
+        json.dump(manifesto, f, indent=2)
+
+    shutil.rmtree(destino, ignore_errors=True)
+    os.replace(temporario, destino)
+    return manifesto
+
+def verificar_snapshot(diretorio, completo=True):
+    """Lista de problemas (vazia = ok). Sem `completo`, confere só a existência e o tamanho (instantâneo)."""
+    try:
+        manifesto = ler_manifesto(diretorio)
+    except (OSError, ValueError) as e:
+        return [f"manifesto ilegível: {e}"]
+    problemas = []
+    for nome, esperado in manifesto["arquivos"].items():
+        caminho = os.path.join(diretorio, nome)
+        if not os.path.exists(caminho):
+            problemas.append(f"{nome}: ausente")
+        elif os.path.getsize(caminho) != esperado["bytes"]:
+            problemas.append(f"{nome}: tamanho {os.path.getsize(caminho)} (esperado {esperado['bytes']})")
+        elif completo and sha256_arquivo(caminho) != esperado["sha256"]:
+            problemas.append(f"{nome}: checksum diferente do manifesto")
+    return problemas
+
+def carregar_snapshot(diretorio, completo=False):
+    """Tokenizer e modelo do snapshot, sem nenhuma consulta ao Hub.
+
+    Os pesos em safetensors são mapeados do disco (mmap) em vez de
+    desserializados. O nome original do modelo é restaurado em
+    `name_or_path`, que entra na chave do cache de embeddings e das matrizes.
+    """
+    problemas = verificar_snapshot(diretorio, completo)
+    if problemas:
+        raise SnapshotInvalido(f"{diretorio}: {'; '.join(problemas)}. Rode 'python reparar_modelo.py'.")
+    nome_modelo = ler_manifesto(diretorio)["modelo"]
+
+    # Antes do import: o huggingface_hub lê essas variáveis uma vez só
+    os.environ.setdefault("HF_HUB_OFFLINE", "1")
+    os.environ.setdefault("TRANSFORMERS_OFFLINE", "1")
+    from transformers import AutoModel, AutoTokenizer
+
+    tokenizer = AutoTokenizer.from_pretrained(diretorio, local_files_only=True)
+    model = AutoModel.from_pretrained(diretorio, local_files_only=True, use_safetensors=True)
+    tokenizer.name_or_path = nome_modelo
+    model.config._name_or_path = nome_modelo
+    model.name_or_path = nome_modelo
+    return tokenizer, model
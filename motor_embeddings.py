@@ -0,0 +1,258 @@
+import os
+import time
+from contextlib import contextmanager
+
+import numpy as np
+import torch
+from transformers import AutoTokenizer, AutoModel
+from transformers.modeling_outputs import BaseModelOutput
+
+# NOME_MODELO, BACKENDS e BACKEND ficam em modelo_local.py (leve, sem torch) e são reexportados aqui
+from modelo_local import (BACKEND, BACKENDS, JANELA, MAX_JANELAS, NOME_MODELO, PASSO_JANELA, POOLING,
+                          POOLINGS, carregar_snapshot, configuracao_janelas, diretorio_snapshot, medir)
+from metricas import contar, cronometro, observar
+
+# --- CONFIGURAÇÃO PADRÃO ---
+TAMANHO_LOTE = 32          # Máximo de textos por forward pass
+MAX_TOKENS_LOTE = 8192     # Orçamento de tokens (textos x maior comprimento) por lote
+
+
+@contextmanager
+def etapa(nome, tempos=None):
+    """cronometro(nome) que também soma a duração, em ms, em tempos[nome] (o painel mostra por etapa)"""
+    t0 = time.perf_counter()
+    with cronometro(nome):
+        yield
+    if tempos is not None:
+        tempos[nome] = tempos.get(nome, 0.0) + (time.perf_counter() - t0) * 1000
+
+
+class ModeloTracado(torch.nn.Module):
+    """Grafo TorchScript do encoder com a mesma interface do AutoModel.
+
+    Devolve um BaseModelOutput com `last_hidden_state`, então quem chama
+    `model(**inputs)` não precisa saber qual backend está carregado.
+    """
+
+    def __init__(self, grafo, config, name_or_path):
+        super().__init__()
+        self.grafo = grafo
+        self.config = config
+        self.name_or_path = name_or_path
+
+    def forward(self, input_ids, attention_mask=None, token_type_ids=None, **_):
+        if attention_mask is None:
+            attention_mask = torch.ones_like(input_ids)
+        return BaseModelOutput(last_hidden_state=self.grafo(input_ids, attention_mask))
+
+
+class _EncoderTensores(torch.nn.Module):
+    """Casca que troca a saída em dataclass por um tensor (exigência do torch.jit.trace)"""
+
+    def __init__(self, model):
+        super().__init__()
+        self.model = model
+
+    def forward(self, input_ids, attention_mask):
+        return self.model(input_ids=input_ids, attention_mask=attention_mask).last_hidden_state
+
+
+def quantizar_int8(model):
+    """Quantização dinâmica: pesos das Linear em int8, ativações quantizadas em tempo de execução"""
+    return torch.ao.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+
+
+def tracar_modelo(tokenizer, model):
+    exemplo = tokenizer(["Paciente refere nauseas grau 2.", "Nega queixas."],
+                        padding=True, return_tensors="pt")
+    with torch.inference_mode():
+        grafo = torch.jit.trace(_EncoderTensores(model),
+                                (exemplo["input_ids"], exemplo["attention_mask"]), strict=False)
+    grafo = torch.jit.freeze(grafo.eval())
+    return ModeloTracado(grafo, model.config, model.name_or_path).eval()
+
+
+def carregar_biobert(nome_modelo=NOME_MODELO, backend=None):
+    """Carrega tokenizer e modelo em modo de avaliação no backend escolhido.
+
+    Se existir um snapshot local (python baixar_modelo.py), carrega dele sem
+    passar pelo Hub; senão, cai no from_pretrained de sempre.
+    """
+    backend = backend or BACKEND
+    if backend not in BACKENDS:
+        raise ValueError(f"Backend desconhecido: {backend} (opções: {', '.join(BACKENDS)})")
+    with medir("carga do BioBERT"):
+        snapshot = diretorio_snapshot(nome_modelo)
+        if os.path.isdir(snapshot):
+            tokenizer, model = carregar_snapshot(snapshot)
+        else:
+            tokenizer = AutoTokenizer.from_pretrained(nome_modelo)
+            model = AutoModel.from_pretrained(nome_modelo)
+    model.eval()
+    if backend == "int8":
+        model = quantizar_int8(model)
+    elif backend == "torchscript":
+        model = tracar_modelo(tokenizer, model)
+    # Vetores de backends diferentes não são idênticos: o cache usa isso na chave
+    model.backend_inferencia = backend
+    return tokenizer, model
+
+
+class MotorEmbeddings:
+    """Gera embeddings CLS em lotes, agrupando textos de tamanho parecido.
+
+    Os textos são ordenados pelo número de tokens antes de formar os lotes,
+    assim cada lote é preenchido (padding) só até o maior texto dele e não
+    até o maior texto do conjunto. O resultado volta na ordem original.
+
+    Com `janela`, notas longas não são truncadas em `max_length`: cada nota
+    vira janelas de `janela` tokens que avançam `passo` tokens (com
+    sobreposição), as janelas de todas as notas entram juntas nos mesmos
+    lotes e os vetores CLS das janelas de uma nota são combinados (`pooling`)
+    num único vetor. `max_janelas` limita o custo de notas muito longas.
+    """
+
+    def __init__(self, tokenizer, model, max_length=512,
+                 tamanho_lote=TAMANHO_LOTE, max_tokens_lote=MAX_TOKENS_LOTE,
+                 janela=JANELA, passo=PASSO_JANELA, pooling=POOLING, max_janelas=MAX_JANELAS):
+        if pooling not in POOLINGS:
+            raise ValueError(f"Pooling desconhecido: {pooling} (opções: {', '.join(POOLINGS)})")
+        passo = passo or (janela // 2 if janela else None)
+        # Passo maior que a parte útil da janela (sem [CLS]/[SEP]) pularia tokens entre duas janelas
+        if janela is not None and janela <= 2:
+            raise ValueError(f"Janela de {janela} tokens não cabe nem [CLS] + texto + [SEP]")
+        if janela and not 1 <= passo <= janela - 2:
+            raise ValueError(f"Passo {passo} inválido para janelas de {janela} tokens "
+                             f"(precisa ficar entre 1 e {janela - 2})")
+        self.tokenizer = tokenizer
+        self.model = model
+        self.max_length = max_length
+        self.tamanho_lote = tamanho_lote
+        self.max_tokens_lote = max_tokens_lote
+        self.janela = janela
+        self.passo = passo
+        self.pooling = pooling
+        self.max_janelas = max_janelas
+        self.janelas_geradas = 0  # Forward passes por janela, para medir o custo do modo janelas
+
+    @property
+    def dimensao(self):
+        return self.model.config.hidden_size
+
+    @property
+    def configuracao(self):
+        """Vazio no modo truncado; senão identifica janelas/pooling (entra na chave do cache e das matrizes)"""
+        return configuracao_janelas(self.janela, self.passo, self.pooling, self.max_janelas)
+
+    def _montar_lotes(self, comprimentos):
+        """Agrupa índices (ordenados por comprimento) respeitando os dois limites"""
+        ordem = np.argsort(comprimentos, kind="stable")
+        lotes, atual, maior = [], [], 0
+        for idx in ordem:
+            n = comprimentos[idx]
+            novo_maior = max(maior, n)
+            if atual and (len(atual) >= self.tamanho_lote
+                          or novo_maior * (len(atual) + 1) > self.max_tokens_lote):
+                lotes.append(atual)
+                atual, novo_maior = [], n
+            atual.append(idx)
+            maior = novo_maior
+        if atual:
+            lotes.append(atual)
+        return lotes
+
+    def _cls(self, sequencias, tempos=None):
+        """Vetores CLS (len(sequencias), dimensao) de sequências já tokenizadas, com tokens especiais"""
+        saida = np.zeros((len(sequencias), self.dimensao), dtype=np.float32)
+        with torch.inference_mode():
+            for lote in self._montar_lotes([len(ids) for ids in sequencias]):
+                entradas = self.tokenizer.pad(
+                    {"input_ids": [sequencias[i] for i in lote],
+                     "attention_mask": [[1] * len(sequencias[i]) for i in lote]},
+                    return_tensors="pt",
+                )
+                with etapa("forward", tempos):
+                    outputs = self.model(**entradas)
+                saida[lote] = outputs.last_hidden_state[:, 0, :].float().numpy()
+                observar("lote_embeddings", len(lote))
+        return saida
+
+    def gerar(self, textos, tempos=None):
+        """Retorna uma matriz (len(textos), dimensao) float32 com os vetores CLS.
+
+        Com `tempos` (dict), soma nele os ms de "tokenizacao" e de "forward" desta chamada.
+        """
+        textos = list(textos)
+        if not textos:
+            return np.zeros((0, self.dimensao), dtype=np.float32)
+        contar("notas_embedadas", len(textos))
+        if self.janela:
+            return self._gerar_janelas(textos, tempos)
+        # Tokeniza uma vez sem padding; o comprimento de cada texto define os lotes
+        with etapa("tokenizacao", tempos):
+            codificados = self.tokenizer(textos, truncation=True, max_length=self.max_length)
+        return self._cls(codificados["input_ids"], tempos)
+
+    # --- MODO JANELAS (NOTAS LONGAS) ---
+
+    def _janelas(self, ids):
+        """Fatias sobrepostas de `ids` (sem tokens especiais), cada uma já com [CLS] ... [SEP]"""
+        cls, sep = self.tokenizer.cls_token_id, self.tokenizer.sep_token_id
+        util = self.janela - 2
+        inicios = list(range(0, max(len(ids) - util, 0) + 1, self.passo))
+        if inicios[-1] + util < len(ids):
+            inicios.append(len(ids) - util)  # A última janela sempre cobre o fim da nota
+        if self.max_janelas and len(inicios) > self.max_janelas:
+            # Espalhadas pela nota, mantendo a primeira e a última
+            escolhidas = np.linspace(0, len(inicios) - 1, self.max_janelas).round().astype(int)
+            inicios = [inicios[i] for i in escolhidas]
+        return [[cls] + ids[i:i + util] + [sep] for i in inicios]
+
+    def _gerar_janelas(self, textos, tempos=None):
+        with etapa("tokenizacao", tempos):
+            ids = self.tokenizer(textos, add_special_tokens=False, truncation=False, verbose=False)["input_ids"]
+        janelas, dono = [], []
+        for i, seq in enumerate(ids):
+            for janela in self._janelas(seq):
+                janelas.append(janela)
+                dono.append(i)
+        dono = np.asarray(dono)
+        # Janelas de todas as notas juntas: os lotes são montados por comprimento, como no modo truncado
+        vetores = self._cls(janelas, tempos)
+        self.janelas_geradas += len(janelas)
+        return agregar_janelas(vetores, dono, len(textos), self.pooling)
+
+    def gerar_um(self, texto):
+        """Atalho para um único texto (vetor 1D)"""
+        return self.gerar([texto])[0]
+
+
+def agregar_janelas(vetores, dono, n, pooling="mean"):
+    """Combina os vetores das janelas (linha k pertence à nota dono[k]) em n vetores.
+
+    mean: média simples; max: máximo por dimensão; atencao: média ponderada
+    por softmax(<janela, média da nota> / sqrt(d)), que dá mais peso às
+    janelas parecidas com o conjunto e menos às que destoam (cabeçalhos, listas).
+    """
+    d = vetores.shape[1]
+    contagem = np.bincount(dono, minlength=n).astype(np.float32)[:, None]
+    media = np.zeros((n, d), dtype=np.float32)
+    np.add.at(media, dono, vetores)
+    media /= np.maximum(contagem, 1)
+    if pooling == "mean":
+        return media
+    if pooling == "max":
+        saida = np.full((n, d), -np.inf, dtype=np.float32)
+        np.maximum.at(saida, dono, vetores)
+        saida[contagem[:, 0] == 0] = 0
+        return saida
+    # atencao
+    escores = np.einsum("kd,kd->k", vetores, media[dono]) / np.sqrt(d)
+    maximos = np.full(n, -np.inf, dtype=np.float32)
+    np.maximum.at(maximos, dono, escores)
+    pesos = np.exp(escores - maximos[dono])
+    somas = np.bincount(dono, weights=pesos, minlength=n)
+    pesos = (pesos / somas[dono]).astype(np.float32)
+    saida = np.zeros((n, d), dtype=np.float32)
+    np.add.at(saida, dono, vetores * pesos[:, None])
+    return saida
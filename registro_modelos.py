@@ -0,0 +1,359 @@
+import argparse
+import json
+import os
+import shutil
+import threading
+import time
+from datetime import datetime
+
+import numpy as np
+
+from metricas import contar
+from modelo_local import BACKEND, JANELA, NOME_MODELO, POOLING, configuracao_janelas, sha256_arquivo
+
+# --- CONFIGURAÇÃO ---
+# Cada versão em models/registro/vNNNN/ (modelo.joblib + manifesto.json); o arquivo
+# ATUAL diz qual está ativa. joblib e sklearn só são importados na carga/gravação.
+DIRETORIO_REGISTRO = "models/registro"
+ARQUIVO_ATUAL = "ATUAL"
+ARQUIVO_MODELO = "modelo.joblib"
+ARQUIVO_MANIFESTO = "manifesto.json"
+CAMINHO_LEGADO = "models/classificador_ram_v1.pkl"
+MAX_LENGTH_LEGADO = 128        # O do treinar_modelo.py quando o .pkl legado foi gerado
+FORMATOS = ("compacta", "joblib")
+COMPRESSAO = ("zlib", 3)       # Formato joblib: pesa ~5x menos em disco
+INTERVALO_VERIFICACAO = 5.0    # Segundos entre duas olhadas no ATUAL (troca a quente)
+
+# Precisam ser iguais no treino e na inferência, senão os vetores não são os mesmos.
+# O backend (fp32/int8/torchscript) só gera aviso: os vetores mudam pouco (ver comparar_backends.py).
+CAMPOS_VERIFICADOS = ("modelo", "max_length", "pooling", "janelas")
+
+
+class ModeloIndisponivel(Exception):
+    """Registro vazio e sem o .pkl legado"""
+
+
+class ModeloIncompativel(Exception):
+    """Classificador treinado com features geradas de outro jeito (modelo, max_length, pooling, janelas)"""
+
+
+def configuracao_features(max_length=None, nome_modelo=NOME_MODELO, backend=BACKEND):
+    """Como os vetores deste processo são gerados; max_length=None = aceita o do manifesto"""
+    return {"modelo": nome_modelo, "backend": backend, "max_length": max_length,
+            "pooling": POOLING if JANELA else "cls", "janelas": configuracao_janelas()}
+
+
+# --- FORMATO COMPACTO ---
+
+class FlorestaCompacta:
+    """Random Forest exportado para arrays planos, só com o que o predict usa.
+
+    As árvores viram um único vetor de nós (filhos e feature em int32, limiar
+    em float64, como o sklearn compara) e uma tabela com as probabilidades só
+    das folhas: menos da metade do pickle original. Como são arrays numpy
+    comuns, a carga com mmap_mode='r' mapeia o arquivo em vez de copiar (o
+    Tree do sklearn copia tudo no unpickle), e processos no mesmo servidor
+    dividem as páginas. O predict desce todas as árvores ao mesmo tempo, um
+    nível por iteração, só com os pares (nota, árvore) que ainda não chegaram
+    numa folha: uma nota custa ~profundidade operações vetorizadas em vez de
+    uma chamada ao Cython por árvore.
+    """
+
+    def __init__(self, floresta):
+        filhos, feature, limiar, folha, valores, raizes = [], [], [], [], [], []
+        deslocamento, n_folhas = 0, 0
+        for estimador in floresta.estimators_:
+            arvore = estimador.tree_
+            e_folha = arvore.children_left == -1
+            raizes.append(deslocamento)
+            # [esquerdo, direito] lado a lado: o próximo nó é filhos[2 * nó + (valor > limiar)]
+            pares = np.stack([arvore.children_left, arvore.children_right], axis=1) + deslocamento
+            filhos.append(np.where(e_folha[:, None], -1, pares).ravel())
+            feature.append(np.where(e_folha, 0, arvore.feature))
+            limiar.append(arvore.threshold)
+            indice = np.full(arvore.node_count, -1)
+            indice[e_folha] = np.arange(e_folha.sum()) + n_folhas
+            folha.append(indice)
+            probas = arvore.value[e_folha, 0, :]
+            valores.append(probas / probas.sum(axis=1, keepdims=True))
+            deslocamento += arvore.node_count
+            n_folhas += int(e_folha.sum())
+
+        self.filhos = np.concatenate(filhos).astype(np.int32)
+        self.feature = np.concatenate(feature).astype(np.int32)
+        self.limiar = np.concatenate(limiar).astype(np.float64)
+        self.folha = np.concatenate(folha).astype(np.int32)
+        self.valores = np.concatenate(valores).astype(np.float64)
+        self.raizes = np.asarray(raizes, dtype=np.int32)
+        self.classes_ = floresta.classes_
+        self.n_features_in_ = floresta.n_features_in_
+
+    def predict_proba(self, X):
+        # float32 como o sklearn faz antes de comparar com os limiares
+        X = np.ascontiguousarray(X, dtype=np.float32)
+        n, arvores, dimensao = len(X), len(self.raizes), X.shape[1]
+        X = X.ravel()
+        nos = np.tile(self.raizes, n)
+        base = np.repeat(np.arange(n) * dimensao, arvores)  # Início da linha de cada par em X
+        ativos = np.flatnonzero(self.folha[nos] < 0)
+        while ativos.size:
+            no = nos[ativos]
+            direita = X[base[ativos] + self.feature[no]] > self.limiar[no]
+            proximo = self.filhos[2 * no + direita]
+            nos[ativos] = proximo
+            ativos = ativos[self.folha[proximo] < 0]
+        return self.valores[self.folha[nos]].reshape(n, arvores, -1).mean(axis=1)
+
+    def predict(self, X):
+        return self.classes_[self.predict_proba(X).argmax(axis=1)]
+
+
+def compactar(modelo, formato=None):
+    """(objeto a gravar, formato): florestas viram FlorestaCompacta; o resto vai em joblib comprimido"""
+    from sklearn.ensemble import ExtraTreesClassifier, RandomForestClassifier
+
+    formato = formato or ("compacta" if isinstance(modelo, (RandomForestClassifier, ExtraTreesClassifier))
+                          else "joblib")
+    if formato not in FORMATOS:
+        raise ValueError(f"Formato desconhecido: {formato} (opções: {', '.join(FORMATOS)})")
+    return (FlorestaCompacta(modelo) if formato == "compacta" else modelo), formato
+
+
+# --- VERSÕES ---
+
+def _ler_json(caminho):
+    with open(caminho) as f:
+        return json.load(f)
+
+def _gravar_atomico(caminho, conteudo):
+    temporario = caminho + ".tmp"
+    with open(temporario, "w") as f:
+        f.write(conteudo)
+    os.replace(temporario, caminho)
+
+def listar_versoes(diretorio=DIRETORIO_REGISTRO):
+    if not os.path.isdir(diretorio):
+        return []
+    return sorted(v for v in os.listdir(diretorio)
+                  if v.startswith("v") and os.path.exists(os.path.join(diretorio, v, ARQUIVO_MANIFESTO)))
+
+def versao_ativa(diretorio=DIRETORIO_REGISTRO):
+    try:
+        with open(os.path.join(diretorio, ARQUIVO_ATUAL)) as f:
+            return f.read().strip() or None
+    except FileNotFoundError:
+        return None
+
+def ativar(versao, diretorio=DIRETORIO_REGISTRO):
+    """Aponta o ATUAL para `versao`; processos com ClassificadorRegistrado trocam sozinhos"""
+    if versao not in listar_versoes(diretorio):
+        raise ModeloIndisponivel(f"Versão {versao} não existe em {diretorio}")
+    _gravar_atomico(os.path.join(diretorio, ARQUIVO_ATUAL), versao + "\n")
+
+def ler_manifesto(versao, diretorio=DIRETORIO_REGISTRO):
+    return _ler_json(os.path.join(diretorio, versao, ARQUIVO_MANIFESTO))
+
+def publicar(modelo, features, dados=None, metricas=None, formato=None, ativar_versao=True,
+             diretorio=DIRETORIO_REGISTRO):
+    """Grava uma nova versão (diretório temporário + rename) e, por padrão, ativa. Retorna o manifesto."""
+    import joblib
+
+    os.makedirs(diretorio, exist_ok=True)
+    versoes = listar_versoes(diretorio)
+    versao = f"v{int(versoes[-1][1:]) + 1 if versoes else 1:04d}"
+    temporario = os.path.join(diretorio, f".{versao}.tmp")
+    shutil.rmtree(temporario, ignore_errors=True)
+    os.makedirs(temporario)
+
+    artefato, formato = compactar(modelo, formato)
+    caminho = os.path.join(temporario, ARQUIVO_MODELO)
+    # Sem compressão no formato compacto: é o que permite o mmap na carga
+    joblib.dump(artefato, caminho, compress=COMPRESSAO if formato == "joblib" else 0)
+    manifesto = {"versao": versao, "criado_em": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+                 "tipo": type(modelo).__name__, "formato": formato,
+                 "classes": [int(c) for c in modelo.classes_], "dimensao": int(modelo.n_features_in_),
+                 "arquivo": {"nome": ARQUIVO_MODELO, "sha256": sha256_arquivo(caminho),
+                             "bytes": os.path.getsize(caminho)},
+                 "features": features, "dados": dados or {}, "metricas": metricas or {}}
+    with open(os.path.join(temporario, ARQUIVO_MANIFESTO), "w") as f:
+        json.dump(manifesto, f, indent=2)
+    os.replace(temporario, os.path.join(diretorio, versao))
+    if ativar_versao:
+        ativar(versao, diretorio)
+    return manifesto
+
+def campos_diferentes(features, exigido):
+    """Campos de CAMPOS_VERIFICADOS em que as duas configurações geram vetores diferentes (None = não exigido)"""
+    return [campo for campo in CAMPOS_VERIFICADOS
+            if exigido.get(campo) is not None and features.get(campo) != exigido[campo]]
+
+def verificar(manifesto, exigido):
+    """Levanta ModeloIncompativel se algum campo de CAMPOS_VERIFICADOS diferir (None = não exigido)"""
+    features = manifesto["features"]
+    diferencas = [f"{campo}: treinado com {features.get(campo)!r}, este processo usa {exigido[campo]!r}"
+                  for campo in campos_diferentes(features, exigido)]
+    if diferencas:
+        raise ModeloIncompativel(f"Classificador {manifesto['versao']} incompatível: {'; '.join(diferencas)}")
+    if exigido.get("backend") and features.get("backend") not in (None, exigido["backend"]):
+        print(f"   [AVISO] Classificador {manifesto['versao']} treinado com backend {features['backend']}, "
+              f"inferência em {exigido['backend']}.")
+
+def manifesto_legado():
+    """O .pkl antigo não diz como as features foram geradas: assume o treinar_modelo.py da época"""
+    return {"versao": "legado", "tipo": None, "formato": "pickle", "metricas": {}, "dados": {},
+            "features": {"modelo": NOME_MODELO, "backend": "fp32", "max_length": MAX_LENGTH_LEGADO,
+                         "pooling": "cls", "janelas": ""}}
+
+def carregar(versao=None, exigido=None, diretorio=DIRETORIO_REGISTRO):
+    """(modelo, manifesto) da versão pedida ou da ativa; o formato compacto é mapeado do disco"""
+    import joblib
+
+    versao = versao or versao_ativa(diretorio)
+    if versao is None:
+        if not os.path.exists(CAMINHO_LEGADO):
+            raise ModeloIndisponivel(f"Nenhuma versão em {diretorio}. Rode 'python treinar_modelo.py'.")
+        print(f"   [AVISO] Registro vazio: usando {CAMINHO_LEGADO} sem manifesto "
+              f"(importe com 'python registro_modelos.py importar').")
+        manifesto = manifesto_legado()
+        verificar(manifesto, exigido or {})
+        return joblib.load(CAMINHO_LEGADO), manifesto
+
+    manifesto = ler_manifesto(versao, diretorio)
+    verificar(manifesto, exigido or {})
+    caminho = os.path.join(diretorio, versao, manifesto["arquivo"]["nome"])
+    if os.path.getsize(caminho) != manifesto["arquivo"]["bytes"]:
+        raise ModeloIndisponivel(f"{caminho}: tamanho diferente do manifesto (arquivo corrompido?)")
+    return joblib.load(caminho, mmap_mode="r" if manifesto["formato"] == "compacta" else None), manifesto
+
+
+# --- TROCA A QUENTE ---
+
+class ClassificadorRegistrado:
+    """Classificador da versão ativa, com a interface do sklearn (predict, predict_proba, classes_).
+
+    A cada INTERVALO_VERIFICACAO segundos, o próximo predict confere o ATUAL;
+    se outra versão foi ativada, ela é carregada e substitui a anterior sem
+    reiniciar o processo. Uma versão incompatível com as features deste
+    processo (o MotorEmbeddings já foi montado com um max_length) é recusada
+    e a anterior continua atendendo. A troca acontece só no início de um
+    predict, então classes_ lido logo depois é sempre do mesmo modelo.
+    """
+
+    def __init__(self, exigido=None, diretorio=DIRETORIO_REGISTRO, intervalo=INTERVALO_VERIFICACAO):
+        self.exigido = dict(exigido or configuracao_features())
+        self.diretorio = diretorio
+        self.intervalo = intervalo
+        self.modelo, self.manifesto = carregar(None, self.exigido, diretorio)
+        # O motor de quem chama é montado com este max_length: as próximas versões precisam do mesmo
+        if self.exigido.get("max_length") is None:
+            self.exigido["max_length"] = self.max_length
+        self._trava = threading.Lock()
+        self._verificado_em = time.monotonic()
+        self._recusada = None
+
+    @property
+    def versao(self):
+        return self.manifesto["versao"]
+
+    @property
+    def max_length(self):
+        return self.manifesto["features"]["max_length"]
+
+    @property
+    def classes_(self):
+        return self.modelo.classes_
+
+    def atualizar(self):
+        """Troca para a versão ativa se ela mudou; True se trocou"""
+        versao = versao_ativa(self.diretorio)
+        if versao is None or versao in (self.versao, self._recusada):
+            return False
+        with self._trava:
+            if versao == self.versao:
+                return False
+            try:
+                modelo, manifesto = carregar(versao, self.exigido, self.diretorio)
+            except (ModeloIncompativel, ModeloIndisponivel, OSError, ValueError) as e:
+                print(f"   [AVISO] Versão {versao} recusada, mantendo {self.versao}: {e}")
+                self._recusada = versao
+                contar("registro_recusas")
+                return False
+            self.modelo, self.manifesto = modelo, manifesto
+        print(f">>> Classificador trocado para {versao}.")
+        contar("registro_trocas")
+        return True
+
+    def _conferir(self):
+        agora = time.monotonic()
+        if agora - self._verificado_em >= self.intervalo:
+            self._verificado_em = agora
+            self.atualizar()
+
+    def predict_proba(self, X):
+        self._conferir()
+        return self.modelo.predict_proba(X)
+
+    def predict(self, X):
+        self._conferir()
+        return self.modelo.predict(X)
+
+
+# --- CLI ---
+
+def _resumo(manifesto, ativa):
+    m, f = manifesto.get("metricas", {}), manifesto["features"]
+    qualidade = (f"F1 {m['f1_macro']:.3f}" if "f1_macro" in m
+                 else f"acurácia {m['acuracia'] * 100:.1f}%" if "acuracia" in m else "-")
+    return (f"{'*' if ativa else ' '} {manifesto['versao']}  {manifesto['criado_em']}  {manifesto['tipo']:<24}"
+            f"{manifesto['formato']:<9}{manifesto['arquivo']['bytes'] / 2**20:>7.1f} MB  {qualidade:<16}"
+            f"{f['modelo']} max_length={f['max_length']} pooling={f['pooling']}"
+            + (f" {f['janelas']}" if f.get("janelas") else ""))
+
+def main():
+    parser = argparse.ArgumentParser(description="Registro de versões do classificador de RAM")
+    sub = parser.add_subparsers(dest="comando", required=True)
+    sub.add_parser("listar", help="Versões registradas (* = ativa)")
+    p_ativar = sub.add_parser("ativar", help="Ativa uma versão (processos em execução trocam sozinhos)")
+    p_ativar.add_argument("versao")
+    p_verificar = sub.add_parser("verificar", help="Confere o sha256 do artefato contra o manifesto")
+    p_verificar.add_argument("versao", nargs="?")
+    p_importar = sub.add_parser("importar", help="Registra um .pkl antigo como nova versão")
+    p_importar.add_argument("caminho", nargs="?", default=CAMINHO_LEGADO)
+    p_importar.add_argument("--max-length", type=int, default=MAX_LENGTH_LEGADO,
+                            help="max_length com que as features do .pkl foram geradas")
+    p_importar.add_argument("--formato", choices=FORMATOS)
+    args = parser.parse_args()
+
+    if args.comando == "listar":
+        ativa = versao_ativa()
+        versoes = listar_versoes()
+        if not versoes:
+            print(f">>> Nenhuma versão em {DIRETORIO_REGISTRO}.")
+        for versao in versoes:
+            print(_resumo(ler_manifesto(versao), versao == ativa))
+    elif args.comando == "ativar":
+        ativar(args.versao)
+        print(f"[OK] {args.versao} ativa.")
+    elif args.comando == "verificar":
+        versao = args.versao or versao_ativa()
+        manifesto = ler_manifesto(versao)
+        caminho = os.path.join(DIRETORIO_REGISTRO, versao, manifesto["arquivo"]["nome"])
+        if sha256_arquivo(caminho) == manifesto["arquivo"]["sha256"]:
+            print(f"[OK] {versao}: checksum confere.")
+        else:
+            print(f"[ERRO] {versao}: checksum diferente do manifesto.")
+            raise SystemExit(1)
+    elif args.comando == "importar":
+        import joblib
+        modelo = joblib.load(args.caminho)
+        manifesto = publicar(modelo, configuracao_features(args.max_length, backend="fp32"),
+                             dados={"origem": args.caminho}, formato=args.formato)
+        print(f"[OK] {args.caminho} registrado como {manifesto['versao']} "
+              f"({manifesto['formato']}, {manifesto['arquivo']['bytes'] / 2**20:.1f} MB) e ativado.")
+
+
+if __name__ == "__main__":
+    # Pela importação, não por __main__: senão o pickle grava __main__.FlorestaCompacta
+    # e nenhum outro script consegue carregar o que o 'importar' publicou
+    import registro_modelos
+    registro_modelos.main()
@@ -0,0 +1,177 @@
+import json
+import re
+import unicodedata
+from collections import namedtuple
+
+# --- LÉXICO PADRÃO ---
+# Mesmos gatilhos do classificar_texto original do app.py. Os termos são
+# comparados sem acento e sem caixa, então "internação" também pega "internacao".
+LEXICO_PADRAO = {
+    # Gatilhos de Grau 3/4 (Grave)
+    3: ["internação", "uti", "sepse", "neutropenia febril", "suspensão", "anafilaxia", "grau 3", "grau 4",
+        "insuficiência renal", "creatinina > 2", "oliguria"],
+    # Gatilhos de Grau 1/2 (Leve)
+    1: ["náusea", "vômito", "grau 1", "grau 2", "lefe", "rash", "parestesia", "diarreia"],
+}
+
+# Termos que abrem um escopo de negação ("nega náuseas", "sem sinais de...")
+GATILHOS_NEGACAO = ["nega", "negou", "negam", "sem", "ausencia de", "ausente", "nao apresenta",
+                    "nao refere", "nao relata", "nao ha", "nenhum", "nenhuma", "afastado", "descartado"]
+# O escopo cobre só o que vem logo depois do gatilho: termina na pontuação (vírgula inclusive),
+# numa conjunção adversativa, num verbo que afirma um achado ("nega febre, refere náuseas"),
+# numa preposição de lugar/tempo ("sem intercorrências na UTI") ou após N tokens
+FIM_ESCOPO = {".", ",", ";", ":", "!", "?", "\n", "mas", "porem", "contudo", "entretanto", "exceto",
+              "refere", "referiu", "apresenta", "apresentou", "apresentando", "relata", "relatou",
+              "evolui", "evoluiu", "evoluindo", "queixa", "queixou", "mantem", "manteve",
+              "na", "no", "nas", "nos", "em", "durante"}
+JANELA_NEGACAO = 6
+
+# (nota, grau esperado) de negações que já esconderam toxicidade real; conferidos por conferir_exemplos
+EXEMPLOS_NEGACAO = [
+    ("Nega febre, refere náuseas grau 2.", 1),
+    ("Sem febre, apresentou vômitos e diarreia.", 1),
+    ("Afebril. Sem intercorrências na UTI", 3),
+    ("Nega náuseas e vômitos.", 0),
+    ("Sem sinais de neutropenia febril.", 0),
+]
+
+Ocorrencia = namedtuple("Ocorrencia", ["termo", "grau", "inicio", "fim", "negado"])
+
+
+def _montar_tabela_acentos():
+    """Mapeia cada letra acentuada latina para a letra base (mesmo comprimento do texto)"""
+    tabela = {}
+    for codigo in range(0xC0, 0x250):
+        decomposto = unicodedata.normalize("NFD", chr(codigo))
+        if len(decomposto) > 1 and decomposto[0].isascii():
+            tabela[codigo] = decomposto[0]
+    return tabela
+
+TABELA_ACENTOS = _montar_tabela_acentos()
+
+
+def dobrar(texto):
+    """Remove acentos e caixa preservando as posições dos caracteres"""
+    return texto.translate(TABELA_ACENTOS).lower()
+
+
+def carregar_lexico(caminho):
+    """Lê um léxico JSON no formato {"3": ["termo", ...], "1": [...]}"""
+    with open(caminho, encoding="utf-8") as f:
+        return {int(grau): termos for grau, termos in json.load(f).items()}
+
+
+# Palavras, cada sinal de pontuação isolado ("creatinina > 2") e quebras de linha
+_PADRAO_TOKEN = re.compile(r"\w+|[^\w\s]|\n")
+
+
+def normalizar_termo(termo):
+    """Chave de um termo na árvore: tokens do texto sem acento, separados por espaço"""
+    return " ".join(_PADRAO_TOKEN.findall(dobrar(termo)))
+
+
+def tokenizar(texto):
+    """(tokens sem acento, matches com as posições no texto original)"""
+    achados = list(_PADRAO_TOKEN.finditer(dobrar(texto)))
+    return [m.group() for m in achados], achados
+
+
+def montar_arvore(termos, gatilhos_negacao=GATILHOS_NEGACAO):
+    """Árvore de tokens: primeiro token -> [(tokens seguintes, termo ou None se for negação, valor)].
+
+    `termos` mapeia a chave de normalizar_termo para o valor devolvido na
+    varredura (o grau no MotorRegras, o nome canônico na extração_ram.py).
+    """
+    arvore = {}
+    for termo, valor in termos.items():
+        tokens = termo.split(" ")
+        variantes = [tokens]
+        if tokens[-1].isalpha():
+            # Plural: "nausea" pega "nauseas", "vomito" pega "vomitos"
+            variantes += [tokens[:-1] + [tokens[-1] + "s"], tokens[:-1] + [tokens[-1] + "es"]]
+        for v in variantes:
+            arvore.setdefault(v[0], []).append((v[1:], termo, valor))
+    for gatilho in gatilhos_negacao:
+        tokens = _PADRAO_TOKEN.findall(dobrar(gatilho))
+        arvore.setdefault(tokens[0], []).append((tokens[1:], None, 0))
+    for candidatos in arvore.values():
+        # Mais longos primeiro: "neutropenia febril" ganha de um eventual "neutropenia"
+        candidatos.sort(key=lambda c: len(c[0]), reverse=True)
+    return arvore
+
+
+def varrer(arvore, tokens, janela_negacao=JANELA_NEGACAO):
+    """Gera (índice inicial, nº de tokens, termo, valor, negado) para cada termo da árvore"""
+    escopo = None  # Índice do primeiro token após o último gatilho de negação em vigor
+    i, n = 0, len(tokens)
+    while i < n:
+        candidatos = arvore.get(tokens[i])
+        if candidatos is None:
+            if tokens[i] in FIM_ESCOPO:
+                escopo = None
+            i += 1
+            continue
+        for resto, termo, valor in candidatos:
+            k = len(resto)
+            if not k or tokens[i + 1:i + 1 + k] == resto:
+                if termo is None:
+                    escopo = i + 1 + k
+                else:
+                    yield i, k + 1, termo, valor, escopo is not None and i - escopo < janela_negacao
+                i += k + 1
+                break
+        else:
+            i += 1
+
+
+class MotorRegras:
+    """Léxico CTCAE compilado numa árvore de tokens sobre o texto sem acentos.
+
+    Termos (inclusive os de várias palavras) e gatilhos de negação ficam numa
+    única árvore indexada pelo primeiro token, no espírito do Aho-Corasick:
+    cada nota é tokenizada uma vez e cada token custa uma consulta a dicionário,
+    em vez de uma varredura do texto por termo. Um termo dentro do escopo de
+    um gatilho de negação é reportado com negado=True e não conta para o grau.
+    """
+
+    def __init__(self, lexico=None, gatilhos_negacao=GATILHOS_NEGACAO, janela_negacao=JANELA_NEGACAO):
+        lexico = lexico or LEXICO_PADRAO
+        self.grau_do_termo = {}
+        for grau, termos in lexico.items():
+            for termo in termos:
+                chave = normalizar_termo(termo)
+                # Se um termo aparecer em dois graus, vale o mais grave
+                self.grau_do_termo[chave] = max(grau, self.grau_do_termo.get(chave, grau))
+        self.arvore = montar_arvore(self.grau_do_termo, gatilhos_negacao)
+        self.janela_negacao = janela_negacao
+
+    def _varrer(self, tokens):
+        """Gera (índice inicial, nº de tokens, termo, grau, negado) para cada termo do léxico"""
+        return varrer(self.arvore, tokens, self.janela_negacao)
+
+    def analisar(self, texto):
+        """Lista de Ocorrencia com o termo do léxico, grau, posição no texto e negação"""
+        tokens, achados = tokenizar(texto)
+        return [Ocorrencia(termo, grau, achados[i].start(), achados[i + k - 1].end(), negado)
+                for i, k, termo, grau, negado in self._varrer(tokens)]
+
+    def classificar(self, texto):
+        """Maior grau entre os termos não negados (0 = sem toxicidade aparente)"""
+        return max((grau for _, _, _, grau, negado in self._varrer(_PADRAO_TOKEN.findall(dobrar(texto)))
+                    if not negado), default=0)
+
+    def analisar_lote(self, textos):
+        return [self.analisar(t) for t in textos]
+
+    def classificar_lote(self, textos):
+        """Versão em massa de classificar: tokeniza sem guardar posições"""
+        tokenizar, varrer = _PADRAO_TOKEN.findall, self._varrer
+        return [max((grau for _, _, _, grau, negado in varrer(tokenizar(dobrar(t))) if not negado), default=0)
+                for t in textos]
+
+
+def conferir_exemplos(motor=None, exemplos=EXEMPLOS_NEGACAO):
+    """[(nota, esperado, obtido)] dos exemplos em que o motor erra o grau (vazia = tudo certo)"""
+    motor = motor or MotorRegras()
+    return [(texto, esperado, obtido) for (texto, esperado), obtido
+            in zip(exemplos, motor.classificar_lote([t for t, _ in exemplos])) if obtido != esperado]
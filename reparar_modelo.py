@@ -1,25 +1,51 @@
-from transformers import AutoTokenizer, AutoModel
+import argparse
 import os
+import sys
 
-# Nome do modelo que deu erro
-NOME_MODELO = "pucpr/biobertpt-clin"
+from modelo_local import NOME_MODELO, criar_snapshot, diretorio_snapshot, ler_manifesto, verificar_snapshot
 
-print(f"--- INICIANDO REPARO DO MODELO ---")
-print(f"Detectado arquivo corrompido para: {NOME_MODELO}")
-print("Baixando novamente os arquivos (Isso pode levar alguns minutos)...")
+# Confere o snapshot local pelo sha256 do manifesto e só baixa de novo se algo estiver errado.
 
-try:
-    # 1. Baixa o Tokenizer novamente
-    print("-> Baixando Tokenizer...")
-    tokenizer = AutoTokenizer.from_pretrained(NOME_MODELO, force_download=True)
-    
-    # 2. Baixa o Modelo novamente (O arquivo pesado)
-    print("-> Baixando Modelo (Pesos)...")
-    model = AutoModel.from_pretrained(NOME_MODELO, force_download=True)
-    
-    print("\n✅ SUCESSO! O modelo foi reparado e carregado na memória.")
-    print("Agora você pode rodar o 'streamlit run app.py' que vai funcionar.")
+parser = argparse.ArgumentParser(description="Verifica e, se preciso, refaz o snapshot local do BioBERT")
+parser.add_argument("--modelo", default=NOME_MODELO)
+args = parser.parse_args()
+
+destino = diretorio_snapshot(args.modelo)
+print(f"--- VERIFICANDO MODELO ---")
+print(f"Snapshot: {destino}")
+
+revisao = None
+if os.path.isdir(destino):
+    print("Conferindo checksums (sha256)...")
+    problemas = verificar_snapshot(destino)
+    if not problemas:
+        print("\n✅ Snapshot íntegro. Nada a reparar.")
+        sys.exit(0)
+    for problema in problemas:
+        print(f"   [ERRO] {problema}")
+    try:
+        revisao = ler_manifesto(destino)["revisao"]  # Reconstrói na mesma revisão fixada
+    except (OSError, ValueError, KeyError):
+        pass
+else:
+    print("Snapshot não encontrado.")
 
+print("Baixando novamente os arquivos (Isso pode levar alguns minutos)...")
+try:
+    try:
+        criar_snapshot(args.modelo, destino, revisao)
+    except Exception as e:
+        # O cache do Hugging Face também pode estar corrompido: só aqui força o download
+        print(f"-> Cache local inválido ({e}); forçando novo download...")
+        criar_snapshot(args.modelo, destino, revisao, forcar_download=True)
 except Exception as e:
     print(f"\n❌ Erro durante o reparo: {e}")
-    print("Tente verificar sua conexão com a internet.")
\ No newline at end of file
+    print("Tente verificar sua conexão com a internet.")
+    sys.exit(1)
+
+problemas = verificar_snapshot(destino)
+if problemas:
+    print(f"\n❌ O snapshot continua inválido: {problemas}")
+    sys.exit(1)
+print("\n✅ SUCESSO! O modelo foi reparado e conferido.")
+print("Agora você pode rodar o 'streamlit run app.py' que vai funcionar.")
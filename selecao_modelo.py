@@ -0,0 +1,173 @@
+import os
+import time
+
+import numpy as np
+
+from metricas import cronometro
+
+# --- CONFIGURAÇÃO ---
+# sklearn e joblib são importados dentro das funções, como no treinar_modelo.py
+FOLDS = 5
+WORKERS = -1               # Processos da busca (-1 = todos os núcleos)
+LATENCIA_MAX_MS = 50.0     # p95 do predict_proba de UMA nota (caminho interativo do app.py)
+TOLERANCIA_F1 = 0.01       # Candidatos a até 1 ponto de F1 do melhor empatam: vence o mais rápido
+AMOSTRAS_LATENCIA = 100
+SEMENTE = 42
+
+
+def candidatos():
+    """(nome, estimador) da busca.
+
+    Cada modelo usa um núcleo só (n_jobs=1): o paralelismo fica entre
+    candidatos e folds, sem vários Random Forest disputando os mesmos núcleos.
+    """
+    from sklearn.ensemble import HistGradientBoostingClassifier, RandomForestClassifier
+    from sklearn.linear_model import LogisticRegression
+    from sklearn.pipeline import make_pipeline
+    from sklearn.preprocessing import StandardScaler
+
+    lista = []
+    for arvores in (100, 300):
+        for profundidade in (None, 20):
+            lista.append((f"rf-{arvores}-prof{profundidade or 'livre'}",
+                          RandomForestClassifier(n_estimators=arvores, max_depth=profundidade,
+                                                 n_jobs=1, random_state=SEMENTE)))
+    for c in (0.1, 1.0, 10.0):
+        lista.append((f"lr-C{c}", make_pipeline(StandardScaler(), LogisticRegression(C=c, max_iter=2000))))
+    for taxa in (0.05, 0.1):
+        lista.append((f"gb-taxa{taxa}", HistGradientBoostingClassifier(learning_rate=taxa, max_iter=200,
+                                                                       random_state=SEMENTE)))
+    return lista
+
+
+def _avaliar_fold(indice, estimador, X, y, treino, teste, devolver_modelo):
+    """Roda num worker: ajusta numa partição e prevê a outra (X pode ser o memmap da matriz)"""
+    from sklearn.base import clone
+
+    modelo = clone(estimador)
+    t0 = time.perf_counter()
+    modelo.fit(X[treino], y[treino])
+    ajuste = time.perf_counter() - t0
+    return indice, teste, modelo.predict(X[teste]), ajuste, modelo if devolver_modelo else None
+
+
+def latencia_predict(modelo, X, amostras=AMOSTRAS_LATENCIA):
+    """(p50, p95) em ms do predict_proba de uma nota por vez, como no prever_grau do app.py"""
+    linhas = np.asarray(X[:amostras])
+    modelo.predict_proba(linhas[:1])  # Aquecimento
+    tempos = []
+    for i in range(len(linhas)):
+        t0 = time.perf_counter()
+        modelo.predict_proba(linhas[i:i + 1])
+        tempos.append((time.perf_counter() - t0) * 1000)
+    p50, p95 = np.percentile(tempos, [50, 95])
+    return float(p50), float(p95)
+
+
+def metricas_por_grau(y, previsto):
+    """Acurácia, F1 macro e precisão/revocação de cada grau sobre as previsões fora do fold"""
+    from sklearn.metrics import accuracy_score, f1_score, precision_recall_fscore_support
+
+    graus = np.unique(y)
+    precisao, revocacao, _, suporte = precision_recall_fscore_support(y, previsto, labels=graus, zero_division=0)
+    return {"acuracia": float(accuracy_score(y, previsto)),
+            "f1_macro": float(f1_score(y, previsto, labels=graus, average="macro", zero_division=0)),
+            "por_grau": {int(g): {"precisao": float(p), "revocacao": float(r), "suporte": int(s)}
+                         for g, p, r, s in zip(graus, precisao, revocacao, suporte)}}
+
+
+def escolher(resultados, latencia_max_ms=LATENCIA_MAX_MS, tolerancia_f1=TOLERANCIA_F1):
+    """Melhor F1 entre os que cabem no orçamento de latência; quase-empates vão para o mais rápido"""
+    elegiveis = [r for r in resultados if r["latencia_p95_ms"] <= latencia_max_ms]
+    if not elegiveis:
+        print(f"   [AVISO] Nenhum candidato com p95 <= {latencia_max_ms} ms; escolhendo entre todos.")
+        elegiveis = resultados
+    melhor_f1 = max(r["f1_macro"] for r in elegiveis)
+    return min((r for r in elegiveis if r["f1_macro"] >= melhor_f1 - tolerancia_f1),
+               key=lambda r: r["latencia_p95_ms"])
+
+
+def particionar(y, folds=FOLDS, grupos=None):
+    """[(treino, teste)] do k-fold estratificado; com `grupos`, cada grupo fica inteiro num fold só.
+
+    Os grupos vêm de duplicatas.grupos_quase_copias. Num corpus montado sobre
+    modelos de frase, o k-fold comum põe cópias da mesma nota no treino e no
+    teste: o F1 de todo candidato sobe, e mais para os que decoram o treino.
+    """
+    from sklearn.model_selection import StratifiedGroupKFold, StratifiedKFold
+
+    y = np.asarray(y)
+    if grupos is not None and len(np.unique(grupos)) < folds:
+        print(f"   [AVISO] Só {len(np.unique(grupos))} grupos de quase-cópias para {folds} folds; "
+              f"usando o k-fold estratificado comum.")
+        grupos = None
+    if grupos is None:
+        return list(StratifiedKFold(folds, shuffle=True, random_state=SEMENTE).split(np.zeros(len(y)), y))
+    return list(StratifiedGroupKFold(folds, shuffle=True, random_state=SEMENTE).split(np.zeros(len(y)), y, grupos))
+
+
+def buscar_modelo(X, y, folds=FOLDS, workers=WORKERS, latencia_max_ms=LATENCIA_MAX_MS,
+                  tolerancia_f1=TOLERANCIA_F1, particoes=None):
+    """k-fold estratificado de todos os candidatos em paralelo.
+
+    Devolve (resultados, vencedor, modelo do vencedor ajustado em todos os dados).
+    A latência é medida depois, no processo principal e um candidato por vez,
+    para os workers não disputarem CPU com a medida. `particoes` (de
+    `particionar`) substitui o k-fold estratificado sem grupos.
+    """
+    from joblib import Parallel, delayed
+    from sklearn.base import clone
+
+    y = np.asarray(y)
+    lista = candidatos()
+    particoes = particoes or particionar(y, folds)
+    print(f">>> Busca: {len(lista)} candidatos x {folds} folds em {workers if workers > 0 else os.cpu_count()} processos...")
+    with cronometro("busca_modelos"):
+        saidas = Parallel(n_jobs=workers)(
+            delayed(_avaliar_fold)(i, estimador, X, y, treino, teste, f == 0)
+            for i, (_, estimador) in enumerate(lista) for f, (treino, teste) in enumerate(particoes))
+
+    resultados = []
+    for i, (nome, estimador) in enumerate(lista):
+        previsto = np.empty_like(y)
+        ajustes, modelo_fold0 = [], None
+        for indice, teste, pred, ajuste, modelo in saidas:
+            if indice == i:
+                previsto[teste] = pred
+                ajustes.append(ajuste)
+                modelo_fold0 = modelo or modelo_fold0
+        p50, p95 = latencia_predict(modelo_fold0, X)
+        resultados.append({"nome": nome, "estimador": str(estimador), **metricas_por_grau(y, previsto),
+                           "ajuste_s": float(np.mean(ajustes)), "latencia_p50_ms": p50, "latencia_p95_ms": p95})
+
+    vencedor = escolher(resultados, latencia_max_ms, tolerancia_f1)
+    modelo = clone(dict(lista)[vencedor["nome"]])
+    paralelo = "n_jobs" in modelo.get_params()
+    if paralelo:
+        modelo.set_params(n_jobs=-1)
+    with cronometro("ajuste_classificador"):
+        modelo.fit(X, y)
+    if paralelo:
+        # Um núcleo na inferência: para uma nota só, o pool de threads custa mais do que economiza
+        modelo.set_params(n_jobs=1)
+    return resultados, vencedor, modelo
+
+
+def imprimir_relatorio(resultados, vencedor):
+    print(f"\n{'candidato':<22}{'acurácia':>10}{'F1 macro':>10}{'ajuste s':>10}{'p50 ms':>9}{'p95 ms':>9}")
+    for r in sorted(resultados, key=lambda r: -r["f1_macro"]):
+        marca = "  <- vencedor" if r is vencedor else ""
+        print(f"{r['nome']:<22}{r['acuracia'] * 100:>9.1f}%{r['f1_macro']:>10.3f}{r['ajuste_s']:>10.2f}"
+              f"{r['latencia_p50_ms']:>9.2f}{r['latencia_p95_ms']:>9.2f}{marca}")
+    print(f"\n--- {vencedor['nome']}: precisão/revocação por grau (validação cruzada) ---")
+    for grau, m in vencedor["por_grau"].items():
+        print(f"Grau {grau}: precisão {m['precisao'] * 100:5.1f}%  revocação {m['revocacao'] * 100:5.1f}%  "
+              f"({m['suporte']} notas)")
+
+
+def resumo_busca(vencedor, resultados, folds=FOLDS):
+    """Métricas que vão para o manifesto do registro (ver registro_modelos.publicar)"""
+    return {**vencedor, "folds": folds,
+            "candidatos": [{k: r[k] for k in ("nome", "acuracia", "f1_macro", "ajuste_s",
+                                               "latencia_p50_ms", "latencia_p95_ms")}
+                           for r in resultados]}
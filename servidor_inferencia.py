@@ -0,0 +1,257 @@
+import argparse
+import asyncio
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from motor_embeddings import NOME_MODELO, MotorEmbeddings, carregar_biobert
+from registro_modelos import ClassificadorRegistrado, configuracao_features
+
+# --- CONFIGURAÇÃO ---
+# O classificador é a versão ativa do registro; o max_length do motor vem do manifesto dela
+HOST = "127.0.0.1"
+PORTA = 8765
+MAX_LOTE = 32                # Notas por forward pass
+ESPERA_MAX_MS = 10           # Quanto a primeira nota de um lote espera por companhia
+MAX_FILA = 256               # Notas aguardando; acima disso o servidor responde 503
+MAX_TEXTOS_REQUISICAO = 256
+MAX_CORPO_BYTES = 4 * 1024 * 1024
+
+
+class FilaCheia(Exception):
+    """Mais notas aguardando do que MAX_FILA: o cliente deve tentar de novo depois"""
+
+
+# --- MICRO-LOTES ---
+
+class LoteadorDinamico:
+    """Junta notas de requisições concorrentes num único forward pass.
+
+    Cada nota entra na fila com um Future. O laço pega a primeira nota e
+    espera no máximo `espera_max_ms` por outras, até `max_lote`; o lote roda
+    numa thread separada (o torch solta o GIL), então o event loop continua
+    aceitando conexões enquanto o modelo trabalha. Com a fila cheia,
+    `submeter` falha na hora em vez de deixar a latência crescer sem limite.
+    """
+
+    def __init__(self, processar_lote, max_lote=MAX_LOTE, espera_max_ms=ESPERA_MAX_MS, max_fila=MAX_FILA):
+        self.processar_lote = processar_lote
+        self.max_lote = max_lote
+        self.espera_max = espera_max_ms / 1000
+        self.fila = asyncio.Queue(maxsize=max_fila)
+        # Uma thread só: dois forwards simultâneos disputariam os mesmos núcleos
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="inferencia")
+        self.lotes = 0
+        self.notas = 0
+        self.rejeitadas = 0
+        self._tarefa = None
+
+    def iniciar(self):
+        self._tarefa = asyncio.get_running_loop().create_task(self._laco())
+
+    async def submeter(self, textos):
+        """Enfileira as notas e espera o resultado de cada uma"""
+        if self.fila.maxsize - self.fila.qsize() < len(textos):
+            self.rejeitadas += len(textos)
+            raise FilaCheia()
+        loop = asyncio.get_running_loop()
+        futuros = []
+        for texto in textos:
+            futuro = loop.create_future()
+            self.fila.put_nowait((texto, futuro))
+            futuros.append(futuro)
+        return await asyncio.gather(*futuros)
+
+    async def _coletar_lote(self):
+        loop = asyncio.get_running_loop()
+        lote = [await self.fila.get()]
+        prazo = loop.time() + self.espera_max
+        while len(lote) < self.max_lote:
+            restante = prazo - loop.time()
+            if restante <= 0:
+                break
+            try:
+                lote.append(await asyncio.wait_for(self.fila.get(), restante))
+            except asyncio.TimeoutError:
+                break
+        # Cliente que desistiu (conexão caiu) não gasta forward
+        return [(texto, futuro) for texto, futuro in lote if not futuro.done()]
+
+    async def _laco(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            lote = await self._coletar_lote()
+            if not lote:
+                continue
+            try:
+                resultados = await loop.run_in_executor(self.executor, self.processar_lote,
+                                                        [texto for texto, _ in lote])
+            except Exception as e:
+                for _, futuro in lote:
+                    if not futuro.done():
+                        futuro.set_exception(e)
+                continue
+            for (_, futuro), resultado in zip(lote, resultados):
+                if not futuro.done():
+                    futuro.set_result(resultado)
+            self.lotes += 1
+            self.notas += len(lote)
+
+    def estatisticas(self):
+        return {"fila": self.fila.qsize(), "max_fila": self.fila.maxsize, "lotes": self.lotes,
+                "notas": self.notas, "rejeitadas": self.rejeitadas,
+                "media_por_lote": self.notas / self.lotes if self.lotes else 0.0}
+
+
+def montar_processador(motor, clf):
+    """Função de lote: vetor CLS + grau e confiança do Random Forest para cada nota"""
+    def processar(textos):
+        vetores = motor.gerar(textos)
+        probas = clf.predict_proba(vetores)
+        melhores = probas.argmax(axis=1)
+        graus = clf.classes_[melhores]
+        confiancas = probas[np.arange(len(probas)), melhores]
+        return [(v, int(g), float(c)) for v, g, c in zip(vetores, graus, confiancas)]
+    return processar
+
+
+# --- HTTP ---
+# HTTP/1.1 mínimo sobre asyncio (sem dependências novas): JSON no corpo e keep-alive.
+
+STATUS = {200: "OK", 400: "Bad Request", 404: "Not Found", 413: "Payload Too Large",
+          500: "Internal Server Error", 503: "Service Unavailable"}
+
+
+async def ler_requisicao(reader):
+    """(método, caminho, cabeçalhos, corpo) ou None se o cliente fechou a conexão"""
+    linha = await reader.readline()
+    if not linha:
+        return None
+    metodo, caminho, _ = linha.decode("latin-1").split(" ", 2)
+    cabecalhos = {}
+    while True:
+        linha = await reader.readline()
+        if linha in (b"\r\n", b"\n", b""):
+            break
+        nome, _, valor = linha.decode("latin-1").partition(":")
+        cabecalhos[nome.strip().lower()] = valor.strip()
+    tamanho = int(cabecalhos.get("content-length", 0))
+    if tamanho > MAX_CORPO_BYTES:
+        return metodo, caminho, cabecalhos, None
+    corpo = await reader.readexactly(tamanho) if tamanho else b""
+    return metodo, caminho, cabecalhos, corpo
+
+
+def montar_resposta(status, dados, manter_conexao=True, extras=None):
+    corpo = json.dumps(dados).encode("utf-8")
+    cabecalhos = [f"HTTP/1.1 {status} {STATUS[status]}", "Content-Type: application/json",
+                  f"Content-Length: {len(corpo)}",
+                  f"Connection: {'keep-alive' if manter_conexao else 'close'}"]
+    cabecalhos += [f"{nome}: {valor}" for nome, valor in (extras or {}).items()]
+    return ("\r\n".join(cabecalhos) + "\r\n\r\n").encode("latin-1") + corpo
+
+
+class ServidorInferencia:
+    """Rotas:
+      GET  /saude        estado da fila, tamanho médio dos lotes, versão do classificador e features
+      POST /embedding    {"textos": [...]} -> {"vetores": [[...]], "dimensao": d}
+      POST /classificar  {"textos": [...], "vetores": false} -> {"resultados": [{"grau", "confianca"}]}
+    """
+
+    def __init__(self, motor, clf, max_lote=MAX_LOTE, espera_max_ms=ESPERA_MAX_MS, max_fila=MAX_FILA):
+        self.motor = motor
+        self.clf = clf
+        self.loteador = LoteadorDinamico(montar_processador(motor, clf), max_lote, espera_max_ms, max_fila)
+        self.inicio = time.time()
+
+    async def responder(self, metodo, caminho, corpo):
+        """(status, dados, cabeçalhos extras)"""
+        if metodo == "GET" and caminho == "/saude":
+            return 200, {"status": "ok", "uptime_s": time.time() - self.inicio,
+                         "classificador": getattr(self.clf, "versao", None),
+                         # Como os vetores devolvidos são gerados (o app confere antes de usar o índice vetorial)
+                         "features": configuracao_features(getattr(self.motor, "max_length", None)),
+                         **self.loteador.estatisticas()}, None
+        if metodo != "POST" or caminho not in ("/embedding", "/classificar"):
+            return 404, {"erro": f"rota desconhecida: {metodo} {caminho}"}, None
+        if corpo is None:
+            return 413, {"erro": f"corpo acima de {MAX_CORPO_BYTES} bytes"}, None
+
+        try:
+            pedido = json.loads(corpo or b"{}")
+            textos = pedido["textos"] if "textos" in pedido else [pedido["texto"]]
+            if not all(isinstance(t, str) for t in textos) or len(textos) > MAX_TEXTOS_REQUISICAO:
+                raise ValueError
+        except (ValueError, KeyError, TypeError):
+            return 400, {"erro": f'esperado {{"textos": [até {MAX_TEXTOS_REQUISICAO} strings]}}'}, None
+
+        try:
+            resultados = await self.loteador.submeter(textos)
+        except FilaCheia:
+            return 503, {"erro": "fila cheia, tente novamente"}, {"Retry-After": "1"}
+
+        if caminho == "/embedding":
+            return 200, {"dimensao": self.motor.dimensao,
+                         "vetores": [v.tolist() for v, _, _ in resultados]}, None
+        incluir_vetor = bool(pedido.get("vetores"))
+        return 200, {"resultados": [{"grau": g, "confianca": c, **({"vetor": v.tolist()} if incluir_vetor else {})}
+                                    for v, g, c in resultados]}, None
+
+    async def tratar_conexao(self, reader, writer):
+        try:
+            while True:
+                requisicao = await ler_requisicao(reader)
+                if requisicao is None:
+                    break
+                metodo, caminho, cabecalhos, corpo = requisicao
+                try:
+                    status, dados, extras = await self.responder(metodo, caminho, corpo)
+                except Exception as e:
+                    status, dados, extras = 500, {"erro": str(e)}, None
+                manter = cabecalhos.get("connection", "").lower() != "close" and corpo is not None
+                writer.write(montar_resposta(status, dados, manter, extras))
+                await writer.drain()
+                if not manter:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError, ValueError):
+            pass
+        finally:
+            writer.close()
+
+    async def servir(self, host=HOST, porta=PORTA):
+        self.loteador.iniciar()
+        servidor = await asyncio.start_server(self.tratar_conexao, host, porta, backlog=1024)
+        print(f">>> Servidor de inferência em http://{host}:{porta} "
+              f"(lote até {self.loteador.max_lote}, espera {self.loteador.espera_max * 1000:.0f} ms, "
+              f"fila {self.loteador.fila.maxsize})")
+        async with servidor:
+            await servidor.serve_forever()
+
+
+def carregar_servidor(max_lote=MAX_LOTE, espera_max_ms=ESPERA_MAX_MS, max_fila=MAX_FILA):
+    """Carrega tokenizer, BioBERT e o classificador uma única vez (versões novas trocam a quente)"""
+    print(">>> Carregando BioBERT e classificador...")
+    clf = ClassificadorRegistrado()
+    print(f"   ... classificador {clf.versao} (max_length={clf.max_length})")
+    tokenizer, model = carregar_biobert(NOME_MODELO)
+    motor = MotorEmbeddings(tokenizer, model, max_length=clf.max_length, tamanho_lote=max_lote)
+    motor.gerar(["Aquecimento do modelo."])
+    return ServidorInferencia(motor, clf, max_lote, espera_max_ms, max_fila)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Servidor HTTP local de inferência com micro-lotes dinâmicos")
+    parser.add_argument("--host", default=HOST)
+    parser.add_argument("--porta", type=int, default=PORTA)
+    parser.add_argument("--max-lote", type=int, default=MAX_LOTE)
+    parser.add_argument("--espera-ms", type=float, default=ESPERA_MAX_MS)
+    parser.add_argument("--max-fila", type=int, default=MAX_FILA)
+    args = parser.parse_args()
+
+    servidor = carregar_servidor(args.max_lote, args.espera_ms, args.max_fila)
+    try:
+        asyncio.run(servidor.servir(args.host, args.porta))
+    except KeyboardInterrupt:
+        print("\n>>> Servidor encerrado.")
@@ -0,0 +1,236 @@
+import argparse
+import time
+
+import numpy as np
+import pandas as pd
+
+from esquema_banco import ARQUIVO_DB, conectar, preparar_banco
+from extracao_ram import extrator_padrao
+
+# --- CONFIGURAÇÃO ---
+# Tempo até a primeira toxicidade grave (G3/G4) por paciente, com dados reais:
+#   início    = primeiro prontuário do paciente (data_importacao)
+#   evento    = primeiro prontuário com alerta G3/G4 em alertas_ram
+#   censura   = último prontuário do paciente, para quem não teve evento
+#   estrato   = primeiro medicamento citado nas notas do paciente (extracao_ram.py), com ou sem alerta
+# Sem lifelines: o estimador é vetorizado em NumPy (dá os mesmos números do
+# KaplanMeierFitter, incluindo o intervalo de Greenwood exponencial).
+GRAU_EVENTO = 3
+DIAS_POR_MES = 30.4375
+Z_95 = 1.959963984540054
+MAX_ESTRATOS = 8              # Medicamentos com mais pacientes; o resto vira OUTROS
+SEM_MEDICAMENTO = "Não informado"
+OUTROS = "Outros"
+MARCOS_MESES = (6, 12)        # Sobrevida livre de G3/G4 mostrada na tabela de resumo
+TAMANHO_LOTE = 5000           # Notas lidas por fetchmany na busca da exposição
+
+# data_importacao é texto ISO: MIN/MAX no texto já é a ordem cronológica, e o julianday
+# roda uma vez por paciente, não por prontuário.
+# Uma linha por paciente, só do índice (paciente_hash, data_importacao), sem ler a tabela
+SQL_PACIENTES = """
+SELECT paciente_hash, julianday(MIN(data_importacao)), julianday(MAX(data_importacao))
+FROM prontuarios WHERE paciente_hash IS NOT NULL AND data_importacao IS NOT NULL
+GROUP BY paciente_hash ORDER BY paciente_hash
+"""
+# Só os alertas graves (idx_alertas_gravidade) e o prontuário de cada um pela chave
+SQL_EVENTOS = """
+SELECT p.paciente_hash, julianday(MIN(p.data_importacao))
+FROM alertas_ram a CROSS JOIN prontuarios p ON p.id = a.prontuario_id
+WHERE a.gravidade_ctcae >= ? AND p.paciente_hash IS NOT NULL AND p.data_importacao IS NOT NULL
+GROUP BY p.paciente_hash
+"""
+# A exposição vem de todas as notas, não de alertas_ram: tirada do desfecho, só quem teve
+# alerta ganharia um medicamento e cada estrato teria eventos = pacientes.
+# Ordem do índice (paciente_hash, data_importacao): as notas de cada paciente em sequência cronológica
+SQL_NOTAS = """
+SELECT paciente_hash, texto_clinico
+FROM prontuarios WHERE paciente_hash IS NOT NULL AND data_importacao IS NOT NULL
+ORDER BY paciente_hash, data_importacao
+"""
+
+
+# --- DADOS ---
+
+def versao_dados(conn):
+    """Identifica o estado de prontuarios + alertas_ram sem varrer as tabelas.
+
+    As duas usam AUTOINCREMENT: qualquer inserção muda o MAX(id), que o SQLite
+    lê direto do fim da árvore. UPDATE e DELETE (extracao_ram --preencher, o
+    --reprocessar do pipeline) não mexem nele: esses sobem o contador que os
+    gatilhos da migração 5 mantêm em contador_alteracoes. Serve de chave do
+    cache das curvas.
+    """
+    prontuario, = conn.execute("SELECT MAX(id) FROM prontuarios").fetchone()
+    alerta, = conn.execute("SELECT MAX(id) FROM alertas_ram").fetchone()
+    alteracoes, = conn.execute("SELECT SUM(alteracoes) FROM contador_alteracoes").fetchone()
+    return f"{prontuario or 0}:{alerta or 0}:{alteracoes or 0}"
+
+def localizar(pacientes, chaves):
+    """Posição de cada chave em `pacientes` (ordenado) e a máscara das que estão lá.
+
+    Um paciente pode ter alerta e ficar fora de SQL_PACIENTES (data que o
+    julianday não entende); sem a máscara, o searchsorted o jogaria na posição
+    do vizinho, ou além do fim do vetor.
+    """
+    posicao = np.searchsorted(pacientes, chaves)
+    dentro = posicao < len(pacientes)
+    dentro[dentro] = pacientes[posicao[dentro]] == chaves[dentro]
+    return posicao[dentro], dentro
+
+def medicamentos_pacientes(conn, extrator=None, tamanho_lote=TAMANHO_LOTE):
+    """{paciente_hash: primeiro medicamento citado nas notas do paciente}.
+
+    Depois que um paciente tem medicamento, as notas seguintes dele nem passam
+    pelo extrator.
+    """
+    extrator = extrator or extrator_padrao()
+    medicamentos = {}
+    cursor = conn.execute(SQL_NOTAS)
+    while lote := cursor.fetchmany(tamanho_lote):
+        pendentes = [(paciente, texto) for paciente, texto in lote if paciente not in medicamentos and texto]
+        for (paciente, _), (achados, _) in zip(pendentes, extrator.extrair_lote([t for _, t in pendentes])):
+            if achados:
+                medicamentos.setdefault(paciente, achados[0])
+    return medicamentos
+
+def tempos_ate_evento(conn, grau_evento=GRAU_EVENTO):
+    """DataFrame por paciente: tempo_meses, evento (0/1) e medicamento (estrato)"""
+    # Datas que o julianday não entende viram NULL e o paciente fica de fora
+    linhas = [l for l in conn.execute(SQL_PACIENTES).fetchall() if l[1] is not None and l[2] is not None]
+    if not linhas:
+        return pd.DataFrame({"paciente_hash": [], "tempo_meses": [], "evento": [], "medicamento": []})
+    pacientes, inicio, ultimo = (np.asarray(c) for c in zip(*linhas))
+    inicio, fim = inicio.astype(np.float64), ultimo.astype(np.float64)
+    evento = np.zeros(len(pacientes), dtype=np.int8)
+
+    graves = [l for l in conn.execute(SQL_EVENTOS, (grau_evento,)).fetchall() if l[1] is not None]
+    if graves:
+        # pacientes veio ordenado do GROUP BY: searchsorted faz o "join" em O(n log n)
+        chaves, datas = (np.asarray(c) for c in zip(*graves))
+        posicao, dentro = localizar(pacientes, chaves)
+        fim[posicao] = datas[dentro].astype(np.float64)
+        evento[posicao] = 1
+
+    medicamento = np.full(len(pacientes), SEM_MEDICAMENTO, dtype=object)
+    exposicoes = medicamentos_pacientes(conn)
+    if exposicoes:
+        chaves, nomes = np.array(list(exposicoes), dtype=str), np.array(list(exposicoes.values()), dtype=object)
+        posicao, dentro = localizar(pacientes, chaves)
+        medicamento[posicao] = nomes[dentro]
+
+    return pd.DataFrame({"paciente_hash": pacientes, "tempo_meses": (fim - inicio) / DIAS_POR_MES,
+                         "evento": evento, "medicamento": medicamento})
+
+
+# --- KAPLAN-MEIER ---
+
+def kaplan_meier(tempos, eventos, z=Z_95):
+    """Tabela de vida: tempo, em_risco, eventos, censurados, sobrevida e IC (Greenwood exponencial).
+
+    Uma passada de np.unique + somas acumuladas: O(n log n) no número de
+    pacientes, sem laço em Python. Começa em t=0 com sobrevida 1, como o lifelines.
+    """
+    tempos = np.asarray(tempos, dtype=np.float64)
+    eventos = np.asarray(eventos, dtype=np.float64)
+    unicos, inverso, saidas = np.unique(tempos, return_inverse=True, return_counts=True)
+    mortes = np.bincount(inverso, weights=eventos, minlength=len(unicos))
+    if len(unicos) == 0 or unicos[0] > 0:
+        unicos = np.concatenate(([0.0], unicos))
+        mortes = np.concatenate(([0.0], mortes))
+        saidas = np.concatenate(([0], saidas))
+    em_risco = len(tempos) - np.concatenate(([0], np.cumsum(saidas)[:-1]))
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        sobrevida = np.cumprod(1.0 - mortes / em_risco)
+        # Greenwood no log(-log S): o intervalo fica dentro de [0, 1]
+        soma = np.cumsum(mortes / (em_risco * (em_risco - mortes)))
+        log_s = np.log(sobrevida)
+        desvio = z * np.sqrt(soma) / np.abs(log_s)
+        inferior = np.exp(-np.exp(np.log(-log_s) + desvio))
+        superior = np.exp(-np.exp(np.log(-log_s) - desvio))
+    # Antes do primeiro evento S=1 e o intervalo não existe; com S=0, degenera em 0 (como o lifelines)
+    sem_evento = np.cumsum(mortes) == 0
+    inferior[sem_evento], superior[sem_evento] = 1.0, 1.0
+    zerada = sobrevida == 0
+    inferior[zerada], superior[zerada] = 0.0, 0.0
+
+    return pd.DataFrame({"tempo": unicos, "em_risco": em_risco, "eventos": mortes.astype(np.int64),
+                         "censurados": (saidas - mortes).astype(np.int64), "sobrevida": sobrevida,
+                         "ic_inferior": inferior, "ic_superior": superior})
+
+def mediana(curva):
+    """Primeiro tempo com sobrevida <= 0.5 (inf se a curva não chega lá)"""
+    abaixo = curva["sobrevida"].to_numpy() <= 0.5
+    return float(curva["tempo"].to_numpy()[abaixo.argmax()]) if abaixo.any() else float("inf")
+
+def sobrevida_em(curva, meses):
+    """S(t) da curva em degrau (último ponto com tempo <= meses)"""
+    posicao = np.searchsorted(curva["tempo"].to_numpy(), meses, side="right") - 1
+    return float(curva["sobrevida"].to_numpy()[posicao])
+
+
+# --- CURVAS (GERAL E POR MEDICAMENTO) ---
+
+def agrupar_estratos(medicamento, max_estratos=MAX_ESTRATOS):
+    """Mantém os `max_estratos` medicamentos com mais pacientes; o resto vira OUTROS"""
+    contagem = medicamento[medicamento != SEM_MEDICAMENTO].value_counts()
+    manter = set(contagem.index[:max_estratos]) | {SEM_MEDICAMENTO}
+    return medicamento.where(medicamento.isin(manter), OUTROS)
+
+def calcular_curvas(dados, por_medicamento=False, max_estratos=MAX_ESTRATOS):
+    """(curvas, resumo): curvas em formato longo (coluna estrato) e uma linha de resumo por estrato"""
+    if por_medicamento:
+        estratos = agrupar_estratos(dados["medicamento"], max_estratos)
+    else:
+        estratos = pd.Series("Todos os pacientes", index=dados.index)
+    curvas, resumo = [], []
+    for nome, grupo in dados.groupby(estratos, sort=False):
+        curva = kaplan_meier(grupo["tempo_meses"].to_numpy(), grupo["evento"].to_numpy())
+        curvas.append(curva.assign(estrato=nome))
+        eventos = int(grupo["evento"].sum())
+        resumo.append({"estrato": nome, "pacientes": len(grupo), "eventos": eventos,
+                       "censurados": len(grupo) - eventos, "mediana_meses": mediana(curva),
+                       **{f"livre_{m}m": sobrevida_em(curva, m) for m in MARCOS_MESES}})
+    if not curvas:
+        return pd.DataFrame(), pd.DataFrame()
+    resumo = pd.DataFrame(resumo).sort_values("pacientes", ascending=False, ignore_index=True)
+    return pd.concat(curvas, ignore_index=True), resumo
+
+def consultar_sobrevida(conn, por_medicamento=False):
+    """Tempos do banco + curvas; é o que a aba 2 do app.py guarda em cache por versao_dados"""
+    return calcular_curvas(tempos_ate_evento(conn), por_medicamento)
+
+
+# --- CLI ---
+
+def main():
+    parser = argparse.ArgumentParser(description="Sobrevida livre de toxicidade G3/G4 (Kaplan-Meier)")
+    parser.add_argument("--db", default=ARQUIVO_DB)
+    parser.add_argument("--por-medicamento", action="store_true", help="Uma curva por medicamento")
+    args = parser.parse_args()
+
+    preparar_banco(args.db)
+    conn = conectar(args.db)
+    versao = versao_dados(conn)
+    t0 = time.perf_counter()
+    dados = tempos_ate_evento(conn)
+    consulta = time.perf_counter() - t0
+    t0 = time.perf_counter()
+    _, resumo = calcular_curvas(dados, args.por_medicamento)
+    ajuste = time.perf_counter() - t0
+    conn.close()
+
+    print(f">>> {len(dados)} pacientes (versão dos dados {versao}): "
+          f"consulta {consulta * 1000:.0f} ms, curvas {ajuste * 1000:.0f} ms")
+    if resumo.empty:
+        print("   [AVISO] Nenhum paciente em prontuarios. Rode o biobert_pipeline.py depois de importar notas.")
+        return
+    print(f"\n{'estrato':<24}{'pacientes':>10}{'eventos':>9}{'mediana':>9}"
+          + "".join(f"{f'S({m}m)':>9}" for m in MARCOS_MESES))
+    for r in resumo.itertuples():
+        print(f"{str(r.estrato)[:23]:<24}{r.pacientes:>10}{r.eventos:>9}{r.mediana_meses:>9.1f}"
+              + "".join(f"{getattr(r, f'livre_{m}m') * 100:>8.1f}%" for m in MARCOS_MESES))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,35 +1,30 @@
-import joblib
-import torch
-import numpy as np
-from transformers import AutoTokenizer, AutoModel
-
-# --- CONFIGURAÇÃO ---
-CAMINHO_MODELO = "models/classificador_ram_v1.pkl"
-NOME_BERT = "pucpr/biobertpt-clin"
+from modelo_local import NOME_MODELO as NOME_BERT, medir, resumo_inicializacao
+from registro_modelos import ModeloIndisponivel, carregar
 
 print(">>> Inicializando sistema de Alerta...")
 
-# 1. Carrega o 'Cérebro' treinado
+# 1. Carrega o 'Cérebro' treinado (versão ativa do registro)
 try:
-    clf = joblib.load(CAMINHO_MODELO)
-    print("   [OK] Modelo Random Forest carregado.")
-except:
-    print("   [ERRO] Não encontrei o arquivo em 'models/'. Rode o treino primeiro.")
+    with medir("carga do classificador"):
+        clf, manifesto = carregar()
+    print(f"   [OK] Classificador {manifesto['versao']} carregado.")
+except ModeloIndisponivel:
+    print("   [ERRO] Nenhum classificador em 'models/'. Rode o treino primeiro.")
     exit()
 
 # 2. Carrega o BioBERT (apenas para traduzir o texto, não precisa treinar)
 print("   [OK] Carregando BioBERT (pode levar alguns segundos)...")
-tokenizer = AutoTokenizer.from_pretrained(NOME_BERT)
-model = AutoModel.from_pretrained(NOME_BERT)
+with medir("import torch/transformers"):
+    from motor_embeddings import MotorEmbeddings, carregar_biobert
+tokenizer, model = carregar_biobert(NOME_BERT)
+motor = MotorEmbeddings(tokenizer, model, max_length=manifesto["features"]["max_length"])
+print(f"   [OK] {resumo_inicializacao()}")
 
 def classificar_novo_caso(texto_medico):
     print(f"\nANÁLISE DE NOVO CASO:\n'{texto_medico}'")
     
     # 1. Transforma texto em números (Vetorização)
-    inputs = tokenizer(texto_medico, return_tensors="pt", truncation=True, padding=True, max_length=512)
-    with torch.no_grad():
-        outputs = model(**inputs)
-    vetor = outputs.last_hidden_state[:, 0, :].numpy()[0]
+    vetor = motor.gerar_um(texto_medico)
     
     # 2. A IA faz a previsão
     # O reshape(1, -1) é necessário porque é um caso só
@@ -1,72 +1,163 @@
-import sqlite3
-import pandas as pd
+import argparse
+import os
 import numpy as np
-import torch
-import joblib 
-from transformers import AutoTokenizer, AutoModel
-from sklearn.ensemble import RandomForestClassifier
-from sklearn.metrics import accuracy_score, classification_report
-from sklearn.model_selection import train_test_split
+from modelo_local import BACKEND, NOME_MODELO, configuracao_janelas, medir, resumo_inicializacao
+from cache_embeddings import CacheEmbeddings
+from duplicatas import avisar_vazamento, grupos_quase_copias, textos_dados_treino
+from esquema_banco import ARQUIVO_DB, conectar
+from matriz_embeddings import DIRETORIO_MATRIZES, MatrizEmbeddings, matriz_dados_treino
+from metricas import cronometro, iniciar_exportadores, instrumentar, perfilar
+from registro_modelos import DIRETORIO_REGISTRO, configuracao_features, publicar
+from selecao_modelo import (FOLDS, LATENCIA_MAX_MS, WORKERS, buscar_modelo, imprimir_relatorio,
+                            particionar, resumo_busca)
+# sklearn e torch/transformers são importados só quando usados: com a matriz
+# de embeddings em dia, o BioBERT nem chega a ser carregado
 
 # --- CONFIGURAÇÕES ---
-NOME_MODELO = "pucpr/biobertpt-clin"
-CAMINHO_SALVAR = "models/classificador_ram_v1.pkl"
+# O classificador vai para o registro (models/registro/vNNNN), com o max_length no manifesto
+# Diminuí max_length para 128 para ser mais rápido no treino massivo
+MAX_LENGTH = 128
 
-print(">>> Inicializando BioBERT...")
-tokenizer = AutoTokenizer.from_pretrained(NOME_MODELO)
-model = AutoModel.from_pretrained(NOME_MODELO)
+motor = None
+
+def obter_motor():
+    """Carrega o BioBERT só na primeira vez que algo precisa ser embedado"""
+    global motor
+    if motor is None:
+        print(">>> Inicializando BioBERT...")
+        with medir("import torch/transformers"):
+            from motor_embeddings import MotorEmbeddings, carregar_biobert
+        tokenizer, model = carregar_biobert(NOME_MODELO)
+        # O cache em SQLite evita re-embedar textos que não mudaram desde o último treino
+        motor = CacheEmbeddings(MotorEmbeddings(tokenizer, model, max_length=MAX_LENGTH))
+    return motor
 
 def gerar_embedding(texto):
-    # Diminuí max_length para 128 para ser mais rápido no treino massivo
-    inputs = tokenizer(texto, return_tensors="pt", truncation=True, padding=True, max_length=128)
-    with torch.no_grad():
-        outputs = model(**inputs)
-    return outputs.last_hidden_state[:, 0, :].numpy()[0]
+    return obter_motor().gerar_um(texto)
 
-def treinar():
-    # 1. Busca dados na tabela NOVA (dados_treino)
-    print(">>> Lendo dados gerados sinteticamente...")
-    conn = sqlite3.connect('oncologia_farmacovigilancia.db')
-    
-    # ATENÇÃO: Aqui pegamos da tabela 'dados_treino', não 'prontuarios'
-    df = pd.read_sql("SELECT texto, grau_real FROM dados_treino", conn)
-    conn.close()
+def nome_features():
+    """Mesmo nome que o CacheEmbeddings usa: backend e modo janelas (BIOBERT_JANELA) mudam os vetores"""
+    nome = NOME_MODELO if BACKEND == "fp32" else f"{NOME_MODELO}@{BACKEND}"
+    if configuracao_janelas():
+        nome += f"#{configuracao_janelas()}"
+    return nome
 
-    if len(df) == 0:
+def carregar_matriz():
+    """(X, ids, y) mapeados do disco; None se dados_treino estiver vazia"""
+    with cronometro("matriz_treino"):
+        matriz = matriz_dados_treino(obter_motor, nome_features(), MAX_LENGTH)
+    if matriz is None:
         print("ERRO: Tabela vazia. Rode 'python gerar_sinteticos.py' primeiro.")
-        return
+    elif motor is not None:
+        print(f">>> {motor.resumo()}")
+    return matriz
 
-    print(f">>> Processando {len(df)} exemplos para ensinar a IA... (Isso vai levar uns 20-30 seg)")
-    
-    X = []
-    y = []
+def origem_dados(n_linhas):
+    """Assinatura de dados_treino usada na matriz: o manifesto diz de quais dados o modelo saiu"""
+    meta = MatrizEmbeddings(os.path.join(DIRETORIO_MATRIZES, "dados_treino")).meta or {}
+    return {"tabela": "dados_treino", "linhas": int(n_linhas), "assinatura": meta.get("assinatura")}
 
-    # Gera os vetores para os 200 casos
-    for i, texto in enumerate(df['texto']):
-        if i % 50 == 0: print(f"   ... processado {i} de {len(df)}")
-        X.append(gerar_embedding(texto))
-    
-    X = np.array(X)
-    y = df['grau_real'].values
+def salvar(modelo, n_linhas, metricas):
+    manifesto = publicar(modelo, configuracao_features(MAX_LENGTH), origem_dados(n_linhas), metricas)
+    print(f">>> Modelo salvo no registro como {manifesto['versao']} ({manifesto['formato']}, "
+          f"{manifesto['arquivo']['bytes'] / 2**20:.1f} MB) em {DIRETORIO_REGISTRO} e ativado.")
+
+@instrumentar("treinar")
+def treinar(n_estimators=100, max_depth=None):
+    with medir("import sklearn"):
+        from sklearn.ensemble import RandomForestClassifier
+        from sklearn.metrics import accuracy_score
+        from sklearn.model_selection import train_test_split
+
+    # 1. Busca dados na tabela NOVA (dados_treino)
+    # ATENÇÃO: Aqui pegamos da tabela 'dados_treino', não 'prontuarios'
+    print(">>> Lendo dados gerados sinteticamente...")
 
-    # 2. Separa 20% para prova final
-    X_train, X_test, y_train, y_test = train_test_split(X, y, test_size=0.2, random_state=42)
+    # Os vetores ficam em disco (dados/embeddings): se dados_treino não mudou,
+    # nada é re-embedado e o BioBERT nem é carregado
+    matriz = carregar_matriz()
+    if matriz is None:
+        return
+    X, ids, y = matriz
+
+    # 2. Separa 20% para prova final (por índice; índices ordenados leem o disco em sequência)
+    idx_train, idx_test = train_test_split(np.arange(len(y)), test_size=0.2, random_state=42)
+    idx_train, idx_test = np.sort(idx_train), np.sort(idx_test)
+    y = np.asarray(y)
+    # Corpora montados sobre modelos de frase repetem a mesma nota dos dois lados do split
+    fracao_vazada = avisar_vazamento(ids[idx_train], ids[idx_test])
 
     # 3. Treina o Random Forest
     print(">>> Treinando modelo...")
-    clf = RandomForestClassifier(n_estimators=100, random_state=42)
-    clf.fit(X_train, y_train)
+    clf = RandomForestClassifier(n_estimators=n_estimators, max_depth=max_depth, random_state=42, n_jobs=-1)
+    with cronometro("ajuste_classificador"):
+        clf.fit(X[idx_train], y[idx_train])
 
     # 4. Avalia
-    preds = clf.predict(X_test)
-    acc = accuracy_score(y_test, preds)
+    preds = clf.predict(X[idx_test])
+    acc = accuracy_score(y[idx_test], preds)
     
     print(f"\n--- RESULTADO APÓS DATA AUGMENTATION ---")
     print(f"Acurácia em dados novos: {acc * 100:.1f}%")
     
-    # 5. Salva
-    joblib.dump(clf, CAMINHO_SALVAR)
-    print(f">>> Modelo RE-TREINADO salvo em: {CAMINHO_SALVAR}")
+    # 5. Salva (um só núcleo na inferência, como no selecao_modelo.py)
+    clf.set_params(n_jobs=1)
+    salvar(clf, len(y), {"acuracia": float(acc), "n_estimators": n_estimators, "max_depth": max_depth,
+                         "fracao_teste_vazada": fracao_vazada})
+    print(f">>> Inicialização: {resumo_inicializacao()}")
+
+@instrumentar("treinar_com_busca")
+def treinar_com_busca(folds=FOLDS, workers=WORKERS, latencia_max_ms=LATENCIA_MAX_MS):
+    """k-fold + busca entre Random Forest, regressão logística e gradient boosting (ver selecao_modelo.py).
+
+    Quase-cópias (duplicatas.py) formam grupos que caem inteiros num fold só;
+    a fração de cada fold que ainda tem quase-cópia no treino vai para o manifesto.
+    """
+    matriz = carregar_matriz()
+    if matriz is None:
+        return
+    X, ids, y = matriz
+    y = np.asarray(y)
+
+    print(">>> Agrupando quase-cópias para o k-fold...")
+    conn = conectar(ARQUIVO_DB)
+    lista = textos_dados_treino(conn, ids)
+    conn.close()
+    with cronometro("grupos_quase_copias"):
+        grupos = grupos_quase_copias(lista)
+    n_grupos = len(np.unique(grupos))
+    print(f"   ... {len(y)} notas em {n_grupos} grupos")
+    particoes = particionar(y, folds, grupos)
+    # Com os grupos deve dar zero; o número fica no manifesto de qualquer forma
+    textos, fracoes = dict(zip(ids.tolist(), lista)), []
+    for n, (treino, teste) in enumerate(particoes, 1):
+        print(f"   Fold {n}:")
+        fracoes.append(avisar_vazamento(ids[treino], ids[teste], textos=textos))
+
+    resultados, vencedor, modelo = buscar_modelo(X, y, folds, workers, latencia_max_ms, particoes=particoes)
+    imprimir_relatorio(resultados, vencedor)
+    print()
+    salvar(modelo, len(y), {**resumo_busca(vencedor, resultados, folds),
+                            "validacao": "StratifiedGroupKFold" if n_grupos >= folds else "StratifiedKFold",
+                            "grupos_quase_copias": int(n_grupos),
+                            "fracao_teste_vazada": float(np.mean(fracoes)),
+                            "fracao_teste_vazada_por_fold": [float(f) for f in fracoes]})
+    print(f">>> Inicialização: {resumo_inicializacao()}")
 
 if __name__ == "__main__":
-    treinar()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Treina o Random Forest sobre os embeddings de dados_treino")
+    parser.add_argument("--n-estimators", type=int, default=100)
+    parser.add_argument("--max-depth", type=int)
+    parser.add_argument("--busca", action="store_true",
+                        help="k-fold estratificado (quase-cópias no mesmo fold) + busca de modelo/hiperparâmetros em paralelo")
+    parser.add_argument("--folds", type=int, default=FOLDS)
+    parser.add_argument("--workers", type=int, default=WORKERS, help="Processos da busca (-1 = todos)")
+    parser.add_argument("--latencia-max-ms", type=float, default=LATENCIA_MAX_MS,
+                        help="p95 máximo do predict de uma nota para um candidato ser elegível")
+    args = parser.parse_args()
+    iniciar_exportadores()
+    with perfilar("treinar"):
+        if args.busca:
+            treinar_com_busca(args.folds, args.workers, args.latencia_max_ms)
+        else:
+            treinar(args.n_estimators, args.max_depth)
@@ -0,0 +1,241 @@
+import argparse
+import json
+import os
+
+import joblib
+import numpy as np
+
+from esquema_banco import ARQUIVO_DB, conectar
+from regras_ctcae import MotorRegras, dobrar
+
+# --- CONFIGURAÇÃO ---
+CAMINHO_TFIDF = "models/triagem_tfidf.pkl"
+CAMINHO_REGRAS = "models/triagem_regras.json"   # Confianças calibradas (--calibrar)
+LIMIAR_PADRAO = 0.85   # Confiança mínima do estágio 1 para dispensar o BioBERT
+
+# Confiança de cada situação das regras sem calibração: todas abaixo do LIMIAR_PADRAO, então
+# as regras sozinhas não dispensam o BioBERT até --calibrar medir a acurácia delas num hold-out.
+# (O "grave" das regras é sempre G3: nunca acerta uma nota G4.)
+CONFIANCA_REGRAS = {
+    "grave": 0.80,        # termo G3/G4 afirmado ("internação", "neutropenia febril")
+    "tudo_negado": 0.80,  # só termos negados ("nega náuseas, nega vômitos")
+    "leve": 0.60,         # termo G1/G2 afirmado: o BioBERT separa G1 de G2 e pega o que as regras perdem
+    "sem_termos": 0.50,   # nada no léxico: pode ser rotina ou pode ser um termo que o léxico não cobre
+}
+
+# --- ESTÁGIO 1 ---
+
+class Estagio1Regras:
+    """Decide pelas regras do léxico CTCAE quando o caso é claro"""
+
+    nome = "regras"
+
+    def __init__(self, motor_regras=None, confiancas=CONFIANCA_REGRAS):
+        self.regras = motor_regras or MotorRegras()
+        self.confiancas = confiancas
+
+    def situacoes(self, textos):
+        """(graus, situação de cada nota: chave de CONFIANCA_REGRAS)"""
+        graus = np.zeros(len(textos), dtype=int)
+        situacoes = []
+        for i, ocorrencias in enumerate(self.regras.analisar_lote(textos)):
+            afirmados = [o.grau for o in ocorrencias if not o.negado]
+            graus[i] = max(afirmados, default=0)
+            if graus[i] >= 3:
+                situacoes.append("grave")
+            elif afirmados:
+                situacoes.append("leve")
+            elif ocorrencias:
+                situacoes.append("tudo_negado")
+            else:
+                situacoes.append("sem_termos")
+        return graus, situacoes
+
+    def prever(self, textos):
+        graus, situacoes = self.situacoes(textos)
+        return graus, np.array([self.confiancas[s] for s in situacoes], dtype=float)
+
+    def calibrar(self, textos, graus_reais):
+        """Confiança de cada situação = acerto das regras nela (suavizado de Laplace) em notas rotuladas.
+
+        As regras não aprendem nada com essas notas, mas a acurácia reportada
+        por avaliar_limiares só é honesta se vier de outra parte dos dados.
+        """
+        graus, situacoes = self.situacoes(list(textos))
+        acertos = np.asarray(graus) == np.asarray(graus_reais)
+        situacoes = np.array(situacoes)
+        self.confiancas = {s: float((acertos[situacoes == s].sum() + 1) / ((situacoes == s).sum() + 2))
+                           for s in CONFIANCA_REGRAS}
+        return self
+
+    def salvar(self, caminho=CAMINHO_REGRAS):
+        with open(caminho, "w", encoding="utf-8") as f:
+            json.dump({"confiancas": self.confiancas}, f, indent=2)
+
+    @classmethod
+    def carregar(cls, caminho=CAMINHO_REGRAS):
+        """Com as confianças de --calibrar, se houver; senão, CONFIANCA_REGRAS"""
+        if not os.path.exists(caminho):
+            return cls()
+        with open(caminho, encoding="utf-8") as f:
+            return cls(confiancas={**CONFIANCA_REGRAS, **json.load(f)["confiancas"]})
+
+
+class Estagio1TFIDF:
+    """TF-IDF (uni+bigramas, sem acentos) + regressão logística treinada em dados_treino"""
+
+    nome = "tfidf"
+
+    def __init__(self, pipeline=None):
+        self.pipeline = pipeline
+
+    def treinar(self, textos, graus):
+        from sklearn.feature_extraction.text import TfidfVectorizer
+        from sklearn.linear_model import LogisticRegression
+        from sklearn.pipeline import make_pipeline
+
+        self.pipeline = make_pipeline(
+            TfidfVectorizer(preprocessor=dobrar, ngram_range=(1, 2), sublinear_tf=True),
+            LogisticRegression(max_iter=1000))
+        self.pipeline.fit(list(textos), graus)
+        return self
+
+    def prever(self, textos):
+        probas = self.pipeline.predict_proba(list(textos))
+        melhores = probas.argmax(axis=1)
+        return self.pipeline.classes_[melhores], probas[np.arange(len(probas)), melhores]
+
+    def salvar(self, caminho=CAMINHO_TFIDF):
+        joblib.dump(self.pipeline, caminho)
+
+    @classmethod
+    def carregar(cls, caminho=CAMINHO_TFIDF):
+        return cls(joblib.load(caminho))
+
+
+def carregar_estagio1(tipo=None):
+    """TF-IDF se o modelo já foi treinado (ou se pedido); senão, as regras"""
+    if tipo == "tfidf" or (tipo is None and os.path.exists(CAMINHO_TFIDF)):
+        return Estagio1TFIDF.carregar()
+    return Estagio1Regras.carregar()
+
+# --- CASCATA ---
+
+class TriagemCascata:
+    """Estágio 1 barato decide o que tem confiança >= limiar; o resto vai para BioBERT + Random Forest.
+
+    `motor` e `clf` são os mesmos do pipeline (MotorEmbeddings/CacheEmbeddings
+    e o Random Forest de treinar_modelo.py).
+    """
+
+    def __init__(self, estagio1, motor, clf, limiar=LIMIAR_PADRAO):
+        self.estagio1 = estagio1
+        self.motor = motor
+        self.clf = clf
+        self.limiar = limiar
+        self.total = 0
+        self.enviados_biobert = 0
+
+    def classificar(self, textos):
+        """Retorna (graus, confiancas, usou_biobert) alinhados com `textos`"""
+        from biobert_pipeline import classificar_vetores
+
+        textos = list(textos)
+        graus, confiancas = self.estagio1.prever(textos)
+        graus, confiancas = np.asarray(graus).copy(), np.asarray(confiancas, dtype=float).copy()
+        incertos = np.flatnonzero(confiancas < self.limiar)
+        if len(incertos):
+            vetores = self.motor.gerar([textos[i] for i in incertos])
+            graus[incertos], confiancas[incertos] = classificar_vetores(self.clf, vetores)
+        usou_biobert = np.zeros(len(textos), dtype=bool)
+        usou_biobert[incertos] = True
+
+        self.total += len(textos)
+        self.enviados_biobert += len(incertos)
+        return graus, confiancas, usou_biobert
+
+    def resumo(self):
+        pulados = self.total - self.enviados_biobert
+        fracao = pulados / self.total if self.total else 0.0
+        return (f"Triagem ({self.estagio1.nome}, limiar {self.limiar:.2f}): {pulados} de {self.total} "
+                f"notas dispensaram o BioBERT ({fracao * 100:.1f}%)")
+
+# --- RELATÓRIO DE LIMIARES ---
+
+def ler_dados_treino():
+    conn = conectar(ARQUIVO_DB)
+    linhas = conn.execute("SELECT texto_clinico, grau_real FROM dados_treino").fetchall()
+    conn.close()
+    return [t for t, _ in linhas], np.array([g for _, g in linhas])
+
+
+def separar(graus, test_size=0.2):
+    """(índices de treino, índices de hold-out), estratificado e sempre o mesmo"""
+    from sklearn.model_selection import train_test_split
+
+    return train_test_split(np.arange(len(graus)), test_size=test_size, random_state=42, stratify=graus)
+
+
+def avaliar_limiares(limiares, motor, estagio1_tipo="tfidf", test_size=0.2):
+    """Fração que pula o transformer e acurácia da cascata por limiar, num hold-out estratificado"""
+    from sklearn.ensemble import RandomForestClassifier
+
+    textos, graus = ler_dados_treino()
+    idx_treino, idx_teste = separar(graus, test_size)
+    treino = [textos[i] for i in idx_treino]
+    teste = [textos[i] for i in idx_teste]
+
+    # Os dois estágios são treinados (ou calibrados) só com a parte de treino, para a acurácia não vazar
+    if estagio1_tipo == "tfidf":
+        estagio1 = Estagio1TFIDF().treinar(treino, graus[idx_treino])
+    else:
+        estagio1 = Estagio1Regras().calibrar(treino, graus[idx_treino])
+        print("Confianças das regras (calibradas na parte de treino): "
+              + ", ".join(f"{s} {c:.2f}" for s, c in estagio1.confiancas.items()))
+    X = motor.gerar(textos)
+    clf = RandomForestClassifier(n_estimators=100, random_state=42, n_jobs=-1)
+    clf.fit(X[idx_treino], graus[idx_treino])
+
+    g1, c1 = estagio1.prever(teste)
+    g1 = np.asarray(g1)
+    g2 = clf.predict(X[idx_teste])
+    y = graus[idx_teste]
+
+    print(f"\nHold-out: {len(teste)} notas | estágio 1: {estagio1.nome}")
+    print(f"Só BioBERT + RF: acurácia {np.mean(g2 == y) * 100:.1f}% | "
+          f"só estágio 1: {np.mean(g1 == y) * 100:.1f}%\n")
+    print(f"{'limiar':>7}{'pulam BioBERT':>15}{'acurácia':>10}{'acur. pulados':>15}")
+    for limiar in limiares:
+        pula = c1 >= limiar
+        final = np.where(pula, g1, g2)
+        acc_pulados = np.mean(g1[pula] == y[pula]) * 100 if pula.any() else float("nan")
+        print(f"{limiar:>7.2f}{pula.mean() * 100:>14.1f}%{np.mean(final == y) * 100:>9.1f}%"
+              f"{acc_pulados:>14.1f}%")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Triagem em cascata: treino do estágio 1 e relatório de limiares")
+    parser.add_argument("--treinar", action="store_true", help="Treina e salva o TF-IDF em " + CAMINHO_TFIDF)
+    parser.add_argument("--calibrar", action="store_true",
+                        help="Mede a confiança das regras no hold-out e salva em " + CAMINHO_REGRAS)
+    parser.add_argument("--relatorio", action="store_true", help="Avalia os limiares num hold-out")
+    parser.add_argument("--estagio1", choices=["tfidf", "regras"], default="tfidf")
+    parser.add_argument("--limiares", default="0.5,0.6,0.7,0.8,0.85,0.9,0.95,0.99")
+    args = parser.parse_args()
+
+    if args.treinar:
+        textos, graus = ler_dados_treino()
+        Estagio1TFIDF().treinar(textos, graus).salvar()
+        print(f">>> Estágio 1 (TF-IDF) treinado com {len(textos)} notas e salvo em {CAMINHO_TFIDF}")
+    if args.calibrar:
+        textos, graus = ler_dados_treino()
+        _, idx_teste = separar(graus)
+        regras = Estagio1Regras().calibrar([textos[i] for i in idx_teste], graus[idx_teste])
+        regras.salvar()
+        print(f">>> Regras calibradas em {len(idx_teste)} notas do hold-out e salvas em {CAMINHO_REGRAS}:")
+        for situacao, confianca in regras.confiancas.items():
+            aviso = "dispensa o BioBERT" if confianca >= LIMIAR_PADRAO else "vai para o BioBERT"
+            print(f"   {situacao:<12} {confianca:.2f}  ({aviso} no limiar {LIMIAR_PADRAO:.2f})")
+    if args.relatorio:
+        from treinar_modelo import obter_motor
+        avaliar_limiares([float(x) for x in args.limiares.split(",")], obter_motor(), args.estagio1)